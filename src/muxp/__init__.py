@@ -1,16 +1,40 @@
-from .comm import JSONCodec, Auth
-from .comm.security import Signature
+from .comm import JSONCodec, BinaryCodec, StructCodec, register_codec, Auth, ChunkStream, AsyncChunkStream, Compression, train_dictionary
+from .comm.security import Signature, SignatureSession
 
-from .api._server import Mode, run, logger
-from .api._client import Client, AsyncClient
+from .api._server import Mode, Overload, run, loop_safe, logger
+from .api._metrics import Metrics
+from .api._pubsub import PubSub, SlowConsumer
+from .api._router import Router
+from .api._cache import ResponseCache
+from .api._client import Client, AsyncClient, ServerBusyError
+from .api._pool import ClientPool
+from .api._cluster import AsyncClusterClient
 
 __all__ = [
     'JSONCodec',
+    'BinaryCodec',
+    'StructCodec',
+    'register_codec',
     'Auth',
+    'ChunkStream',
+    'AsyncChunkStream',
+    'Compression',
+    'train_dictionary',
     'Signature',
+    'SignatureSession',
     'Mode',
+    'Overload',
     'run',
+    'loop_safe',
     'logger',
+    'Metrics',
+    'PubSub',
+    'SlowConsumer',
+    'Router',
+    'ResponseCache',
     'Client',
     'AsyncClient',
+    'ServerBusyError',
+    'ClientPool',
+    'AsyncClusterClient',
 ]
\ No newline at end of file
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent import futures
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from ..comm import Frame, FLAG_COMPRESSED
+from ..comm._stream import is_stream_source
+from ._metrics import Metrics
+
+
+class _Abandoned(Exception):
+    """领头的请求没有得到可缓存的响应 (返回了流或被取消), 等待者各自重新计算"""
+
+
+class _Flight:
+    """
+    一次缓存查询的结果: hit 为 True 时 value 即响应;
+    否则调用方是该键的领头请求, 须以 complete/fail/abandon 结束, 同键的并发请求在等待它
+    """
+
+    __slots__ = ("cache", "key", "hit", "value", "future")
+
+    def __init__(self, cache: "ResponseCache", key: Hashable, hit: bool, value: Any = None,
+                 future: Optional[futures.Future] = None):
+        self.cache = cache
+        self.key = key
+        self.hit = hit
+        self.value = value
+        self.future = future
+
+    def complete(self, value: Any):
+        if self.future is not None and not self.future.done():
+            self.cache._finish(self, value)
+
+    def fail(self, exc: BaseException):
+        """处理失败: 等待者收到同一个异常, 不缓存"""
+        if self.future is not None and not self.future.done():
+            self.cache._release(self, exc)
+
+    def abandon(self):
+        if self.future is not None and not self.future.done():
+            self.cache._release(self, _Abandoned())
+
+
+class ResponseCache:
+    """
+    幂等处理函数的响应缓存, 通过 run(cache=...) 放在处理函数之前
+    - 默认以负载的哈希为键 (连接设置了 sig_key 时为解密后的明文, 每次加密的密文都不同), 命中时不再解码与调用处理函数;
+      指定 key 时改为以 key(解码后的请求) 为键, 返回 None 表示该请求不缓存, 命中时只省去处理函数
+    - routes 为 Router 的路由 ID 集合时只缓存这些路由, None 表示缓存所有请求; 键中包含路由 ID
+    - 最多保留 max_entries 条 (LRU), 写入超过 ttl 秒 (None 表示不过期) 的条目视为未命中
+    - 同一个键的并发请求只有第一个调用处理函数, 其余等待它的结果 (处理失败时共享同一个异常, 不缓存)
+    - 流式请求与流式响应不缓存; 缓存的是处理函数的返回值, 多个请求共用同一个对象, 不要修改它
+    线程模型与 asyncio 引擎可以共用, 内部状态由锁保护
+    计数 (写入绑定服务器的 metrics): cache_hits, cache_misses, cache_coalesced (等待了进行中的计算),
+    cache_evictions, cache_expired; gauge cache_entries
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 60.0,
+                 key: Optional[Callable[[Any], Optional[Hashable]]] = None, routes: Optional[Iterable[int]] = None,
+                 metrics: Optional[Metrics] = None):
+        if max_entries <= 0:
+            raise ValueError("max_entries 必须为正数")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl 必须为正数")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.key = key
+        self.routes = frozenset(routes) if routes is not None else None
+        self.metrics = metrics
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # 键 -> (过期时间, 响应)
+        self._inflight: Dict[Hashable, futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, metrics: Metrics):
+        """由服务器在初始化时调用, 没有指定 metrics 时使用服务器的指标"""
+        if self.metrics is None:
+            self.metrics = metrics
+        self.metrics.gauge("cache_entries", self.__len__)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        """丢弃所有缓存的响应 (进行中的计算不受影响)"""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, key: Hashable) -> bool:
+        """丢弃 key (handler 提供的键) 在所有路由下的缓存, 返回是否有条目被丢弃"""
+        with self._lock:
+            stale = [k for k in self._entries if k[1] == key]
+            for k in stale:
+                del self._entries[k]
+        return bool(stale)
+
+    def _inc(self, name: str):
+        if self.metrics is not None:
+            self.metrics.inc(name)
+
+    def _cached(self, route: Optional[int]) -> bool:
+        return self.routes is None or route in self.routes
+
+    def frame_key(self, frame: Frame, payload, codec: Any = None, compressor: Any = None) -> Optional[Hashable]:
+        """按 (解密后的) 负载计算键; 指定了 key 函数或该路由不缓存时返回 None"""
+        if self.key is not None or not self._cached(frame.route):
+            return None
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        # 同样的字节在不同的编解码器/压缩算法下含义不同
+        variant = (codec, repr(compressor) if compressor is not None else None, frame.flags & FLAG_COMPRESSED)
+        return frame.route, digest, variant
+
+    def data_key(self, route: Optional[int], data: Any) -> Optional[Hashable]:
+        """按 key(解码后的请求) 计算键; 没有 key 函数、该路由不缓存或 key 返回 None 时返回 None"""
+        if self.key is None or not self._cached(route):
+            return None
+        key = self.key(data)
+        return None if key is None else (route, key)
+
+    def _lookup(self, key: Hashable) -> Tuple[str, Any]:
+        """返回 ("hit", 响应)、("wait", 进行中的计算) 或 ("lead", 新登记的计算)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._inc("cache_hits")
+                    return "hit", entry[1]
+                del self._entries[key]
+                self._inc("cache_expired")
+            future = self._inflight.get(key)
+            if future is not None:
+                self._inc("cache_coalesced")
+                return "wait", future
+            future = self._inflight[key] = futures.Future()
+            self._inc("cache_misses")
+            return "lead", future
+
+    def claim(self, key: Optional[Hashable]) -> Optional[_Flight]:
+        """线程中调用: 查询缓存, 同键的计算正在进行时阻塞等待它的结果; key 为 None 时返回 None"""
+        if key is None:
+            return None
+        while True:
+            state, value = self._lookup(key)
+            if state == "hit":
+                return _Flight(self, key, True, value)
+            if state == "lead":
+                return _Flight(self, key, False, future=value)
+            try:
+                return _Flight(self, key, True, value.result())
+            except _Abandoned:
+                continue
+
+    async def claim_async(self, key: Optional[Hashable]) -> Optional[_Flight]:
+        """事件循环中调用的 claim, 等待时不阻塞事件循环"""
+        if key is None:
+            return None
+        while True:
+            state, value = self._lookup(key)
+            if state == "hit":
+                return _Flight(self, key, True, value)
+            if state == "lead":
+                return _Flight(self, key, False, future=value)
+            try:
+                # shield: 等待者被取消时不能取消其他请求共享的计算
+                return _Flight(self, key, True, await asyncio.shield(asyncio.wrap_future(value)))
+            except _Abandoned:
+                continue
+
+    def _finish(self, flight: _Flight, value: Any):
+        if is_stream_source(value):
+            self._release(flight, _Abandoned())
+            return
+        with self._lock:
+            self._inflight.pop(flight.key, None)
+            expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+            self._entries[flight.key] = (expires, value)
+            self._entries.move_to_end(flight.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._inc("cache_evictions")
+        flight.future.set_result(value)
+
+    def _release(self, flight: _Flight, exc: BaseException):
+        with self._lock:
+            self._inflight.pop(flight.key, None)
+        flight.future.set_exception(exc)
@@ -1,10 +1,331 @@
 import asyncio
+import inspect
+import logging
+import queue
+import select
 import socket
+import ssl
 import time
 import traceback
 import threading
-from typing import Tuple, Optional, List
-from ..comm import Auth, encode_data, decode_data, ssl_client_context
+from collections import deque
+from concurrent import futures
+from typing import Tuple, Optional, List, Dict, Any, Deque, Callable, Iterable, Sequence
+from ..comm import Auth, Frame, FrameDecoder, ssl_client_context, frame_buffers, sendmsg_all
+from ..comm.security import SignatureSession
+from ..comm import encode_frame, encode_hello, decode_hello, VERSION, FRAME_DATA, FRAME_HELLO, FRAME_CHUNK, FRAME_PING
+from ..comm import FRAME_SUBSCRIBE, FRAME_UNSUBSCRIBE, FRAME_PUBLISH, encode_publish, decode_publish
+from ..comm import FLAG_ERROR, FLAG_END, FLAG_COMPRESSED, FLAG_BUSY, ChunkStream, AsyncChunkStream, DEFAULT_CHUNK_SIZE
+from ..comm import Compression, FrameCompressor, JSONCodec, get_codec
+from ..comm._stream import send_stream, send_stream_async, WriteGate
+from ..comm._codec import resolve_codecs
+from ..comm._tls import get_session, remember_session, pending_session
+from ._metrics import Metrics
+from ._timer import TimerWheel
+
+
+logger = logging.getLogger('mux')
+
+HEARTBEAT = 5.0  # 连接上超过该时长 (秒) 没有收到数据时发送心跳
+_PUBSUB_V2 = "发布/订阅需要 v2 帧头, 请使用 multiplex=True 并连接支持的服务端"
+_ROUTE_V2 = "路由 ID 需要 v2 帧头, 请使用 multiplex=True 并连接支持的服务端"
+
+class ServerBusyError(RuntimeError):
+    """服务端过载 (Overload.BUSY 策略) 未处理该请求, 可以稍后重试"""
+
+
+class _Inflight:
+    """
+    单条连接上在途请求与响应的关联表
+    - 协商了 v2 帧头时按流 ID 匹配, 响应可以乱序到达
+    - 对端为旧协议时按 FIFO 匹配 (服务端按请求顺序逐个响应)
+    同时用于 concurrent.futures.Future 与 asyncio.Future
+    """
+
+    def __init__(self, multiplexed: bool, unseal: Callable[..., bytes] = lambda payload, flags=0: bytes(payload)):
+        self.multiplexed = multiplexed
+        self._unseal = unseal
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._streams: Dict[int, Any] = {}
+        self._fifo: Deque[Any] = deque()
+        self._chunked: Dict[int, Any] = {}  # 正在接收的分块响应流
+
+    def __len__(self) -> int:
+        return len(self._streams) + len(self._fifo)
+
+    def register(self, fut) -> Optional[int]:
+        """登记一个在途请求, 返回发送时使用的流 ID (旧协议返回 None)"""
+        with self._lock:
+            if not self.multiplexed:
+                self._fifo.append(fut)
+                return None
+            while True:
+                # 流 ID 0 保留给控制帧
+                self._next_id = self._next_id % 0xFFFFFFFF + 1
+                if self._next_id not in self._streams:
+                    break
+            self._streams[self._next_id] = fut
+            return self._next_id
+
+    def discard(self, stream_id: Optional[int]):
+        # FIFO 模式下不移除, 已取消的 Future 作为占位保证后续响应对齐
+        if stream_id is not None:
+            with self._lock:
+                self._streams.pop(stream_id, None)
+
+    def resolve(self, frame: Frame) -> bool:
+        """用响应帧完成对应的 Future, 返回 False 表示该帧不属于任何在途请求"""
+        with self._lock:
+            if frame.stream_id is not None:
+                fut = self._streams.pop(frame.stream_id, None)
+                if fut is None:
+                    # 已超时或取消的请求, 丢弃迟到的响应
+                    return frame.stream_id != 0
+            elif not self.multiplexed and self._fifo:
+                fut = self._fifo.popleft()
+            else:
+                return False
+        if frame.flags & FLAG_ERROR:
+            error = ServerBusyError if frame.flags & FLAG_BUSY else RuntimeError
+            _set_future(fut, exc=error(f"服务端处理失败: {bytes(frame.payload).decode('utf-8', 'replace')}"))
+        else:
+            try:
+                _set_future(fut, result=self._unseal(frame.payload, frame.flags))
+            except Exception as e:
+                _set_future(fut, exc=e)
+        return True
+
+    def chunk_stream(self, frame: Frame, factory: Callable[[], Any]):
+        """分块响应: 首块到达时创建流对象并用它完成 Future, 返回该流; 不属于任何在途请求时返回 None"""
+        fut = None
+        with self._lock:
+            stream = self._chunked.get(frame.stream_id)
+            if stream is None:
+                fut = self._streams.pop(frame.stream_id, None)
+                if fut is None:
+                    return None
+                stream = factory()
+                self._chunked[frame.stream_id] = stream
+            if frame.flags & (FLAG_END | FLAG_ERROR):
+                self._chunked.pop(frame.stream_id, None)
+        if fut is not None:
+            _set_future(fut, result=stream)
+        return stream
+
+    def fail_all(self, exc: Exception):
+        with self._lock:
+            pending = list(self._streams.values()) + list(self._fifo)
+            chunked = list(self._chunked.values())
+            self._streams.clear()
+            self._fifo.clear()
+            self._chunked.clear()
+        for fut in pending:
+            _set_future(fut, exc=exc)
+        for stream in chunked:
+            stream.abort(exc)
+
+
+class _Inbox:
+    """
+    AsyncClient 收到的推送消息 (不属于任何在途请求的 DATA 帧)
+    - 有等待者时消息直接交给最早的等待者, 否则排队; 等待者挂在 Future 上, 消息到达即唤醒, 没有轮询
+    - 排队的消息达到 limit 条时暂停从 socket 读取 (TCP 背压), 消费到 limit / 2 以下时恢复;
+      接收循环本身从不阻塞, 已经读入的响应帧照常完成对应的 call
+    - 连接断开后唤醒所有等待者, 已排队的消息仍可取出
+    """
+
+    def __init__(self, limit: int, transport: Optional[asyncio.BaseTransport] = None):
+        self.limit = max(limit, 1)
+        self._transport = transport
+        self._messages: Deque[bytes] = deque()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._paused = False
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def put(self, msg: bytes):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(msg)
+                return
+        self._messages.append(msg)
+        if len(self._messages) >= self.limit and not self._paused and self._transport is not None:
+            self._paused = True
+            self._transport.pause_reading()
+
+    def get_nowait(self) -> Optional[bytes]:
+        if not self._messages:
+            return None
+        msg = self._messages.popleft()
+        if self._paused and len(self._messages) <= self.limit // 2:
+            self._paused = False
+            if not self.closed:
+                self._transport.resume_reading()
+        return msg
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """取出一条消息; 超时或连接已断开且没有排队的消息时返回 None"""
+        if self._messages:
+            return self.get_nowait()
+        if self.closed:
+            return None
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.CancelledError:
+            # 消息已交给本等待者但调用方被取消: 放回队首, 不丢消息
+            if waiter.done() and not waiter.cancelled() and waiter.result() is not None:
+                self._messages.appendleft(waiter.result())
+            raise
+        finally:
+            if waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    def close(self):
+        self.closed = True
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def _open_publish(frame: Frame, unseal: Callable[..., bytes]) -> Optional[Tuple[str, bytes]]:
+    """解析服务端推送的 FRAME_PUBLISH, 返回 (主题, 消息); 格式无效或解密失败时记录日志并返回 None"""
+    try:
+        topic, data = decode_publish(frame.payload)
+        return topic, unseal(data, frame.flags)
+    except ValueError as e:
+        logger.error(f"[!] 推送消息解析失败: {e}")
+        return None
+
+
+def _subscribe_frame(kind: int, topic: str) -> Callable[[int], bytes]:
+    name = topic.encode('utf-8')
+    if not name:
+        raise ValueError("主题名不能为空")
+    return lambda stream_id: encode_frame(name, stream_id, kind)
+
+
+def _chunk_error(frame: Frame) -> Exception:
+    return RuntimeError(f"服务端处理失败: {bytes(frame.payload).decode('utf-8', 'replace')}")
+
+
+def _hello_options(compression: Optional[Compression], codecs: Optional[List[str]]) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"version": VERSION}
+    if compression is not None:
+        options.update(compression.offer())
+    if codecs is not None:
+        options["codecs"] = codecs
+    return options
+
+
+def _select_codec(options: Dict[str, Any], codecs: Optional[List[str]]) -> Any:
+    """按服务端 HELLO 应答选择编解码器, 服务端未参与协商时为 JSONCodec"""
+    name = options.get("codec")
+    if codecs is None or name not in codecs:
+        return JSONCodec
+    return get_codec(name)
+
+
+def _inflate(data: bytes, flags: int, compressor: Optional[FrameCompressor]) -> bytes:
+    if not flags & FLAG_COMPRESSED:
+        return data
+    if compressor is None:
+        raise ValueError("连接未协商压缩, 却收到了压缩帧")
+    return compressor.decompress(data)
+
+
+def _set_future(fut, result=None, exc: Optional[Exception] = None):
+    if fut.done():
+        return
+    try:
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+    except (futures.InvalidStateError, asyncio.InvalidStateError):
+        # 与取消并发时可能出现, 忽略即可
+        pass
+
+
+def _close_sock(sock: Optional[socket.socket]):
+    if sock is None:
+        return
+    try:
+        # 先 shutdown 以唤醒阻塞在 recv 上的读线程
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    try: sock.close()
+    except: pass
+
+
+def _heartbeat_interval(options: Optional[Dict[str, Any]], heartbeat: Optional[float]) -> Optional[float]:
+    """按服务端 HELLO 应答确定心跳间隔: 服务端不支持心跳时为 None, 不超过服务端空闲超时的三分之一"""
+    if not heartbeat or not options or not options.get("ping"):
+        return None
+    idle_timeout = options.get("idle_timeout")
+    return min(heartbeat, idle_timeout / 3) if idle_timeout else heartbeat
+
+
+class _Keepalive:
+    """进程内所有同步客户端共用的心跳线程, 由一个时间轮调度, 没有需要心跳的连接时不唤醒"""
+
+    tick = 0.25
+
+    def __init__(self):
+        self._wheel = TimerWheel(self.tick)
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def schedule(self, client: "Client", delay: float):
+        self._wheel.schedule(client, delay)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="muxp-keepalive", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def discard(self, client: "Client"):
+        self._wheel.discard(client)
+
+    def _run(self):
+        wheel = self._wheel
+        while True:
+            if not len(wheel):
+                self._wakeup.wait()
+            self._wakeup.clear()
+            time.sleep(max(wheel.next_expiry() - time.monotonic(), 0))
+            now = time.monotonic()
+            for client in wheel.advance(now):
+                try:
+                    delay = client._beat(now)
+                except Exception:
+                    traceback.print_exc()
+                    continue
+                if delay is not None:
+                    wheel.schedule(client, delay)
+
+
+_keepalive = _Keepalive()
+
+
+def _resumption_rate(metrics: Metrics) -> float:
+    counters = metrics.counters()
+    handshakes = counters.get("tls_handshakes", 0)
+    return counters.get("tls_resumed", 0) / handshakes if handshakes else 0.0
+
 
 class Client:
     def __init__(self,
@@ -13,37 +334,211 @@ class Client:
                  timeout: float = 10.0,
                  auto_reconnect: bool = True,
                  max_reconnect_attempts: int = 3,
-                 reconnect_delay: float = 1.0):
+                 reconnect_delay: float = 1.0,
+                 multiplex: bool = False,
+                 hello_timeout: float = 2.0,
+                 sig_key: Optional[str] = None,
+                 compression: Optional[Compression] = None,
+                 codecs: Optional[Sequence[str]] = None,
+                 metrics: Optional[Metrics] = None,
+                 tls_resume: bool = True,
+                 heartbeat: Optional[float] = HEARTBEAT,
+                 heartbeat_timeout: Optional[float] = None):
         self.address = address
         self.auth = auth
+        self.sig_key = sig_key
+        self.compression = compression
+        self.codecs = resolve_codecs(codecs)
+        self.codec: Any = JSONCodec  # 协商出的编解码器, 未协商时为 JSONCodec
         self.timeout = timeout
         self.auto_reconnect = auto_reconnect
         self.max_reconnect_attempts = max_reconnect_attempts
         self.reconnect_delay = reconnect_delay
+        self.multiplex = multiplex
+        self.hello_timeout = hello_timeout
+        self.protocol_version = 1
         self.context = ssl_client_context(auth)
+        # 重连时恢复上次的 TLS 会话 (同一进程内连接同一地址的客户端共享), 省去证书交换与校验
+        self.tls_resume = tls_resume
+        self._tls_pending = False  # 当前连接的可恢复会话尚未保存
+        # 心跳: 协商了 v2 帧头且服务端支持时, 连接上 heartbeat 秒没有收到数据就发送 PING,
+        # PING 之后 heartbeat_timeout (默认为 timeout) 秒仍没有收到任何数据则认为连接已断开
+        self.heartbeat = heartbeat
+        self.heartbeat_timeout = heartbeat_timeout if heartbeat_timeout is not None else timeout
+        self._interval: Optional[float] = None  # 当前连接的心跳间隔, None 表示不发送心跳
+        self._last_recv = 0.0
+        self._ping_at: Optional[float] = None
         self.sock: Optional[socket.socket] = None
-        self.buffer = b""
+        self._decoder = FrameDecoder()
         self._connect_lock = threading.Lock()
+        self._send_lock = threading.RLock()
         self._last_connect_time = 0
         self._min_reconnect_interval = 1.0
+        self._legacy_peer = False
+        self._inflight = _Inflight(False)
+        self._inbox: "queue.Queue[bytes]" = queue.Queue()
+        # 订阅的主题 -> 回调 (None 表示消息放入收件箱供 recv 读取), 重连后自动重新订阅
+        self._subscriptions: Dict[str, Optional[Callable[[str, bytes], Any]]] = {}
+        self._reader: Optional[threading.Thread] = None
+        self._use_reader = False
+        self._session: Optional[SignatureSession] = None
+        self._compressor: Optional[FrameCompressor] = None
+        # 计数: connects, requests, frames_in/out, bytes_in/out, errors, tls_handshakes, tls_resumed,
+        # pings, heartbeat_timeouts; 延迟: call (call() 发出到响应到达), tls_handshake; 仪表: tls_resumption_rate
+        self.metrics = metrics if metrics is not None else Metrics()
+        if auth:
+            self.metrics.gauge("tls_resumption_rate", lambda: _resumption_rate(self.metrics))
         self.connect()
 
+    def stats(self) -> Dict[str, Any]:
+        """当前指标快照: counters 与 call 延迟的分位数 (毫秒)"""
+        return self.metrics.snapshot()
+
+    def _sent(self, out: bytes, frames: int = 1):
+        self.metrics.inc("frames_out", frames)
+        self.metrics.inc("bytes_out", len(out))
+
+    def _seal(self, data: bytes) -> bytes:
+        """设置了 sig_key 时对每帧负载透明加密"""
+        return self._session.encrypt(data) if self._session else data
+
+    def _unseal(self, payload, flags: int = 0) -> bytes:
+        data = bytes(payload)
+        if self._session:
+            data = self._session.decrypt(data)
+        return _inflate(data, flags, self._compressor)
+
+    def _pack(self, data: bytes) -> Tuple[bytes, int]:
+        """v2 帧的请求负载: 协商了压缩时先压缩再加密, 返回 (负载, 帧标志)"""
+        data, flags = self._compressor.compress(data) if self._compressor else (data, 0)
+        return self._seal(data), flags
+
+    def healthy(self) -> bool:
+        """
+        非阻塞地检查连接是否仍然可用: 空闲连接可读时读取一次, 只有对端关闭 (EOF) 或出错才视为不可用
+        TLS 1.3 的服务端在握手后发送会话票据, 读取时由 ssl 模块处理, 不会产生应用数据;
+        读到的应用数据留在解码器中, 由之后的 recv 取走
+        """
+        sock = self.sock
+        if sock is None:
+            return False
+        if self._use_reader:
+            # 后台读线程在连接断开时会把 sock 置空
+            return True
+        if len(self._decoder):
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        if not readable:
+            return True
+        timeout = sock.gettimeout()
+        try:
+            sock.setblocking(False)
+            return self._decoder.recv_into(sock) > 0
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return True
+        except (OSError, ValueError):
+            return False
+        finally:
+            try:
+                sock.settimeout(timeout)
+            except OSError:
+                pass
+
+    def _open(self) -> socket.socket:
+        raw_sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock = raw_sock
+        if self.auth:
+            session = get_session(self.context, self.address) if self.tls_resume else None
+            start = time.perf_counter()
+            try:
+                sock = self.context.wrap_socket(raw_sock, server_hostname=self.address[0], session=session)
+            except Exception:
+                _close_sock(raw_sock)
+                raise
+            self.metrics.observe("tls_handshake", time.perf_counter() - start)
+            self.metrics.inc("tls_handshakes")
+            if sock.session_reused:
+                self.metrics.inc("tls_resumed")
+            self._tls_pending = self.tls_resume
+            self._save_tls_session(sock)
+        sock.settimeout(self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _save_tls_session(self, sock: Optional[socket.socket]):
+        """TLS 1.3 的会话票据在握手之后随应用数据到达, 在读到数据之后与关闭连接之前各尝试保存一次"""
+        if self._tls_pending and sock is not None and remember_session(self.context, self.address, sock):
+            self._tls_pending = False
+
+    def _negotiate(self, sock: socket.socket, decoder: FrameDecoder) -> Optional[Dict[str, Any]]:
+        """发送 HELLO 并等待服务端的 HELLO, 对端不支持 v2 帧头时返回 None"""
+        sock.sendall(encode_hello(_hello_options(self.compression, self.codecs)))
+        sock.settimeout(self.hello_timeout)
+        try:
+            while decoder.recv_into(sock):
+                for frame in decoder.frames():
+                    return decode_hello(frame.payload) if frame.kind == FRAME_HELLO else None
+            return None
+        except (socket.timeout, OSError):
+            return None
+        finally:
+            sock.settimeout(self.timeout)
+
     def connect(self):
         with self._connect_lock:
             current_time = time.time()
             if current_time - self._last_connect_time < self._min_reconnect_interval:
                 time.sleep(self._min_reconnect_interval - (current_time - self._last_connect_time))
             if self.sock:
-                try: self.sock.close()
-                except: pass
+                self._save_tls_session(self.sock)
+                self._drop_sock(self.sock)
                 self.sock = None
+            self._inflight.fail_all(ConnectionError("连接已重置"))
             try:
-                raw_sock = socket.create_connection(self.address, timeout=self.timeout)
-                self.sock = raw_sock if not self.auth else self.context.wrap_socket(raw_sock, server_hostname=self.address[0])
-                self.sock.settimeout(self.timeout)
-                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock = self._open()
+                decoder = FrameDecoder()
+                version = 1
+                compressor = None
+                codec = JSONCodec
+                options = None
+                if self.multiplex and not self._legacy_peer:
+                    options = self._negotiate(sock, decoder)
+                    self._save_tls_session(sock)
+                    if options is not None:
+                        version = VERSION
+                        compressor = self.compression.select(options) if self.compression else None
+                        codec = _select_codec(options, self.codecs)
+                    else:
+                        # 旧版服务端会把 HELLO 当作未完成的帧挂起, 换一条连接回退到旧协议
+                        logger.info(f"[*] 服务端 {self.address} 不支持 v2 帧头, 使用旧协议")
+                        _close_sock(sock)
+                        self._legacy_peer = True
+                        sock = self._open()
+                        decoder = FrameDecoder()
+                self.sock = sock
+                self._decoder = decoder
+                self.protocol_version = version
+                self._compressor = compressor
+                self.codec = codec
+                # 每条连接一个会话, PBKDF2 只在会话开始时运行一次
+                self._session = SignatureSession(self.sig_key) if self.sig_key else None
+                self._inflight = _Inflight(version >= VERSION, self._unseal)
                 self._last_connect_time = time.time()
-                self.buffer = b""
+                self.metrics.inc("connects")
+                self._interval = _heartbeat_interval(options, self.heartbeat)
+                self._last_recv = time.monotonic()
+                self._ping_at = None
+                if self._interval is not None:
+                    # 心跳的应答由读线程接收
+                    self._use_reader = True
+                    _keepalive.schedule(self, self._interval)
+                if self._use_reader:
+                    self._start_reader()
+                if self._subscriptions and version >= VERSION:
+                    self._resubscribe()
             except Exception as e:
                 self.sock = None
                 raise ConnectionError(f"连接失败: {e}")
@@ -65,91 +560,438 @@ class Client:
 
     def _ensure_connected(self):
         if not self.sock:
-            self._reconnect_with_retry()
+            with self._send_lock:
+                if not self.sock:
+                    self._reconnect_with_retry()
         return True
 
+    def _drop_sock(self, sock: socket.socket):
+        """
+        读线程仍在读 sock 时只 shutdown, 由读线程退出时关闭;
+        否则 fd 立即被新连接复用, 旧线程里的 SSL 读取会吞掉新连接的握手数据
+        """
+        reader = self._reader
+        if reader is not None and reader.is_alive() and reader is not threading.current_thread():
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        else:
+            _close_sock(sock)
+
+    def _start_reader(self):
+        self._reader = threading.Thread(
+            target=self._reader_loop,
+            args=(self.sock, self._decoder, self._inflight),
+            name=f"muxp-reader-{self.address[0]}:{self.address[1]}",
+            daemon=True,
+        )
+        self._reader.start()
+
+    def _reader_loop(self, sock: socket.socket, decoder: FrameDecoder, inflight: _Inflight):
+        """后台读线程: 完成 call() 返回的 Future, 其余消息放入收件箱供 recv() 读取"""
+        try:
+            while True:
+                try:
+                    n = decoder.recv_into(sock)
+                    if not n:
+                        break
+                except socket.timeout:
+                    continue
+                self._last_recv = time.monotonic()
+                self.metrics.inc("bytes_in", n)
+                if self._tls_pending:
+                    self._save_tls_session(sock)
+                for frame in decoder.frames():
+                    self.metrics.inc("frames_in")
+                    if frame.kind == FRAME_CHUNK:
+                        stream = inflight.chunk_stream(frame, lambda: ChunkStream(unseal=self._unseal))
+                        if stream is None:
+                            continue
+                        if frame.flags & FLAG_ERROR:
+                            stream.abort(_chunk_error(frame))
+                        elif len(frame.payload):
+                            # 调用方读取过慢时阻塞读线程, 通过 TCP 对服务端形成背压
+                            stream.put(bytes(frame.payload))
+                        if frame.flags & FLAG_END:
+                            stream.end()
+                        continue
+                    if frame.kind == FRAME_PUBLISH:
+                        self._on_publish(frame)
+                        continue
+                    if frame.kind != FRAME_DATA:
+                        continue
+                    if inflight.resolve(frame):
+                        continue
+                    try:
+                        self._inbox.put(self._unseal(frame.payload, frame.flags))
+                    except ValueError as e:
+                        logger.error(f"[!] 消息解密失败: {e}")
+        except (OSError, ValueError):
+            pass
+        finally:
+            inflight.fail_all(ConnectionError("连接已断开"))
+            with self._connect_lock:
+                if self.sock is sock:
+                    self._save_tls_session(sock)
+                    self.sock = None
+            _close_sock(sock)
+
+    def _on_publish(self, frame: Frame):
+        opened = _open_publish(frame, self._unseal)
+        if opened is None or opened[0] not in self._subscriptions:
+            # 已退订的主题: 退订确认之前仍可能收到推送
+            return
+        topic, msg = opened
+        callback = self._subscriptions.get(topic)
+        if callback is None:
+            self._inbox.put(msg)
+            return
+        try:
+            callback(topic, msg)
+        except Exception:
+            traceback.print_exc()
+
+    def _beat(self, now: float) -> Optional[float]:
+        """由心跳线程调用: 必要时发送 PING 或判定连接已断开, 返回下次检查的延迟 (None 表示停止)"""
+        sock = self.sock
+        interval = self._interval
+        if sock is None or interval is None:
+            # 重连后由 connect 重新登记
+            return None
+        silent = now - self._last_recv
+        if silent < interval:
+            return interval - silent
+        ping_at = self._ping_at
+        if ping_at is not None and ping_at >= self._last_recv:
+            waited = now - ping_at
+            if waited < self.heartbeat_timeout:
+                return self.heartbeat_timeout - waited
+            self.metrics.inc("heartbeat_timeouts")
+            logger.warning(f"[!] {self.address} 心跳超时 ({silent:.1f} 秒没有收到数据), 断开连接")
+            with self._send_lock:
+                if self.sock is sock:
+                    self._drop_sock(sock)
+                    self.sock = None
+            return None
+        # 正在发送的线程持有锁时这一轮跳过, 不阻塞心跳线程
+        if not self._send_lock.acquire(blocking=False):
+            return interval
+        try:
+            if self.sock is not sock:
+                return None
+            out = encode_frame(b"", 0, FRAME_PING)
+            sock.sendall(out)
+            self._sent(out)
+        except OSError:
+            return None
+        finally:
+            self._send_lock.release()
+        self._ping_at = now
+        self.metrics.inc("pings")
+        return min(interval, self.heartbeat_timeout)
+    
+    def call(self, data: bytes, route: Optional[int] = None) -> futures.Future:
+        """
+        发送请求并返回 Future, 响应由后台读线程完成, 可在多线程中并发调用
+        协商了 v2 帧头时同一连接上可以有大量在途请求; 对端为旧协议时按顺序匹配响应
+        route: 服务端 Router 的路由 ID, 放在帧头中由服务端在解码负载之前分派 (需要 v2 帧头)
+        """
+        start = time.perf_counter()
+        fut: futures.Future = futures.Future()
+        with self._send_lock:
+            self._ensure_connected()
+            if route is not None and not self._inflight.multiplexed:
+                raise ConnectionError(_ROUTE_V2)
+            if not self._use_reader:
+                self._use_reader = True
+                self._start_reader()
+            inflight = self._inflight
+            # 先加密/压缩再登记: 出错时 Future 不会留在在途表中 (旧协议下还会错位后续响应)
+            if inflight.multiplexed:
+                payload, flags = self._pack(data)
+            else:
+                out = encode_frame(self._seal(data))
+            self._track(fut, start)
+            stream_id = inflight.register(fut)
+            try:
+                if stream_id is not None:
+                    out = encode_frame(payload, stream_id, flags=flags, route=route)
+                self.sock.sendall(out)
+                self._sent(out)
+            except (socket.error, OSError) as e:
+                inflight.discard(stream_id)
+                _set_future(fut, exc=ConnectionError(f"发送失败: {e}"))
+                self._drop_sock(self.sock)
+                self.sock = None
+                return fut
+            except Exception as e:
+                inflight.discard(stream_id)
+                _set_future(fut, exc=e)
+                raise
+        if stream_id is not None:
+            fut.add_done_callback(lambda f: f.cancelled() and inflight.discard(stream_id))
+        return fut
+
+    def _control(self, build: Callable[[int], bytes]) -> futures.Future:
+        """发送订阅或发布帧, 返回服务端确认的 Future; build 按流 ID 生成完整的帧"""
+        fut: futures.Future = futures.Future()
+        with self._send_lock:
+            self._ensure_connected()
+            if not self._inflight.multiplexed:
+                raise ConnectionError(_PUBSUB_V2)
+            if not self._use_reader:
+                self._use_reader = True
+                self._start_reader()
+            inflight = self._inflight
+            stream_id = inflight.register(fut)
+            try:
+                out = build(stream_id)
+                self.sock.sendall(out)
+                self._sent(out)
+            except (socket.error, OSError) as e:
+                inflight.discard(stream_id)
+                _set_future(fut, exc=ConnectionError(f"发送失败: {e}"))
+                self._drop_sock(self.sock)
+                self.sock = None
+            except Exception:
+                inflight.discard(stream_id)
+                raise
+        return fut
+
+    def _resubscribe(self):
+        """重连后重新订阅, 不等待确认 (在 connect 中调用, 读线程已启动)"""
+        inflight = self._inflight
+        for topic in list(self._subscriptions):
+            stream_id = inflight.register(futures.Future())
+            out = encode_frame(topic.encode('utf-8'), stream_id, FRAME_SUBSCRIBE)
+            self.sock.sendall(out)
+            self._sent(out)
+
+    def subscribe(self, topic: str, callback: Optional[Callable[[str, bytes], Any]] = None):
+        """
+        订阅主题并等待服务端确认
+        callback(topic, msg) 在读线程中调用, 应尽快返回; 不设置时推送的消息放入收件箱, 由 recv/recv_all 读取
+        连接断开后, 下一次调用 (包括 recv) 重连时自动重新订阅
+        """
+        build = _subscribe_frame(FRAME_SUBSCRIBE, topic)
+        self._subscriptions[topic] = callback
+        try:
+            self._control(build).result(self.timeout)
+        except BaseException:
+            self._subscriptions.pop(topic, None)
+            raise
+
+    def unsubscribe(self, topic: str):
+        build = _subscribe_frame(FRAME_UNSUBSCRIBE, topic)
+        self._subscriptions.pop(topic, None)
+        self._control(build).result(self.timeout)
+
+    def publish(self, topic: str, data: bytes) -> int:
+        """向主题发布消息 (经服务端推送给所有订阅者, 包括本连接), 返回接受推送的订阅者数"""
+        def build(stream_id: int) -> bytes:
+            payload, flags = self._pack(data)
+            return encode_publish(topic, payload, stream_id, flags)
+        return int(self._control(build).result(self.timeout))
+
+    def _track(self, fut: futures.Future, start: float):
+        metrics = self.metrics
+        metrics.inc("requests")
+
+        def done(f: futures.Future):
+            if f.cancelled() or f.exception() is not None:
+                metrics.inc("errors")
+            else:
+                metrics.observe("call", time.perf_counter() - start)
+
+        fut.add_done_callback(done)
+
+    def call_stream(self, source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> futures.Future:
+        """
+        以分块流发送 source (bytes、二进制文件对象或 bytes 可迭代对象) 并返回响应的 Future
+        - 调用线程逐块发送, 内存占用与 source 大小无关; 纯 TCP 且未加密时文件通过 sendfile 发送
+        - 其他请求的帧可以穿插在分块之间
+        - 服务端以分块流响应时 Future 的结果为 ChunkStream (需读完或 close), 否则为 bytes
+        - 需要服务端支持 v2 帧头 (multiplex=True)
+        """
+        fut: futures.Future = futures.Future()
+        with self._send_lock:
+            self._ensure_connected()
+            if not self._inflight.multiplexed:
+                raise ConnectionError("分块流需要 v2 帧头, 请使用 multiplex=True 并连接支持的服务端")
+            if not self._use_reader:
+                self._use_reader = True
+                self._start_reader()
+            inflight = self._inflight
+            sock = self.sock
+            stream_id = inflight.register(fut)
+        try:
+            send_stream(sock, self._send_lock, stream_id, source, chunk_size,
+                        self._seal if self._session else None)
+        except ConnectionError as e:
+            inflight.discard(stream_id)
+            _set_future(fut, exc=e)
+            with self._send_lock:
+                if self.sock is sock:
+                    self._drop_sock(sock)
+                    self.sock = None
+        except Exception:
+            # source 读取失败, 已通知服务端中止该流
+            inflight.discard(stream_id)
+            raise
+        return fut
+
     def send(self, data: bytes):
         if not self._ensure_connected(): raise ConnectionError("无法建立连接")
-        encoded = encode_data(data)
-        for attempt in range(self.max_reconnect_attempts + 1):
+        with self._send_lock:
+            for attempt in range(self.max_reconnect_attempts + 1):
+                try:
+                    if attempt > 0: self._reconnect_with_retry()
+                    out = encode_frame(self._seal(data))
+                    self.sock.sendall(out)
+                    self._sent(out)
+                    return
+                except (socket.error, ConnectionError, OSError, BrokenPipeError) as e:
+                    if attempt < self.max_reconnect_attempts and self.auto_reconnect: continue
+                    else: raise ConnectionError(f"发送失败: {e}")
+
+    def send_many(self, payloads: Iterable[bytes]) -> int:
+        """
+        批量发送多条消息: 帧头与负载分别作为独立缓冲, 通过 sendmsg 一次系统调用发出 (TLS 下拼接后一次发送)
+        返回发送的消息数; 批量发送可能已部分写出, 失败时不自动重发
+        """
+        if not self._ensure_connected(): raise ConnectionError("无法建立连接")
+        payloads = [self._seal(data) for data in payloads]
+        if not payloads:
+            return 0
+        with self._send_lock:
             try:
-                if attempt > 0: self._reconnect_with_retry()
-                self.sock.sendall(encoded)
-                return
-            except (socket.error, ConnectionError, OSError, BrokenPipeError) as e:
-                if attempt < self.max_reconnect_attempts and self.auto_reconnect: continue
-                else: raise ConnectionError(f"发送失败: {e}")
+                sendmsg_all(self.sock, frame_buffers(payloads))
+            except (socket.error, OSError) as e:
+                raise ConnectionError(f"发送失败: {e}")
+        self.metrics.inc("frames_out", len(payloads))
+        self.metrics.inc("bytes_out", sum(len(p) for p in payloads))
+        return len(payloads)
 
     def recv(self, timeout: Optional[float] = None) -> Optional[bytes]:
         if not self._ensure_connected(): return None
+        if self._use_reader:
+            try:
+                return self._inbox.get(timeout=timeout if timeout is not None else self.timeout)
+            except queue.Empty:
+                return None
         original_timeout = self.sock.gettimeout()
         try:
             if timeout is not None: self.sock.settimeout(timeout)
             while True:
+                # 先消费缓冲中已完整的帧, 一次只取一帧, 其余留待下次 recv
+                for frame in self._decoder.frames():
+                    if frame.kind == FRAME_DATA:
+                        return self._unseal(frame.payload, frame.flags)
                 try:
-                    chunk = self.sock.recv(4096)
-                    if not chunk:
+                    if not self._decoder.recv_into(self.sock):
                         if self.auto_reconnect:
                             self._reconnect_with_retry()
                             continue
                         return None
-                    self.buffer += chunk
-                    msgs, self.buffer = decode_data(self.buffer)
-                    if msgs: return msgs[0]
                 except socket.timeout: return None
         finally:
-            if timeout is not None: self.sock.settimeout(original_timeout)
+            if timeout is not None and self.sock: self.sock.settimeout(original_timeout)
 
     def recv_all(self, timeout: Optional[float] = None) -> List[bytes]:
         if not self._ensure_connected(): return []
         messages = []
+        if self._use_reader:
+            try:
+                messages.append(self._inbox.get(timeout=timeout if timeout is not None else self.timeout))
+                while True:
+                    messages.append(self._inbox.get_nowait())
+            except queue.Empty:
+                pass
+            return messages
         original_timeout = self.sock.gettimeout()
         try:
             if timeout is not None: self.sock.settimeout(timeout)
-            msgs, self.buffer = decode_data(self.buffer)
-            messages.extend(msgs)
+            messages.extend(self._unseal(f.payload, f.flags) for f in self._decoder.frames() if f.kind == FRAME_DATA)
             try:
-                chunk = self.sock.recv(4096)
-                if chunk:
-                    self.buffer += chunk
-                    msgs, self.buffer = decode_data(self.buffer)
-                    messages.extend(msgs)
+                if self._decoder.recv_into(self.sock):
+                    messages.extend(self._unseal(f.payload, f.flags) for f in self._decoder.frames() if f.kind == FRAME_DATA)
             except socket.timeout: pass
         finally:
             if timeout is not None: self.sock.settimeout(original_timeout)
         return messages
 
     def close(self):
+        self._use_reader = False
+        self._interval = None
+        self._subscriptions.clear()
+        _keepalive.discard(self)
         if self.sock:
-            try: self.sock.close()
-            except: pass
+            self._save_tls_session(self.sock)
+            try: self._drop_sock(self.sock)
             finally:
                 self.sock = None
-                self.buffer = b""
+                self._decoder = FrameDecoder()
+        self._inflight.fail_all(ConnectionError("客户端已关闭"))
 
     def __enter__(self): return self
     def __exit__(self, exc_type, exc_val, exc_tb): self.close()
 
 
 class AsyncClient:
-    """异步客户端，可选 TLS/纯 TCP"""
+    """
+    异步客户端，可选 TLS/纯 TCP
+    服务端推送的消息用 recv / recv_many 或 async for msg in client 读取; 未读取的消息达到 inbox_size 条时
+    暂停从 socket 读取, 由 TCP 对服务端形成背压 (此时同一连接上的响应也会等待)
+    """
     
     def __init__(self, address: Tuple[str, int], auth: Optional[Auth] = None,
-                 timeout: float = 10.0, auto_reconnect: bool = False, max_reconnect_attempts: int = 3):
+                 timeout: float = 10.0, auto_reconnect: bool = False, max_reconnect_attempts: int = 3,
+                 multiplex: bool = False, hello_timeout: float = 2.0, sig_key: Optional[str] = None,
+                 compression: Optional[Compression] = None, codecs: Optional[Sequence[str]] = None,
+                 metrics: Optional[Metrics] = None, tls_resume: bool = True,
+                 heartbeat: Optional[float] = HEARTBEAT, heartbeat_timeout: Optional[float] = None,
+                 inbox_size: int = 1000):
         self.address = address
+        self.sig_key = sig_key
+        self.compression = compression
+        self.codecs = resolve_codecs(codecs)
+        self.codec: Any = JSONCodec  # 协商出的编解码器, 未协商时为 JSONCodec
         self.timeout = timeout
         self.auto_reconnect = auto_reconnect
         self.max_reconnect_attempts = max_reconnect_attempts
+        self.multiplex = multiplex
+        self.hello_timeout = hello_timeout
+        self.protocol_version = 1
         self.ssl_ctx = ssl_client_context(auth) if auth else None
+        self.tls_resume = tls_resume
+        self._tls_pending = False
+        # 心跳同 Client, 由事件循环的定时回调发送, 接收循环不再周期性地超时唤醒
+        self.heartbeat = heartbeat
+        self.heartbeat_timeout = heartbeat_timeout if heartbeat_timeout is not None else timeout
+        self._interval: Optional[float] = None
+        self._last_recv = 0.0
+        self._ping_at: Optional[float] = None
+        self._beat_handle: Optional[asyncio.TimerHandle] = None
+        self._legacy_peer = False
+        self._inflight = _Inflight(False)
+        self._session: Optional[SignatureSession] = None
+        self._compressor: Optional[FrameCompressor] = None
+        # 与 Client 相同的计数、call 与 tls_handshake 延迟以及 tls_resumption_rate
+        self.metrics = metrics if metrics is not None else Metrics()
+        if auth:
+            self.metrics.gauge("tls_resumption_rate", lambda: _resumption_rate(self.metrics))
         
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
-        self.buffer = b""
-        self._msg_queue: Optional[asyncio.Queue] = None
+        self._gate: Optional[WriteGate] = None
+        self._decoder = FrameDecoder()
+        self.inbox_size = inbox_size
+        self._inbox: Optional[_Inbox] = None
+        self._subscriptions: Dict[str, Optional[Callable[[str, bytes], Any]]] = {}  # 同 Client
         self._recv_task: Optional[asyncio.Task] = None
         self._connected = False
         self._connect_lock = asyncio.Lock()
-        self._recv_event = asyncio.Event()
     
     async def connect(self):
         async with self._connect_lock:
@@ -163,76 +1005,378 @@ class AsyncClient:
                         delay = min(1.0 * (2 ** attempt), 10.0)
                         await asyncio.sleep(delay)
                     
-                    self.reader, self.writer = await asyncio.wait_for(
-                        asyncio.open_connection(
-                            self.address[0],
-                            self.address[1],
-                            ssl=self.ssl_ctx,
-                            server_hostname=self.address[0] if self.ssl_ctx else None
-                        ),
-                        timeout=self.timeout
-                    )
+                    self.reader, self.writer = await self._open()
+                    self._decoder = FrameDecoder()
+                    version = 1
+                    compressor = None
+                    codec = JSONCodec
+                    options = None
+                    if self.multiplex and not self._legacy_peer:
+                        options = await self._negotiate()
+                        self._save_tls_session(self.writer)
+                        if options is not None:
+                            version = VERSION
+                            compressor = self.compression.select(options) if self.compression else None
+                            codec = _select_codec(options, self.codecs)
+                        else:
+                            # 旧版服务端会把 HELLO 当作未完成的帧挂起, 换一条连接回退到旧协议
+                            logger.info(f"[*] 服务端 {self.address} 不支持 v2 帧头, 使用旧协议")
+                            self.writer.close()
+                            self._legacy_peer = True
+                            self.reader, self.writer = await self._open()
+                            self._decoder = FrameDecoder()
+                    self.protocol_version = version
+                    self._compressor = compressor
+                    self.codec = codec
+                    # 每条连接一个会话, PBKDF2 只在会话开始时运行一次
+                    self._session = SignatureSession(self.sig_key) if self.sig_key else None
+                    self._inflight = _Inflight(version >= VERSION, self._unseal)
+                    self._gate = WriteGate(self.writer)
+                    self.metrics.inc("connects")
                     
-                    self._msg_queue = asyncio.Queue(maxsize=1000)
-                    self._recv_event.clear()
+                    self._inbox = _Inbox(self.inbox_size, self.writer.transport)
                     self._connected = True
                     self._recv_task = asyncio.create_task(self._recv_loop())
+                    if self._subscriptions and version >= VERSION:
+                        # 重连后重新订阅, 不等待确认
+                        for topic in self._subscriptions:
+                            stream_id = self._inflight.register(asyncio.get_running_loop().create_future())
+                            self._write(encode_frame(topic.encode('utf-8'), stream_id, FRAME_SUBSCRIBE))
+                    self._interval = _heartbeat_interval(options, self.heartbeat)
+                    self._last_recv = time.monotonic()
+                    self._ping_at = None
+                    if self._interval is not None:
+                        self._schedule_beat(self._interval)
                     return
                 except Exception as e:
                     last_error = e
             raise ConnectionError(f"异步连接失败 ({self.max_reconnect_attempts} 次尝试): {last_error}")
     
+    def stats(self) -> Dict[str, Any]:
+        """当前指标快照: counters 与 call 延迟的分位数 (毫秒)"""
+        return self.metrics.snapshot()
+    
+    def _schedule_beat(self, delay: float):
+        self._beat_handle = asyncio.get_running_loop().call_later(delay, self._beat)
+    
+    def _beat(self):
+        """同 Client._beat, 在事件循环中运行"""
+        self._beat_handle = None
+        interval = self._interval
+        if not self._connected or interval is None or self.writer is None:
+            return
+        now = time.monotonic()
+        silent = now - self._last_recv
+        if silent < interval:
+            self._schedule_beat(interval - silent)
+            return
+        if self._ping_at is not None and self._ping_at >= self._last_recv:
+            waited = now - self._ping_at
+            if waited < self.heartbeat_timeout:
+                self._schedule_beat(self.heartbeat_timeout - waited)
+                return
+            self.metrics.inc("heartbeat_timeouts")
+            logger.warning(f"[!] {self.address} 心跳超时 ({silent:.1f} 秒没有收到数据), 断开连接")
+            # 接收循环随之结束, 在途请求得到 ConnectionError, 下次调用时重连
+            self.writer.transport.abort()
+            return
+        self._write(encode_frame(b"", 0, FRAME_PING))
+        self._ping_at = now
+        self.metrics.inc("pings")
+        self._schedule_beat(min(interval, self.heartbeat_timeout))
+    
+    def _write(self, out: bytes):
+        self._gate.write(out)
+        self.metrics.inc("frames_out")
+        self.metrics.inc("bytes_out", len(out))
+    
+    def _seal(self, data: bytes) -> bytes:
+        """设置了 sig_key 时对每帧负载透明加密"""
+        return self._session.encrypt(data) if self._session else data
+    
+    def _unseal(self, payload, flags: int = 0) -> bytes:
+        data = bytes(payload)
+        if self._session:
+            data = self._session.decrypt(data)
+        return _inflate(data, flags, self._compressor)
+    
+    def _pack(self, data: bytes) -> Tuple[bytes, int]:
+        """v2 帧的请求负载: 协商了压缩时先压缩再加密, 返回 (负载, 帧标志)"""
+        data, flags = self._compressor.compress(data) if self._compressor else (data, 0)
+        return self._seal(data), flags
+    
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        token = None
+        if self.ssl_ctx and self.tls_resume:
+            token = pending_session.set(get_session(self.ssl_ctx, self.address))
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    self.address[0],
+                    self.address[1],
+                    ssl=self.ssl_ctx,
+                    server_hostname=self.address[0] if self.ssl_ctx else None
+                ),
+                timeout=self.timeout
+            )
+        finally:
+            if token is not None:
+                pending_session.reset(token)
+        if self.ssl_ctx:
+            self.metrics.observe("tls_handshake", time.perf_counter() - start)
+            self.metrics.inc("tls_handshakes")
+            ssl_obj = writer.get_extra_info("ssl_object")
+            if ssl_obj is not None and ssl_obj.session_reused:
+                self.metrics.inc("tls_resumed")
+            self._tls_pending = self.tls_resume
+            self._save_tls_session(writer)
+        return reader, writer
+    
+    def _save_tls_session(self, writer: Optional[asyncio.StreamWriter]):
+        """同 Client._save_tls_session"""
+        if self._tls_pending and writer is not None:
+            ssl_obj = writer.get_extra_info("ssl_object")
+            if ssl_obj is not None and remember_session(self.ssl_ctx, self.address, ssl_obj):
+                self._tls_pending = False
+    
+    async def _negotiate(self) -> Optional[Dict[str, Any]]:
+        """发送 HELLO 并等待服务端的 HELLO, 对端不支持 v2 帧头时返回 None"""
+        self.writer.write(encode_hello(_hello_options(self.compression, self.codecs)))
+        await self.writer.drain()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.hello_timeout
+        try:
+            while True:
+                chunk = await asyncio.wait_for(self.reader.read(self._decoder.read_size()),
+                                               timeout=max(deadline - loop.time(), 0))
+                if not chunk:
+                    return None
+                self._decoder.feed(chunk)
+                for frame in self._decoder.frames():
+                    return decode_hello(frame.payload) if frame.kind == FRAME_HELLO else None
+        except (asyncio.TimeoutError, OSError):
+            return None
+    
     async def _ensure_connected(self):
         if not self._connected or (self._recv_task and self._recv_task.done()):
             await self.connect()
         return True
     
     async def _recv_loop(self):
+        inbox = self._inbox
         try:
             while self._connected and self.reader:
                 try:
-                    chunk = await asyncio.wait_for(self.reader.read(4096), timeout=self.timeout)
+                    chunk = await self.reader.read(self._decoder.read_size())
                     if not chunk:
                         break
-                    self.buffer += chunk
-                    msgs, self.buffer = decode_data(self.buffer)
-                    for msg in msgs:
-                        await self._msg_queue.put(msg)
-                        self._recv_event.set()
-                except asyncio.TimeoutError:
-                    continue
+                    self._last_recv = time.monotonic()
+                    self.metrics.inc("bytes_in", len(chunk))
+                    if self._tls_pending:
+                        self._save_tls_session(self.writer)
+                    self._decoder.feed(chunk)
+                    for frame in self._decoder.frames():
+                        self.metrics.inc("frames_in")
+                        if frame.kind == FRAME_CHUNK:
+                            await self._on_chunk(frame)
+                            continue
+                        if frame.kind == FRAME_PUBLISH:
+                            self._on_publish(frame, inbox)
+                            continue
+                        if frame.kind != FRAME_DATA or self._inflight.resolve(frame):
+                            continue
+                        try:
+                            msg = self._unseal(frame.payload, frame.flags)
+                        except ValueError as e:
+                            logger.error(f"[!] 消息解密失败: {e}")
+                            continue
+                        inbox.put(msg)
                 except Exception:
                     traceback.print_exc()
                     break
         finally:
             self._connected = False
+            self._inflight.fail_all(ConnectionError("连接已断开"))
+            inbox.close()
+    
+    def _on_publish(self, frame: Frame, inbox: _Inbox):
+        opened = _open_publish(frame, self._unseal)
+        if opened is None or opened[0] not in self._subscriptions:
+            return
+        topic, msg = opened
+        callback = self._subscriptions.get(topic)
+        if callback is None:
+            inbox.put(msg)
+            return
+        try:
+            result = callback(topic, msg)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception:
+            traceback.print_exc()
+    
+    async def _on_chunk(self, frame: Frame):
+        stream = self._inflight.chunk_stream(frame, lambda: AsyncChunkStream(unseal=self._unseal))
+        if stream is None:
+            return
+        if frame.flags & FLAG_ERROR:
+            stream.abort(_chunk_error(frame))
+        elif len(frame.payload):
+            # 调用方读取过慢时挂起接收循环, 通过 TCP 对服务端形成背压
+            await stream.put(bytes(frame.payload))
+        if frame.flags & FLAG_END:
+            await stream.end()
+    
+    async def call(self, data: bytes, timeout: Optional[float] = None, route: Optional[int] = None) -> bytes:
+        """
+        发送请求并等待对应的响应, 多个协程可并发调用并共享同一连接
+        协商了 v2 帧头时响应按流 ID 匹配; 对端为旧协议时按顺序匹配
+        timeout 为 None 时使用客户端的 timeout, 超时抛出 asyncio.TimeoutError
+        route: 服务端 Router 的路由 ID (需要 v2 帧头)
+        """
+        await self._ensure_connected()
+        if route is not None and not self._inflight.multiplexed:
+            raise ConnectionError(_ROUTE_V2)
+        start = time.perf_counter()
+        inflight = self._inflight
+        if inflight.multiplexed:
+            payload, flags = self._pack(data)
+        else:
+            out = encode_frame(self._seal(data))
+        self.metrics.inc("requests")
+        fut = asyncio.get_running_loop().create_future()
+        stream_id = inflight.register(fut)
+        try:
+            if stream_id is not None:
+                out = encode_frame(payload, stream_id, flags=flags, route=route)
+            self._write(out)
+            await self.writer.drain()
+            resp = await asyncio.wait_for(fut, timeout if timeout is not None else self.timeout)
+        except BaseException:
+            self.metrics.inc("errors")
+            raise
+        finally:
+            inflight.discard(stream_id)
+        self.metrics.observe("call", time.perf_counter() - start)
+        return resp
+    
+    async def call_stream(self, source, chunk_size: int = DEFAULT_CHUNK_SIZE, timeout: Optional[float] = None):
+        """
+        以分块流发送 source (bytes、二进制文件对象、bytes 可迭代或异步可迭代对象) 并等待响应
+        - 纯 TCP 且未加密时文件通过 loop.sendfile 发送, 其余情况逐块写出并 drain
+        - 服务端以分块流响应时返回 AsyncChunkStream (需读完或 close), 否则返回 bytes
+        - 需要服务端支持 v2 帧头 (multiplex=True); timeout 只计算发送完成后等待响应的时间
+        """
+        await self._ensure_connected()
+        inflight = self._inflight
+        if not inflight.multiplexed:
+            raise ConnectionError("分块流需要 v2 帧头, 请使用 multiplex=True 并连接支持的服务端")
+        fut = asyncio.get_running_loop().create_future()
+        stream_id = inflight.register(fut)
+        try:
+            await send_stream_async(self._gate, stream_id, source, chunk_size, self._seal if self._session else None)
+            return await asyncio.wait_for(fut, timeout if timeout is not None else self.timeout)
+        finally:
+            inflight.discard(stream_id)
+    
+    async def _control(self, build: Callable[[int], bytes], timeout: Optional[float]) -> bytes:
+        """发送订阅或发布帧并等待服务端确认, build 按流 ID 生成完整的帧"""
+        await self._ensure_connected()
+        inflight = self._inflight
+        if not inflight.multiplexed:
+            raise ConnectionError(_PUBSUB_V2)
+        fut = asyncio.get_running_loop().create_future()
+        stream_id = inflight.register(fut)
+        try:
+            self._write(build(stream_id))
+            await self.writer.drain()
+            return await asyncio.wait_for(fut, timeout if timeout is not None else self.timeout)
+        finally:
+            inflight.discard(stream_id)
+    
+    async def subscribe(self, topic: str, callback: Optional[Callable[[str, bytes], Any]] = None,
+                        timeout: Optional[float] = None):
+        """
+        订阅主题并等待服务端确认
+        callback(topic, msg) 在接收循环中调用 (返回协程时作为任务运行); 不设置时推送的消息进入收件箱,
+        由 recv / recv_many / async for 读取; 连接断开后重连时自动重新订阅
+        """
+        build = _subscribe_frame(FRAME_SUBSCRIBE, topic)
+        self._subscriptions[topic] = callback
+        try:
+            await self._control(build, timeout)
+        except BaseException:
+            self._subscriptions.pop(topic, None)
+            raise
+    
+    async def unsubscribe(self, topic: str, timeout: Optional[float] = None):
+        build = _subscribe_frame(FRAME_UNSUBSCRIBE, topic)
+        self._subscriptions.pop(topic, None)
+        await self._control(build, timeout)
+    
+    async def publish(self, topic: str, data: bytes, timeout: Optional[float] = None) -> int:
+        """向主题发布消息 (经服务端推送给所有订阅者, 包括本连接), 返回接受推送的订阅者数"""
+        def build(stream_id: int) -> bytes:
+            payload, flags = self._pack(data)
+            return encode_publish(topic, payload, stream_id, flags)
+        return int(await self._control(build, timeout))
     
     async def send(self, data: bytes):
         await self._ensure_connected()
-        encoded = encode_data(data)
-        self.writer.write(encoded)
+        encoded = encode_frame(self._seal(data))
+        self._write(encoded)
         await self.writer.drain()
     
-    async def recv(self, timeout: Optional[float] = None) -> Optional[bytes]:
+    async def send_many(self, payloads: Iterable[bytes]) -> int:
+        """批量发送多条消息: 帧头与负载分别交给 writelines, 整批只 drain 一次, 返回发送的消息数"""
         await self._ensure_connected()
-        start = time.time()
-        while True:
-            if not self._msg_queue.empty():
-                return await self._msg_queue.get()
-            if timeout is not None and (time.time() - start) >= timeout:
-                return None
-            try:
-                wait_time = 0.1
-                if timeout:
-                    wait_time = min(wait_time, timeout - (time.time() - start))
-                await asyncio.wait_for(self._recv_event.wait(), timeout=wait_time)
-                self._recv_event.clear()
-            except asyncio.TimeoutError:
-                continue
+        payloads = [self._seal(data) for data in payloads]
+        if payloads:
+            self._gate.writelines(frame_buffers(payloads))
+            self.metrics.inc("frames_out", len(payloads))
+            self.metrics.inc("bytes_out", sum(len(p) for p in payloads))
+            await self.writer.drain()
+        return len(payloads)
+    
+    async def recv(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        读取一条推送消息, 消息到达即返回; timeout 秒内没有消息 (None 表示一直等待) 或连接断开时返回 None
+        连接断开前已收到的消息仍会依次返回, 取完之后的调用按需重连
+        """
+        if not self._inbox:
+            await self._ensure_connected()
+        return await self._inbox.get(timeout)
+    
+    async def recv_many(self, max_n: int, timeout: Optional[float] = None) -> List[bytes]:
+        """等待至少一条消息 (同 recv), 再不等待地取出已到达的消息, 最多 max_n 条; 没有消息时返回空列表"""
+        first = await self.recv(timeout)
+        if first is None:
+            return []
+        messages = [first]
+        inbox = self._inbox
+        while len(messages) < max_n:
+            msg = inbox.get_nowait()
+            if msg is None:
+                break
+            messages.append(msg)
+        return messages
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self) -> bytes:
+        """async for msg in client: 逐条读取推送消息, 连接断开 (或 close) 且消息取完后结束"""
+        msg = await self.recv()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
     
     async def _close_internal(self):
         self._connected = False
-        self._recv_event.clear()
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+            self._beat_handle = None
         if self._recv_task and not self._recv_task.done():
             self._recv_task.cancel()
             try:
@@ -240,6 +1384,7 @@ class AsyncClient:
             except asyncio.CancelledError:
                 pass
         if self.writer:
+            self._save_tls_session(self.writer)
             try:
                 self.writer.close()
                 await self.writer.wait_closed()
@@ -248,9 +1393,13 @@ class AsyncClient:
             finally:
                 self.reader = None
                 self.writer = None
-        self.buffer = b""
-        self._msg_queue = None
+                self._gate = None
+        self._decoder.clear()
+        self._inflight.fail_all(ConnectionError("客户端已关闭"))
+        if self._inbox is not None:
+            self._inbox.close()
     
     async def close(self):
+        self._subscriptions.clear()
         async with self._connect_lock:
             await self._close_internal()
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Tuple, Optional, List, Sequence, Dict, Any, Deque
+from ..comm import Auth
+from ._client import AsyncClient, ServerBusyError
+
+
+logger = logging.getLogger('mux')
+
+
+class _Endpoint:
+    """单个后端节点的连接与熔断状态"""
+
+    def __init__(self, address: Tuple[str, int], client: AsyncClient):
+        self.address = address
+        self.client = client
+        self.outstanding = 0
+        self.failures = 0          # 连续失败次数
+        self.ejected_until = 0.0   # 熔断截止时间
+        self.backoff = 0.0
+        self.probing = False       # 熔断到期后仅放行一个探测请求
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now: float) -> bool:
+        if self.ejected_until <= 0:
+            return True
+        return now >= self.ejected_until and not self.probing
+
+
+class AsyncClusterClient:
+    """
+    多节点异步客户端
+    - 与每个节点保持一条预热的多路复用连接
+    - 负载均衡: "p2c" 随机取两个节点选在途请求较少者, "least" 选在途请求最少的节点
+    - 连续失败 failure_threshold 次的节点被摘除, 摘除时长从 eject_base 起指数退避到 eject_max,
+      到期后放行一个探测请求, 成功则恢复
+    - 设置 hedge_percentile 后, 请求超过历史延迟的该分位数仍未返回时向另一个节点发送对冲请求, 取先返回者
+    其余关键字参数原样传给 AsyncClient
+    """
+
+    STRATEGIES = ("p2c", "least")
+
+    def __init__(self,
+                 addresses: Sequence[Tuple[str, int]],
+                 auth: Optional[Auth] = None,
+                 timeout: float = 10.0,
+                 strategy: str = "p2c",
+                 failure_threshold: int = 3,
+                 eject_base: float = 1.0,
+                 eject_max: float = 30.0,
+                 hedge_percentile: Optional[float] = None,
+                 hedge_min_samples: int = 100,
+                 **client_options):
+        if not addresses:
+            raise ValueError("至少需要一个服务端地址")
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"未知负载均衡策略：{strategy}")
+        self.timeout = timeout
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.eject_base = eject_base
+        self.eject_max = eject_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        client_options.setdefault("multiplex", True)
+        # 故障转移由集群客户端负责, 单节点不做带退避的重连
+        client_options.setdefault("max_reconnect_attempts", 1)
+        self._endpoints = [
+            _Endpoint(tuple(addr), AsyncClient(tuple(addr), auth, timeout, **client_options))
+            for addr in addresses
+        ]
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._hedge_delay: Optional[float] = None
+        self._since_recompute = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+
+    async def connect(self):
+        """预热所有节点的连接, 连接失败的节点直接进入摘除状态"""
+        results = await asyncio.gather(*[ep.client.connect() for ep in self._endpoints], return_exceptions=True)
+        for ep, result in zip(self._endpoints, results):
+            if isinstance(result, Exception):
+                logger.warning(f"[!] 节点 {ep.address} 连接失败: {result}")
+                self._record_failure(ep, eject=True)
+        if all(isinstance(r, Exception) for r in results):
+            raise ConnectionError("所有节点均连接失败")
+
+    def _pick(self, exclude: Sequence[_Endpoint] = ()) -> Optional[_Endpoint]:
+        """选择节点; 选中熔断到期的节点即开始探测, 调用方必须向它发送请求"""
+        now = time.monotonic()
+        candidates = [ep for ep in self._endpoints if ep not in exclude and ep.available(now)]
+        if not candidates:
+            return None
+        if self.strategy == "least" or len(candidates) <= 2:
+            low = min(ep.outstanding for ep in candidates)
+            chosen = random.choice([ep for ep in candidates if ep.outstanding == low])
+        else:
+            a, b = random.sample(candidates, 2)
+            chosen = a if a.outstanding <= b.outstanding else b
+        if chosen.ejected_until > 0:
+            chosen.probing = True
+        return chosen
+
+    def _record_failure(self, ep: _Endpoint, eject: bool = False):
+        ep.failures += 1
+        ep.errors += 1
+        ep.probing = False
+        if eject or ep.failures >= self.failure_threshold or ep.ejected_until > 0:
+            ep.backoff = min(ep.backoff * 2, self.eject_max) if ep.backoff else self.eject_base
+            ep.ejected_until = time.monotonic() + ep.backoff
+            logger.warning(f"[!] 节点 {ep.address} 已摘除 {ep.backoff:.1f}s (连续失败 {ep.failures} 次)")
+
+    def _record_success(self, ep: _Endpoint, latency: Optional[float]):
+        """latency 为 None 时只恢复节点 (如服务端返回了错误帧), 不计入对冲延迟的样本"""
+        if ep.ejected_until > 0:
+            logger.info(f"[*] 节点 {ep.address} 已恢复")
+        ep.failures = 0
+        ep.backoff = 0.0
+        ep.ejected_until = 0.0
+        ep.probing = False
+        if latency is not None:
+            self._latencies.append(latency)
+            self._since_recompute += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲请求的等待时间: 近期成功请求延迟的 hedge_percentile 分位数"""
+        if self.hedge_percentile is None or len(self._latencies) < self.hedge_min_samples:
+            return None
+        if self._hedge_delay is None or self._since_recompute >= 50:
+            samples = sorted(self._latencies)
+            index = min(int(len(samples) * self.hedge_percentile), len(samples) - 1)
+            self._hedge_delay = samples[index]
+            self._since_recompute = 0
+        return self._hedge_delay
+
+    async def _call_endpoint(self, ep: _Endpoint, data: bytes, timeout: float) -> bytes:
+        ep.outstanding += 1
+        ep.requests += 1
+        start = time.monotonic()
+        try:
+            resp = await ep.client.call(data, timeout)
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            self._record_failure(ep)
+            raise
+        except ServerBusyError:
+            # 节点过载但仍在响应: 不计入失败也不算恢复, 由 call 转移到其他节点
+            raise
+        except RuntimeError:
+            # 服务端返回了错误帧, 说明节点可用
+            self._record_success(ep, None)
+            raise
+        finally:
+            # 对冲中落败被取消、过载或其他异常: 探测结束, 熔断到期的节点可以再次被选中探测
+            ep.probing = False
+            ep.outstanding -= 1
+        self._record_success(ep, time.monotonic() - start)
+        return resp
+
+    async def _call_hedged(self, ep: _Endpoint, data: bytes, timeout: float, delay: float) -> bytes:
+        primary = asyncio.ensure_future(self._call_endpoint(ep, data, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        backup_ep = self._pick((ep,))
+        if backup_ep is None:
+            return await primary
+        self._hedges += 1
+        backup = asyncio.ensure_future(self._call_endpoint(backup_ep, data, max(timeout - delay, 0.001)))
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, data: bytes, timeout: Optional[float] = None) -> bytes:
+        """
+        选择一个节点发送请求并等待响应
+        连接类错误与服务端过载 (ServerBusyError) 会立即转移到其他可用节点重试, 每个节点最多尝试一次
+        """
+        timeout = self.timeout if timeout is None else timeout
+        tried: List[_Endpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(len(self._endpoints)):
+            ep = self._pick(tried)
+            if ep is None:
+                break
+            tried.append(ep)
+            try:
+                delay = self.hedge_delay()
+                if delay is not None and len(self._endpoints) > 1:
+                    return await self._call_hedged(ep, data, timeout, delay)
+                return await self._call_endpoint(ep, data, timeout)
+            except (ConnectionError, ServerBusyError) as e:
+                # 过载的节点没有处理该请求, 可以安全地转移到其他节点
+                last_error = e
+                continue
+        if isinstance(last_error, ServerBusyError):
+            raise last_error
+        raise ConnectionError(f"没有可用的节点: {last_error}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "hedges": self._hedges,
+            "hedge_wins": self._hedge_wins,
+            "hedge_delay_ms": (self._hedge_delay or 0.0) * 1000,
+            "endpoints": [
+                {
+                    "address": ep.address,
+                    "outstanding": ep.outstanding,
+                    "requests": ep.requests,
+                    "errors": ep.errors,
+                    "ejected": ep.ejected_until > now,
+                }
+                for ep in self._endpoints
+            ],
+        }
+
+    async def close(self):
+        await asyncio.gather(*[ep.client.close() for ep in self._endpoints], return_exceptions=True)
@@ -0,0 +1,256 @@
+import array
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+from typing import Tuple, Optional, Callable, List
+
+
+logger = logging.getLogger('mux')
+
+# 以继承方式启动的新进程从环境变量中取得监听 socket 与控制通道的文件描述符
+LISTEN_FD_ENV = "MUXP_LISTEN_FD"
+CONTROL_FD_ENV = "MUXP_CONTROL_FD"
+READY = b"READY"
+
+# fork 钩子只注册一次 (os.register_at_fork 无法注销), 由它转给当前的 Handoff
+_active: Optional["Handoff"] = None
+_fork_hook = False
+_fork_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    if _active is not None:
+        _active._in_child()
+
+
+def listen_socket(address: Tuple[str, int], backlog: int, reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    return sock
+
+
+def send_fd(channel: socket.socket, fd: int):
+    """通过 Unix socket 以 SCM_RIGHTS 传递文件描述符 (socket.send_fds 需要 3.9+)"""
+    channel.sendmsg([b"F"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [fd]))])
+
+
+def recv_fd(channel: socket.socket) -> int:
+    fds = array.array("i")
+    msg, ancdata, _, _ = channel.recvmsg(1, socket.CMSG_LEN(fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    if not msg or not fds:
+        raise ConnectionError("旧进程没有传递监听 socket")
+    os.set_inheritable(fds[0], False)
+    return fds[0]
+
+
+def _restart_argv() -> List[str]:
+    # sys.orig_argv (3.10+) 保留了 -m/-c 等解释器参数, 较早的版本只能按脚本重新运行
+    argv = getattr(sys, "orig_argv", None)
+    return [sys.executable] + (argv[1:] if argv else sys.argv)
+
+
+class Handoff:
+    """
+    零停机重启: 新进程接管旧进程的监听 socket, 内核监听队列不中断, 部署期间不会出现连接被拒绝
+    - 路径方式: 旧进程在 Unix socket (path) 上等待, 新进程以相同的 path 启动时连接过去, 经 SCM_RIGHTS 取得监听 socket
+    - 继承方式: 旧进程收到 SIGUSR2 时以相同的命令行启动新进程, 监听 socket 经 pass_fds 继承
+    两种方式下新进程开始服务后都经控制通道回复 READY, 旧进程随即调用 on_takeover (停止 accept 并优雅排空);
+    新进程在 READY 之前退出时旧进程继续服务
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.sock: Optional[socket.socket] = None
+        self.on_takeover: Optional[Callable[[], None]] = None
+        self._control: Optional[socket.socket] = None   # 新进程: 向旧进程回复 READY 的通道
+        self._listener: Optional[socket.socket] = None  # 旧进程: path 上的 Unix socket
+        self._inode: Optional[int] = None
+        self._taken = threading.Event()
+        self._previous_usr2 = None  # ready 之前的 SIGUSR2 处理函数, close 时恢复
+
+    def acquire(self, address: Tuple[str, int], backlog: int, reuse_port: bool = False) -> socket.socket:
+        """依次尝试继承的文件描述符与 path 上的旧进程, 都没有时自己监听 address"""
+        fd = os.environ.pop(LISTEN_FD_ENV, None)
+        control = os.environ.pop(CONTROL_FD_ENV, None)
+        if fd is not None:
+            os.set_inheritable(int(fd), False)
+            self.sock = socket.socket(fileno=int(fd))
+            if control is not None:
+                os.set_inheritable(int(control), False)
+                self._control = socket.socket(fileno=int(control))
+            logger.info(f"[*] 继承了旧进程的监听 socket {self.sock.getsockname()}")
+        elif self.path is not None:
+            self.sock = self._fetch()
+        if self.sock is None:
+            self.sock = listen_socket(address, backlog, reuse_port)
+        return self.sock
+
+    def _fetch(self) -> Optional[socket.socket]:
+        channel = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            channel.connect(self.path)
+        except OSError:
+            # 没有旧进程 (或是残留的 socket 文件)
+            channel.close()
+            return None
+        try:
+            sock = socket.socket(fileno=recv_fd(channel))
+        except OSError:
+            channel.close()
+            raise
+        self._control = channel
+        logger.info(f"[*] 经 {self.path} 接管了旧进程的监听 socket {sock.getsockname()}")
+        return sock
+
+    def ready(self):
+        """本进程已准备好 accept: 通知旧进程退出, 之后在 path 上等待下一次交接"""
+        if self._control is not None:
+            try:
+                self._control.sendall(READY)
+            except OSError as e:
+                logger.warning(f"[!] 通知旧进程失败: {e}")
+            self._control.close()
+            self._control = None
+        if self.path is not None:
+            self._listen()
+        if self.sock is not None and hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+            # 信号处理函数中不宜直接启动子进程
+            self._previous_usr2 = signal.signal(
+                signal.SIGUSR2, lambda *_: threading.Thread(target=self.respawn, daemon=True).start())
+        # fork 出的 worker 不参与交接
+        global _active, _fork_hook
+        with _fork_lock:
+            _active = self
+            if not _fork_hook:
+                os.register_at_fork(after_in_child=_after_fork_in_child)
+                _fork_hook = True
+
+    def _listen(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(1)
+        self._inode = os.stat(self.path).st_ino
+        self._listener = listener
+        threading.Thread(target=self._serve, name="muxp-handoff", daemon=True).start()
+
+    def _serve(self):
+        listener = self._listener
+        while not self._taken.is_set():
+            try:
+                channel, _ = listener.accept()
+            except OSError:
+                return
+            with channel:
+                try:
+                    send_fd(channel, self.sock.fileno())
+                    ok = self._await_ready(channel)
+                except OSError as e:
+                    logger.warning(f"[!] 交接监听 socket 失败: {e}")
+                    continue
+            if ok:
+                self._takeover()
+                return
+
+    def respawn(self) -> Optional[subprocess.Popen]:
+        """以相同的命令行启动新进程并让其继承监听 socket, 可在信号处理函数中调用"""
+        if self.sock is None or self._taken.is_set():
+            return None
+        parent, child = socket.socketpair()
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(self.sock.fileno())
+        env[CONTROL_FD_ENV] = str(child.fileno())
+        try:
+            proc = subprocess.Popen(_restart_argv(), env=env, pass_fds=(self.sock.fileno(), child.fileno()))
+        except OSError as e:
+            logger.error(f"[!] 启动新进程失败: {e}")
+            parent.close()
+            return None
+        finally:
+            child.close()
+        logger.info(f"[*] 已启动新进程 (pid {proc.pid}), 等待其接管监听 socket")
+
+        def wait():
+            with parent:
+                ok = self._await_ready(parent)
+            if ok:
+                self._takeover()
+            else:
+                logger.error(f"[!] 新进程 (pid {proc.pid}) 未能就绪, 继续服务")
+
+        threading.Thread(target=wait, name="muxp-respawn", daemon=True).start()
+        return proc
+
+    @staticmethod
+    def _await_ready(channel: socket.socket) -> bool:
+        """新进程启动可能较慢, 不设超时; 新进程退出时连接关闭, recv 返回空"""
+        data = b""
+        while len(data) < len(READY):
+            chunk = channel.recv(len(READY) - len(data))
+            if not chunk:
+                return False
+            data += chunk
+        return data == READY
+
+    def _takeover(self):
+        if self._taken.is_set():
+            return
+        self._taken.set()
+        logger.info("[*] 新进程已接管监听 socket, 开始排空")
+        # path 此时已由新进程重新绑定, 不能删除
+        self._inode = None
+        self._close_listener()
+        if self.on_takeover is not None:
+            self.on_takeover()
+
+    def _close_listener(self):
+        if self._listener is not None:
+            try:
+                # 唤醒阻塞在 accept 上的交接线程
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._forget_listener()
+
+    def _in_child(self):
+        self._forget_listener()
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+
+    def _forget_listener(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def close(self):
+        """正常退出时删除 path (仍是本进程绑定的那个文件时)"""
+        global _active
+        with _fork_lock:
+            if _active is self:
+                _active = None
+        if self._previous_usr2 is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR2, self._previous_usr2)
+            self._previous_usr2 = None
+        self._taken.set()
+        self._close_listener()
+        if self.path is not None and self._inode is not None:
+            try:
+                if os.stat(self.path).st_ino == self._inode:
+                    os.unlink(self.path)
+            except OSError:
+                pass
+            self._inode = None
@@ -0,0 +1,246 @@
+import http.server
+import json
+import logging
+import threading
+from typing import Tuple, Optional, List, Dict, Any, Callable
+
+
+logger = logging.getLogger('mux')
+
+# HDR 风格的对数-线性分桶: 以微秒计, 每个 2 的幂区间再等分 16 份, 相对误差约 6%
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+_MAX_VALUE = (1 << 40) - 1  # 约 12.7 天, 更大的值计入最后一个桶
+
+# Prometheus 导出时使用的累计分桶上限 (秒)
+PROMETHEUS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                      0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _bucket(us: int) -> int:
+    if us < _SUB_COUNT:
+        return us if us > 0 else 0
+    if us > _MAX_VALUE:
+        us = _MAX_VALUE
+    shift = us.bit_length() - _SUB_BITS - 1
+    return (shift + 1) * _SUB_COUNT + (us >> shift) - _SUB_COUNT
+
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """桶覆盖的微秒区间 [low, high)"""
+    if index < _SUB_COUNT:
+        return index, index + 1
+    shift = index // _SUB_COUNT - 1
+    low = (_SUB_COUNT + index % _SUB_COUNT) << shift
+    return low, low + (1 << shift)
+
+
+class _Shard:
+    """单个线程独占的计数分片, 写入不加锁, 读取时汇总所有分片"""
+
+    __slots__ = ("thread", "counters", "histograms")
+
+    def __init__(self, thread: Optional[threading.Thread]):
+        self.thread = thread
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Dict[int, int]] = {}
+
+    def merge(self, other: "_Shard"):
+        # list() 在持有 GIL 时一次性复制, 所属线程并发写入也不会打断遍历
+        for name, value in list(other.counters.items()):
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, buckets in list(other.histograms.items()):
+            mine = self.histograms.setdefault(name, {})
+            for index, count in list(buckets.items()):
+                mine[index] = mine.get(index, 0) + count
+
+
+class Histogram:
+    """合并后的延迟分布快照"""
+
+    def __init__(self, buckets: Dict[int, int]):
+        self._buckets = sorted(buckets.items())
+        self.count = sum(count for _, count in self._buckets)
+        # 按桶中点估算总和, 与分桶精度一致
+        self.total_us = sum(sum(_bucket_bounds(i)) / 2 * count for i, count in self._buckets)
+
+    def percentile(self, q: float) -> float:
+        """返回分位数 (秒), 取所在桶的上界"""
+        if not self.count:
+            return 0.0
+        rank = max(int(self.count * q + 0.5), 1)
+        seen = 0
+        for index, count in self._buckets:
+            seen += count
+            if seen >= rank:
+                return _bucket_bounds(index)[1] / 1e6
+        return _bucket_bounds(self._buckets[-1][0])[1] / 1e6
+
+    def cumulative(self, bounds) -> List[int]:
+        """每个上限 (秒) 以内的累计计数, 用于 Prometheus 的 _bucket 序列"""
+        result = []
+        for le in bounds:
+            limit = le * 1e6
+            result.append(sum(count for index, count in self._buckets if _bucket_bounds(index)[1] <= limit))
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total_us / self.count / 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p90_ms": self.percentile(0.9) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "p999_ms": self.percentile(0.999) * 1000,
+            "max_ms": (_bucket_bounds(self._buckets[-1][0])[1] / 1000) if self._buckets else 0.0,
+        }
+
+
+class Metrics:
+    """
+    低开销的指标收集
+    - inc 计数与 observe 延迟都写入当前线程独占的分片, 热路径上不加锁; 读取时汇总所有分片,
+      已退出线程的分片在读取或新线程注册时合并进归档分片
+    - 延迟直方图为 HDR 风格的对数-线性分桶, 以微秒计, 相对误差约 6%
+    - gauge 注册读取时求值的回调, 例如线程池的等待队列长度
+    enabled=False 时所有记录操作为空操作
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(None)
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            self._local.shard = shard
+            with self._lock:
+                # ThreadingMixIn 每条连接一个线程, 注册时顺便回收已退出线程的分片
+                if len(self._shards) >= 64:
+                    self._retire()
+                self._shards.append(shard)
+        return shard
+
+    def _retire(self):
+        """调用方需持有 _lock"""
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._retired.merge(shard)
+        self._shards = alive
+
+    def inc(self, name: str, value: int = 1):
+        if self.enabled:
+            counters = self._shard().counters
+            counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        if self.enabled:
+            histograms = self._shard().histograms
+            buckets = histograms.get(name)
+            if buckets is None:
+                buckets = histograms[name] = {}
+            index = _bucket(int(seconds * 1e6))
+            buckets[index] = buckets.get(index, 0) + 1
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        self._gauges[name] = func
+
+    def _merged(self) -> _Shard:
+        with self._lock:
+            self._retire()
+            merged = _Shard(None)
+            merged.merge(self._retired)
+            for shard in self._shards:
+                merged.merge(shard)
+        return merged
+
+    def counters(self) -> Dict[str, int]:
+        return self._merged().counters
+
+    def histogram(self, name: str) -> Histogram:
+        return Histogram(self._merged().histograms.get(name, {}))
+
+    def gauges(self) -> Dict[str, float]:
+        values = {}
+        for name, func in list(self._gauges.items()):
+            try:
+                values[name] = func()
+            except Exception:
+                pass
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        merged = self._merged()
+        return {
+            "counters": dict(sorted(merged.counters.items())),
+            "gauges": self.gauges(),
+            "latency": {name: Histogram(buckets).summary() for name, buckets in sorted(merged.histograms.items())},
+        }
+
+    def prometheus(self, prefix: str = "muxp") -> str:
+        """Prometheus 文本格式 (0.0.4)"""
+        merged = self._merged()
+        lines = []
+        for name, value in sorted(merged.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        for name, buckets in sorted(merged.histograms.items()):
+            hist = Histogram(buckets)
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for le, count in zip(PROMETHEUS_BUCKETS, hist.cumulative(PROMETHEUS_BUCKETS)):
+                lines.append(f'{metric}_bucket{{le="{le}"}} {count}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {hist.count}')
+            lines.append(f"{metric}_sum {hist.total_us / 1e6:.6f}")
+            lines.append(f"{metric}_count {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, address: Tuple[str, int], stats: Optional[Callable[[], Dict[str, Any]]] = None) -> "MetricsServer":
+        """在后台线程中启动指标 HTTP 服务: /metrics 为 Prometheus 文本, /stats 为 JSON"""
+        server = MetricsServer(address, self, stats or self.snapshot)
+        threading.Thread(target=server.serve_forever, name="muxp-metrics", daemon=True).start()
+        logger.info(f"[*] 指标服务监听在 http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+        return server
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.server.metrics.prometheus().encode('utf-8')
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/stats":
+            body = json.dumps(self.server.stats()).encode('utf-8')
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"[*] 指标请求 {self.address_string()} {format % args}")
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], metrics: Metrics, stats: Callable[[], Dict[str, Any]]):
+        self.metrics = metrics
+        self.stats = stats
+        super().__init__(address, _MetricsHandler)
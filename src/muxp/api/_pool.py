@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Tuple, Optional, Callable, Deque, Dict, Any, Iterator
+from ..comm import Auth
+from ._client import Client
+
+
+logger = logging.getLogger('mux')
+
+
+class _Pooled:
+    __slots__ = ("client", "created", "last_used")
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class ClientPool:
+    """
+    同步 Client 的线程安全连接池
+    - min_size/max_size: 最少保持与最多创建的连接数
+    - checkout 阻塞等待空闲连接, 超过 checkout_timeout 抛出 TimeoutError
+    - 取出时做健康检查, 失效连接按 Client 的重连策略重连, 重连失败则丢弃
+    - 空闲超过 max_idle 的连接在保持 min_size 的前提下被回收, 存活超过 max_lifetime 的连接被替换
+    其余关键字参数原样传给 Client
+    """
+
+    def __init__(self,
+                 address: Tuple[str, int],
+                 auth: Optional[Auth] = None,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 checkout_timeout: float = 10.0,
+                 max_idle: float = 60.0,
+                 max_lifetime: float = 600.0,
+                 health_check: Optional[Callable[[Client], bool]] = None,
+                 **client_options):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("连接池大小无效: 需要 0 <= min_size <= max_size 且 max_size >= 1")
+        self.address = address
+        self.auth = auth
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check or Client.healthy
+        self.client_options = client_options
+
+        self._cond = threading.Condition()
+        self._idle: Deque[_Pooled] = deque()
+        self._in_use: Dict[int, _Pooled] = {}
+        self._size = 0  # 已创建(含创建中)的连接数
+        self._closed = False
+        # 回收线程单独等待关闭事件: 若与 checkout 共用 _cond, notify 可能唤醒它而不是等待连接的线程
+        self._stopped = threading.Event()
+
+        # 统计信息
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(min_size):
+            self._idle.append(self._create())
+            self._size += 1
+
+        self._reaper = threading.Thread(target=self._reap_loop, name="muxp-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _create(self) -> _Pooled:
+        client = Client(self.address, self.auth, **self.client_options)
+        with self._cond:
+            self._created += 1
+        return _Pooled(client)
+
+    def _expired(self, item: _Pooled, now: float) -> bool:
+        return self.max_lifetime is not None and now - item.created >= self.max_lifetime
+
+    def _discard(self, item: _Pooled):
+        """关闭连接, 调用方需已把它从 _size 中扣除"""
+        self._discarded += 1
+        try:
+            item.client.close()
+        except Exception:
+            pass
+
+    def _validate(self, item: _Pooled) -> bool:
+        """取出时的健康检查, 失效时复用 Client 的重连逻辑"""
+        try:
+            if self.health_check(item.client):
+                return True
+            logger.info(f"[*] 连接池中的连接已失效, 尝试重连 {self.address}")
+            item.client._reconnect_with_retry()
+            item.created = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning(f"[!] 连接池重连失败: {e}")
+            return False
+
+    def checkout(self, timeout: Optional[float] = None) -> Client:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            item = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise ConnectionError("连接池已关闭")
+                    now = time.monotonic()
+                    while self._idle:
+                        # 后进先出, 优先复用最近用过的连接
+                        candidate = self._idle.pop()
+                        if self._expired(candidate, now):
+                            self._size -= 1
+                            self._discard(candidate)
+                            continue
+                        item = candidate
+                        break
+                    if item is not None:
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise TimeoutError(f"连接池获取连接超时 ({timeout}s), 最大连接数: {self.max_size}")
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    item = self._create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._validate(item):
+                with self._cond:
+                    self._size -= 1
+                    self._discard(item)
+                    self._cond.notify()
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                self._in_use[id(item.client)] = item
+            return item.client
+
+    def checkin(self, client: Client, discard: bool = False):
+        """归还连接; discard=True 或连接已断开/超过最大存活时间时直接关闭"""
+        with self._cond:
+            item = self._in_use.pop(id(client), None)
+            if item is None:
+                return
+            now = time.monotonic()
+            if discard or self._closed or client.sock is None or self._expired(item, now):
+                self._size -= 1
+                self._discard(item)
+            else:
+                item.last_used = now
+                self._idle.append(item)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Client]:
+        """with pool.connection() as client: ... 出现连接类异常时不再归还该连接"""
+        client = self.checkout(timeout)
+        try:
+            yield client
+        except (ConnectionError, OSError):
+            self.checkin(client, discard=True)
+            raise
+        except BaseException:
+            self.checkin(client)
+            raise
+        else:
+            self.checkin(client)
+
+    def evict_idle(self):
+        """回收空闲过久或超过最大存活时间的连接, 并补足 min_size"""
+        with self._cond:
+            now = time.monotonic()
+            keep: Deque[_Pooled] = deque()
+            for item in self._idle:
+                idle_too_long = self.max_idle is not None and now - item.last_used >= self.max_idle
+                if self._expired(item, now) or (idle_too_long and self._size > self.min_size):
+                    self._size -= 1
+                    self._discard(item)
+                else:
+                    keep.append(item)
+            self._idle = keep
+            missing = 0 if self._closed else max(self.min_size - self._size, 0)
+            self._size += missing
+        for _ in range(missing):
+            try:
+                item = self._create()
+            except Exception as e:
+                logger.warning(f"[!] 连接池补充连接失败: {e}")
+                with self._cond:
+                    self._size -= 1
+                continue
+            with self._cond:
+                self._idle.appendleft(item)
+                self._cond.notify()
+
+    def _reap_loop(self):
+        interval = max(min(self.max_idle or 30.0, self.max_lifetime or 30.0) / 2, 0.5)
+        while not self._stopped.wait(interval):
+            self.evict_idle()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            in_use = len(self._in_use)
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "max_size": self.max_size,
+                "utilization": in_use / self.max_size,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "wait_avg_ms": self._wait_total / self._checkouts * 1000 if self._checkouts else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            for item in idle:
+                self._discard(item)
+            self._cond.notify_all()
+        self._stopped.set()
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc_val, exc_tb): self.close()
@@ -0,0 +1,330 @@
+import asyncio
+import enum
+import logging
+import queue
+import threading
+import traceback
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+from ..comm import encode_publish, FrameCompressor
+from ..comm.security import SignatureSession
+from ._metrics import Metrics
+
+
+logger = logging.getLogger('mux')
+
+PUSH_QUEUE = 1024  # 每个订阅者推送队列的默认长度 (条)
+
+
+class SlowConsumer(enum.Enum):
+    """
+    订阅者来不及接收 (推送队列已满) 时的处理
+    - DROP_OLDEST: 丢弃队列中最早的消息, 保留最新的
+    - DROP_NEWEST: 丢弃这条新消息
+    - DISCONNECT: 断开该连接, 客户端重连后重新订阅
+    """
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    DISCONNECT = "disconnect"
+
+
+class PushWorkers:
+    """
+    线程模型下写出推送的守护线程池, 按需创建最多 size 个线程
+    写给不读取数据的对端时线程会一直阻塞 (直到连接被空闲淘汰或断开), 守护线程不会因此阻止进程退出
+    """
+
+    def __init__(self, size: int, name: str = "muxp-push"):
+        self.size = max(size, 1)
+        self.name = name
+        self._jobs: "queue.SimpleQueue[Optional[Callable[[], Any]]]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._closed = False
+
+    def submit(self, job: Callable[[], Any]):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("推送线程池已关闭")
+            if self._idle:
+                self._idle -= 1
+            elif self._threads < self.size:
+                self._threads += 1
+                threading.Thread(target=self._run, name=f"{self.name}-{self._threads}", daemon=True).start()
+        self._jobs.put(job)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                job()
+            except Exception:
+                traceback.print_exc()
+            with self._lock:
+                self._idle += 1
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            count = self._threads
+        for _ in range(count):
+            self._jobs.put(None)
+
+
+def _in_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+class Subscriber:
+    """
+    一条连接的订阅状态与推送队列, 由各引擎的子类负责写出
+    编解码器与压缩算法相同的连接 variant 相同, 共享同一份编码好的帧
+    """
+
+    loop: Optional[asyncio.AbstractEventLoop] = None  # 非 None 时只能在该事件循环中 offer
+
+    def __init__(self, pubsub: "PubSub", codec: Any, compressor: Optional[FrameCompressor],
+                 abort: Callable[[], Any], metrics: Metrics):
+        self.pubsub = pubsub
+        self.codec = codec
+        self.compressor = compressor
+        self.variant = (codec, repr(compressor) if compressor is not None else None)
+        self.topics: Set[str] = set()
+        self.closed = False
+        self._abort = abort
+        self._metrics = metrics
+        self._queue: Deque[bytes] = deque()
+
+    def offer(self, frame: bytes) -> bool:
+        """放入推送队列并安排写出, 返回 False 表示消息被丢弃或连接已断开"""
+        raise NotImplementedError
+
+    def _enqueue(self, frame: bytes) -> bool:
+        if self.closed:
+            return False
+        if len(self._queue) >= self.pubsub.queue_size:
+            self._metrics.inc("push_dropped")
+            policy = self.pubsub.slow_consumer
+            if policy == SlowConsumer.DROP_NEWEST:
+                return False
+            if policy == SlowConsumer.DISCONNECT:
+                logger.warning("[!] 订阅者接收过慢, 断开连接")
+                self._metrics.inc("slow_consumers")
+                self.closed = True
+                self._queue.clear()
+                self._abort()
+                return False
+            self._queue.popleft()
+        self._queue.append(frame)
+        return True
+
+    def close(self):
+        """连接断开: 退订所有主题, 丢弃未写出的推送"""
+        self.closed = True
+        self._queue.clear()
+        self.pubsub.remove(self)
+
+
+class ThreadSubscriber(Subscriber):
+    """线程模型的订阅者: 推送由共享的线程池写出, 同一连接同时最多一个写出任务, 队列中的帧一次写出"""
+
+    def __init__(self, pubsub: "PubSub", codec: Any, compressor: Optional[FrameCompressor],
+                 send: Callable[[List[bytes]], Any], abort: Callable[[], Any], metrics: Metrics,
+                 executor: Callable[[], PushWorkers]):
+        super().__init__(pubsub, codec, compressor, abort, metrics)
+        self._send = send
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._flushing = False
+
+    def offer(self, frame: bytes) -> bool:
+        with self._lock:
+            if not self._enqueue(frame):
+                return False
+            if self._flushing:
+                return True
+            self._flushing = True
+        try:
+            self._executor().submit(self._flush)
+        except RuntimeError:
+            # 服务器正在关闭, 线程池已停止
+            self.close()
+            return False
+        return True
+
+    def _flush(self):
+        while True:
+            with self._lock:
+                if self.closed or not self._queue:
+                    self._flushing = False
+                    return
+                frames = list(self._queue)
+                self._queue.clear()
+            try:
+                self._send(frames)
+            except OSError:
+                with self._lock:
+                    self._flushing = False
+                self.close()
+                return
+
+    def close(self):
+        with self._lock:
+            super().close()
+
+
+class AsyncSubscriber(Subscriber):
+    """
+    asyncio 引擎的订阅者: 写缓冲不超过 high 时直接写入 transport,
+    否则进入推送队列, 由一个任务等待写缓冲排空后成批写出
+    """
+
+    def __init__(self, pubsub: "PubSub", codec: Any, compressor: Optional[FrameCompressor],
+                 send: Callable[[List[bytes]], Any], drain: Callable[[], Any], transport: asyncio.Transport,
+                 high: int, metrics: Metrics):
+        super().__init__(pubsub, codec, compressor, transport.abort, metrics)
+        self.loop = asyncio.get_running_loop()
+        self._send = send
+        self._drain = drain
+        self._transport = transport
+        self._high = high
+        self._flusher: Optional[asyncio.Future] = None
+
+    def offer(self, frame: bytes) -> bool:
+        if self.closed:
+            return False
+        if not self._queue and self._transport.get_write_buffer_size() <= self._high:
+            self._send([frame])
+            return True
+        if not self._enqueue(frame):
+            return False
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush())
+        return True
+
+    async def _flush(self):
+        try:
+            while self._queue and not self.closed:
+                await self._drain()
+                frames = list(self._queue)
+                self._queue.clear()
+                self._send(frames)
+        except Exception:
+            # 连接已断开 (或正在关闭), 由读取协程负责清理
+            self.close()
+        finally:
+            self._flusher = None
+
+
+class PubSub:
+    """
+    服务端的主题注册表: 连接通过 FRAME_SUBSCRIBE 订阅主题, 处理函数或任意线程调用 publish 推送给主题的所有订阅者
+    - 每条消息按订阅者的 variant (编解码器、压缩算法) 分组, 每组只序列化、压缩、加密一次, 同一份帧写给组内所有连接
+    - 设置了 sig_key 时推送使用服务器共享的会话加密, 持有 sig_key 的客户端都能解密
+    - 每个订阅者有 queue_size 条的推送队列, 满时按 slow_consumer 处理 (见 SlowConsumer)
+    - asyncio 引擎的订阅者总在其事件循环中写出, 从其他线程 publish 时每个事件循环只调度一次
+    计数 (写入绑定服务器的 metrics): published, pushed (进入推送的帧数), push_dropped, slow_consumers
+    多进程模式下每个 worker 进程有各自的注册表, publish 只送达本进程的订阅者
+    """
+
+    def __init__(self, queue_size: int = PUSH_QUEUE, slow_consumer: SlowConsumer = SlowConsumer.DROP_OLDEST,
+                 metrics: Optional[Metrics] = None):
+        self.queue_size = max(queue_size, 1)
+        self.slow_consumer = slow_consumer
+        self.metrics = metrics
+        self.session: Optional[SignatureSession] = None
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, metrics: Metrics, sig_key: Optional[str]):
+        """由服务器在初始化时调用: 没有指定 metrics 时使用服务器的指标, 设置了 sig_key 时创建推送用的会话"""
+        if self.metrics is None:
+            self.metrics = metrics
+        if sig_key and self.session is None:
+            self.session = SignatureSession(sig_key)
+
+    def subscribe(self, subscriber: Subscriber, topic: str):
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscriber)
+            subscriber.topics.add(topic)
+
+    def unsubscribe(self, subscriber: Subscriber, topic: str):
+        with self._lock:
+            self._discard(subscriber, topic)
+
+    def remove(self, subscriber: Subscriber):
+        """连接断开时退订它的所有主题"""
+        with self._lock:
+            for topic in list(subscriber.topics):
+                self._discard(subscriber, topic)
+
+    def _discard(self, subscriber: Subscriber, topic: str):
+        subscriber.topics.discard(topic)
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            return list(self._topics)
+
+    def subscribers(self, topic: str) -> int:
+        with self._lock:
+            return len(self._topics.get(topic, ()))
+
+    def publish(self, topic: str, message: Any) -> int:
+        """
+        向 topic 的所有订阅者推送 message (服务器配置了 codecs 时为对象, 否则为 bytes), 不等待写出
+        返回接受该消息的订阅者数 (不含因推送队列已满被丢弃的); 其他事件循环中的订阅者按已接受计
+        """
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        frames: Dict[Any, bytes] = {}
+        remote: Dict[asyncio.AbstractEventLoop, List[Subscriber]] = {}
+        delivered = 0
+        for subscriber in subscribers:
+            loop = subscriber.loop
+            if loop is not None and not _in_loop(loop):
+                remote.setdefault(loop, []).append(subscriber)
+            elif self._deliver(subscriber, topic, message, frames):
+                delivered += 1
+        for loop, group in remote.items():
+            try:
+                loop.call_soon_threadsafe(self._fan_out, group, topic, message, frames)
+            except RuntimeError:
+                # 事件循环已关闭
+                continue
+            delivered += len(group)
+        if self.metrics is not None:
+            self.metrics.inc("published")
+            self.metrics.inc("pushed", delivered)
+        return delivered
+
+    def _fan_out(self, subscribers: List[Subscriber], topic: str, message: Any, frames: Dict[Any, bytes]):
+        for subscriber in subscribers:
+            self._deliver(subscriber, topic, message, frames)
+
+    def _deliver(self, subscriber: Subscriber, topic: str, message: Any, frames: Dict[Any, bytes]) -> bool:
+        frame = frames.get(subscriber.variant)
+        if frame is None:
+            frame = frames[subscriber.variant] = self._encode(topic, message, subscriber.codec, subscriber.compressor)
+        return subscriber.offer(frame)
+
+    def _encode(self, topic: str, message: Any, codec: Any, compressor: Optional[FrameCompressor]) -> bytes:
+        data = codec.encode(message) if codec is not None else message
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise ValueError(f"推送的消息必须为 bytes, 实际为 {type(data).__name__}")
+        flags = 0
+        if compressor is not None:
+            data, flags = compressor.compress(data)
+        if self.session is not None:
+            data = self.session.encrypt(bytes(data))
+        return encode_publish(topic, bytes(data), 0, flags)
@@ -0,0 +1,244 @@
+import asyncio
+import inspect
+import re
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from ._metrics import Metrics
+
+
+# 指标名为 route_<name>, 名称可以以数字开头 (默认名称即路由 ID)
+_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+class _Timeout(TimeoutError):
+    """路由等待或执行超时, 与处理函数自己抛出的 TimeoutError 区分计数"""
+
+
+class Route:
+    """
+    一条路由: 处理函数与它的执行方式
+    - inline: 在读取连接的线程 (asyncio/selectors 为事件循环) 中直接执行, 适合廉价的处理函数
+    - executor: 交给指定的线程池执行, 昂贵的路由不占用其他路由的线程
+    - 都未指定时按引擎的默认方式执行 (asyncio/selectors 为服务器的线程池, 线程模型为连接线程)
+    - timeout: 等待并发名额与执行的总时限 (秒), 超时返回错误帧; 线程中的处理函数无法中断, 会继续执行完
+    - max_concurrency: 该路由同时执行的处理函数数, 已满时等待 (计入 timeout)
+    指标 (写入服务器的 metrics): route_<name>_requests / _errors / _timeouts 计数与 route_<name> 延迟
+    """
+
+    def __init__(self, router: "Router", route_id: Optional[int], handler: Callable, name: str, inline: bool,
+                 executor: Optional[Executor], timeout: Optional[float], max_concurrency: Optional[int]):
+        self.route_id = route_id
+        self.handler = handler
+        self.name = name
+        self.inline = inline
+        self.executor = executor
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self._router = router
+        self._metric = f"route_{name}"
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # asyncio 的信号量绑定事件循环, 在第一次使用时创建
+        self._async_slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __repr__(self):
+        return f"Route({self.route_id!r}, {self.name!r})"
+
+    def _timed_out(self, metrics: Metrics) -> TimeoutError:
+        metrics.inc(f"{self._metric}_timeouts")
+        return _Timeout(f"路由 {self.name} 处理超时 ({self.timeout} 秒)")
+
+    def call(self, data: Any, metrics: Metrics) -> Any:
+        """线程模型与 selectors 引擎: 在调用线程中执行, 指定了 executor 或 timeout 时交给线程池并等待结果"""
+        metrics.inc(f"{self._metric}_requests")
+        start = time.perf_counter()
+        slots = self._slots
+        try:
+            if slots is not None and not slots.acquire(timeout=self.timeout):
+                raise self._timed_out(metrics)
+            executor = self.executor
+            if executor is None and self.timeout is not None:
+                executor = self._router.pool()
+            if executor is None:
+                try:
+                    return self.handler(data)
+                finally:
+                    if slots is not None:
+                        slots.release()
+            try:
+                future = executor.submit(self.handler, data)
+            except BaseException:
+                if slots is not None:
+                    slots.release()
+                raise
+            if slots is not None:
+                # 超时后处理函数仍在执行, 执行完才归还并发名额
+                future.add_done_callback(lambda _: slots.release())
+            remaining = None if self.timeout is None else max(self.timeout - (time.perf_counter() - start), 0)
+            try:
+                return future.result(remaining)
+            except futures.TimeoutError:
+                future.cancel()
+                raise self._timed_out(metrics) from None
+        except _Timeout:
+            raise
+        except Exception:
+            metrics.inc(f"{self._metric}_errors")
+            raise
+        finally:
+            metrics.observe(self._metric, time.perf_counter() - start)
+
+    def _loop_slots(self) -> Optional[asyncio.Semaphore]:
+        if not self.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+            self._slots_loop = loop
+        return self._async_slots
+
+    async def call_async(self, data: Any, metrics: Metrics, pool: Callable[[], Executor],
+                         offload: bool = False) -> Any:
+        """
+        asyncio 引擎: async 处理函数与 inline 路由在事件循环中执行, 其余交给 executor (默认为 pool())
+        offload 为 True 时 (如分块流) inline 的同步处理函数也交给线程池
+        """
+        metrics.inc(f"{self._metric}_requests")
+        start = time.perf_counter()
+        slots = self._loop_slots()
+        try:
+            if slots is not None:
+                if self.timeout is None:
+                    await slots.acquire()
+                else:
+                    try:
+                        await asyncio.wait_for(slots.acquire(), self.timeout)
+                    except asyncio.TimeoutError:
+                        raise self._timed_out(metrics) from None
+            if not self.is_async and self.inline and not offload:
+                try:
+                    resp = self.handler(data)
+                    if inspect.isawaitable(resp):
+                        resp = await resp
+                    return resp
+                finally:
+                    if slots is not None:
+                        slots.release()
+            try:
+                if self.is_async:
+                    waiter = asyncio.ensure_future(self.handler(data))
+                else:
+                    future = (self.executor or pool()).submit(self.handler, data)
+                    waiter = asyncio.wrap_future(future)
+            except BaseException:
+                if slots is not None:
+                    slots.release()
+                raise
+            if slots is not None:
+                if self.is_async:
+                    waiter.add_done_callback(lambda _: slots.release())
+                else:
+                    # 超时后线程中的处理函数仍在执行, 执行完才归还并发名额
+                    loop = asyncio.get_running_loop()
+                    future.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+            if self.timeout is None:
+                return await waiter
+            remaining = max(self.timeout - (time.perf_counter() - start), 0)
+            try:
+                return await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                raise self._timed_out(metrics) from None
+        except _Timeout:
+            raise
+        except Exception:
+            metrics.inc(f"{self._metric}_errors")
+            raise
+        finally:
+            metrics.observe(self._metric, time.perf_counter() - start)
+
+
+class Router:
+    """
+    按路由 ID 分派请求, 可以代替单个处理函数传给 run()
+    客户端以 call(data, route=...) 发送的请求在帧头之后带 2 字节的路由 ID (FLAG_ROUTE),
+    服务端先按路由 ID 找到路由, 再解密、解码负载, 未注册的路由不解码负载, 直接返回错误帧
+    不带路由 ID 的请求 (包括旧版帧) 交给 default 处理函数, 没有指定时返回错误帧
+
+        router = Router()
+
+        @router.route(1, inline=True)
+        def ping(data): return data
+
+        @router.route(2, executor=ThreadPoolExecutor(4), timeout=5.0, max_concurrency=4)
+        def report(data): ...
+
+        run(address, router)
+    """
+
+    def __init__(self, default: Optional[Callable] = None, **options):
+        self._routes: Dict[int, Route] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.default: Optional[Route] = None
+        if default is not None:
+            self.default = self._make(None, default, options.pop("name", "default"), **options)
+
+    def _make(self, route_id: Optional[int], handler: Callable, name: str, inline: bool = False,
+              executor: Optional[Executor] = None, timeout: Optional[float] = None,
+              max_concurrency: Optional[int] = None) -> Route:
+        if not _NAME.match(name):
+            raise ValueError(f"路由名称只能包含字母、数字与下划线: {name!r}")
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout 必须为正数")
+        if asyncio.iscoroutinefunction(handler):
+            if executor is not None:
+                raise ValueError(f"async 处理函数不能指定 executor: {name}")
+        elif inline and (executor is not None or timeout is not None):
+            raise ValueError(f"inline 的同步处理函数在读取线程中执行, 不能指定 executor 或 timeout: {name}")
+        return Route(self, route_id, handler, name, inline, executor, timeout, max_concurrency)
+
+    def add(self, route_id: int, handler: Callable, name: Optional[str] = None, inline: bool = False,
+            executor: Optional[Executor] = None, timeout: Optional[float] = None,
+            max_concurrency: Optional[int] = None) -> Route:
+        """注册路由, name 用于日志与指标名, 默认为路由 ID"""
+        if not 0 <= route_id <= 0xFFFF:
+            raise ValueError(f"路由 ID 超出范围: {route_id}")
+        route = self._make(route_id, handler, name or str(route_id), inline, executor, timeout, max_concurrency)
+        with self._lock:
+            if route_id in self._routes:
+                raise ValueError(f"路由 {route_id} 已注册")
+            self._routes[route_id] = route
+        return route
+
+    def route(self, route_id: int, **options) -> Callable[[Callable], Callable]:
+        """装饰器形式的 add"""
+        def decorator(handler: Callable) -> Callable:
+            self.add(route_id, handler, **options)
+            return handler
+        return decorator
+
+    def find(self, route_id: Optional[int]) -> Optional[Route]:
+        if route_id is None:
+            return self.default
+        return self._routes.get(route_id)
+
+    def resolve(self, route_id: Optional[int]) -> Route:
+        route = self.find(route_id)
+        if route is None:
+            raise ValueError("请求未指定路由" if route_id is None else f"未注册的路由: {route_id}")
+        return route
+
+    def has_async(self) -> bool:
+        routes = list(self._routes.values()) + ([self.default] if self.default is not None else [])
+        return any(route.is_async for route in routes)
+
+    def pool(self) -> ThreadPoolExecutor:
+        """线程模型下指定了 timeout 而没有 executor 的路由共用的线程池"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(thread_name_prefix="muxp-route")
+            return self._pool
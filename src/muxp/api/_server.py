@@ -1,13 +1,33 @@
 import enum
+import inspect
 import logging
+import os
+import selectors
+import signal
 import socket
 import socketserver
+import ssl
 import asyncio
 import traceback
 import threading
-from typing import Tuple, Callable, Optional
+import time
+from collections import deque
+from typing import Tuple, Callable, Optional, Dict, Any, Deque, List, Sequence, NamedTuple
 from concurrent.futures import ThreadPoolExecutor
-from ..comm import Auth, encode_data, decode_data, ssl_server_context
+from ..comm import Auth, Frame, FrameDecoder, ssl_server_context
+from ..comm.security import SignatureSession
+from ..comm import encode_frame, encode_hello, decode_hello, VERSION, FRAME_DATA, FRAME_HELLO, FRAME_CHUNK
+from ..comm import FRAME_PING, FRAME_PONG, FRAME_SUBSCRIBE, FRAME_UNSUBSCRIBE, FRAME_PUBLISH, decode_publish, sendmsg_all
+from ..comm import FLAG_ERROR, FLAG_END, FLAG_COMPRESSED, FLAG_BUSY, ChunkStream, AsyncChunkStream, Compression, FrameCompressor
+from ..comm import JSONCodec, get_codec
+from ..comm._codec import resolve_codecs
+from ..comm._stream import is_stream_source, join_chunks, chunk_frames, send_stream, send_stream_async, WriteGate
+from ._metrics import Metrics, MetricsServer
+from ._handoff import Handoff
+from ._timer import TimerWheel
+from ._pubsub import PubSub, PushWorkers, ThreadSubscriber, AsyncSubscriber
+from ._router import Router, Route
+from ._cache import ResponseCache
 
 
 logger = logging.getLogger('mux')
@@ -37,12 +57,187 @@ class Mode(enum.Enum):
     THREADING = "threading"
     THREADPOOL = "threadpool"
     ASYNCIO = "asyncio"
+    SELECTORS = "selectors"
+    MULTIPROCESS = "multiprocess"
+
+class Overload(enum.Enum):
+    """
+    过载时的降级策略
+    - REJECT: 连接数达到上限时立即关闭新连接; 处理并发达到上限时请求排队等待
+    - PAUSE: 连接数达到上限时暂停接收新连接 (留在内核监听队列或不读取); 处理并发达到上限时请求排队等待
+    - BUSY: 连接数达到上限时同 REJECT; 处理并发达到上限时带流 ID 的请求立即得到 FLAG_BUSY 错误帧,
+            旧版帧无法携带错误, 仍然排队等待
+    请求排队会占满单连接的在途上限 (concurrency), 进而暂停读取该连接, 由 TCP 对客户端形成背压
+    """
+    REJECT = "reject"
+    PAUSE = "pause"
+    BUSY = "busy"
 
 ###############################################################################
 # 常量
 ###############################################################################
 
 MAX_BUFFER_SIZE = 4 * 1024 * 1024  # 最大缓冲区，防止 buffer 攻击
+DRAIN_TIMEOUT = 10.0  # 优雅排空时等待在途请求完成的默认时长 (秒)
+# 排空时还没有收到过数据的新连接的宽限期 (秒): 刚 accept 的连接上请求通常正在路上, 立即关闭会丢掉它
+NEW_CONN_GRACE = 1.0
+# 空闲淘汰: 超过 IDLE_TIMEOUT 秒没有收发数据且没有在途请求的连接被关闭, 由每个服务器的一个时间轮每 IDLE_TICK 秒检查一次;
+# 客户端的心跳 (FRAME_PING) 使长连接保持活跃
+IDLE_TIMEOUT = 60.0
+IDLE_TICK = 1.0
+
+###############################################################################
+# 帧处理
+###############################################################################
+
+class Negotiated(NamedTuple):
+    """HELLO 协商出的连接参数, 未发送 HELLO 的连接使用服务端的默认值"""
+    compressor: Optional[FrameCompressor] = None
+    codec: Any = None  # 服务端配置了 codecs 时处理函数收发对象, 由该编解码器与 bytes 互相转换
+
+def server_hello(payload, compression: Optional[Compression] = None,
+                 codecs: Optional[List[str]] = None, idle_timeout: Optional[float] = None) -> Tuple[bytes, Negotiated]:
+    """
+    响应客户端的 HELLO 协商帧, 返回 (应答帧, 该连接的协商结果)
+    编解码器取客户端候选列表中第一个服务端也支持的, 没有交集时使用 JSONCodec
+    应答中的 ping 表示支持心跳帧, idle_timeout 供客户端选择不超过它的心跳间隔
+    """
+    options = decode_hello(payload)
+    logger.debug(f"[*] 客户端协商: {options}")
+    answer: Dict[str, Any] = {"version": VERSION, "ping": True}
+    if idle_timeout:
+        answer["idle_timeout"] = idle_timeout
+    compressor = codec = None
+    if compression is not None:
+        chosen, compressor = compression.accept(options)
+        answer.update(chosen)
+    if codecs is not None:
+        offered = options.get("codecs")
+        name = next((n for n in offered if n in codecs), "json") if isinstance(offered, list) else "json"
+        codec = JSONCodec if name == "json" else get_codec(name)
+        answer["codec"] = name
+    return encode_hello(answer), Negotiated(compressor, codec)
+
+def reply_frame(frame: Frame, resp: Optional[bytes], flags: int = 0) -> Optional[bytes]:
+    """按请求帧的格式编码响应; 带流 ID 的请求总会得到响应, 以便客户端完成对应的 Future"""
+    if frame.stream_id is None:
+        return None if resp is None else encode_frame(resp)
+    return encode_frame(resp or b"", frame.stream_id, flags=flags)
+
+def inflate(frame: Frame, data, compressor: Optional[FrameCompressor]):
+    """请求带压缩标志时解压负载 (发送方先压缩再加密, 这里在解密之后调用)"""
+    if not frame.flags & FLAG_COMPRESSED:
+        return data
+    if compressor is None:
+        raise ValueError("连接未协商压缩, 却收到了压缩帧")
+    return compressor.decompress(data)
+
+def deflate(frame: Frame, resp: Optional[bytes], compressor: Optional[FrameCompressor]) -> Tuple[Optional[bytes], int]:
+    """协商了压缩时按阈值压缩 v2 帧的响应, 返回 (负载, 帧标志); 旧版帧没有标志位, 不压缩"""
+    if compressor is None or frame.stream_id is None or not resp:
+        return resp, 0
+    return compressor.compress(resp)
+
+def error_frame(frame: Frame, exc: Exception) -> Optional[bytes]:
+    if frame.stream_id is None:
+        return None
+    return encode_frame(str(exc).encode('utf-8'), frame.stream_id, flags=FLAG_ERROR)
+
+def busy_frame(frame: Frame) -> bytes:
+    """处理并发已满时的快速拒绝, 只用于带流 ID 的请求"""
+    return encode_frame("服务端繁忙".encode('utf-8'), frame.stream_id, flags=FLAG_ERROR | FLAG_BUSY)
+
+def pong_frame(frame: Frame) -> bytes:
+    """心跳应答, 原样带回 PING 的负载"""
+    return encode_frame(bytes(frame.payload), 0, FRAME_PONG)
+
+PUBSUB_FRAMES = (FRAME_SUBSCRIBE, FRAME_UNSUBSCRIBE, FRAME_PUBLISH)
+
+def pubsub_topic(frame: Frame) -> str:
+    """FRAME_SUBSCRIBE/FRAME_UNSUBSCRIBE 的主题名"""
+    topic = bytes(frame.payload).decode('utf-8')
+    if not topic:
+        raise ValueError("主题名不能为空")
+    return topic
+
+class ResponseSequencer:
+    """
+    单连接并发处理时的响应写回顺序控制
+    - 旧版帧没有关联 ID, 响应必须按请求顺序写回, 先完成的结果暂存直到轮到它
+    - 带流 ID 的帧由客户端自行匹配, 完成即写回
+    """
+
+    def __init__(self, write: Callable[[bytes], Any]):
+        self._write = write
+        self.lock = threading.RLock()  # 分块流的发送方也持有该锁逐块写出
+        self._next_seq = 0
+        self._flush_seq = 0
+        self._done: Dict[int, Optional[bytes]] = {}
+
+    def reserve(self, frame: Frame) -> Optional[int]:
+        """在读取端按到达顺序为请求分配序号"""
+        if frame.stream_id is not None:
+            return None
+        seq = self._next_seq
+        self._next_seq += 1
+        return seq
+
+    def write(self, out: bytes):
+        with self.lock:
+            self._write(out)
+
+    def complete(self, seq: Optional[int], out: Optional[bytes]):
+        with self.lock:
+            if seq is None:
+                if out is not None:
+                    self._write(out)
+                return
+            self._done[seq] = out
+            while self._flush_seq in self._done:
+                out = self._done.pop(self._flush_seq)
+                self._flush_seq += 1
+                if out is not None:
+                    self._write(out)
+
+def loop_safe(func: Callable) -> Callable:
+    """
+    标记同步处理函数可以直接在事件循环中执行 (不阻塞且耗时极短)
+    Mode.ASYNCIO 下未标记的同步处理函数会派发到线程池执行
+    """
+    func.__muxp_loop_safe__ = True
+    return func
+
+###############################################################################
+# 指标
+###############################################################################
+
+class MetricsMixIn:
+    """
+    各引擎共用的指标接口, 计数与延迟写入 self.metrics (见 Metrics)
+    - 计数: connections_accepted/closed, frames_in/out, bytes_in/out (帧的明文字节数), errors,
+      pings (收到的心跳), idle_evicted (空闲淘汰的连接)
+    - 延迟: decode (解密+解压+反序列化), handler, encode (序列化+压缩+加密),
+      queue_wait (帧在处理线程池中的排队时间), write (写出或等待写缓冲排空)
+    - gauge: connections_active
+    """
+    
+    metrics: Metrics
+    
+    def _init_metrics(self, metrics: Optional[Metrics]):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.gauge("connections_active", self._active_connections)
+    
+    def _active_connections(self) -> int:
+        counters = self.metrics.counters()
+        return counters.get("connections_accepted", 0) - counters.get("connections_closed", 0)
+    
+    def stats(self) -> Dict[str, Any]:
+        """当前指标快照: counters、gauges 与各阶段延迟的分位数 (毫秒)"""
+        return self.metrics.snapshot()
+    
+    def serve_metrics(self, address: Tuple[str, int]) -> MetricsServer:
+        """在本地端口上提供 Prometheus 文本格式的 /metrics 与 JSON 格式的 /stats"""
+        return self.metrics.serve(address, self.stats)
 
 ###############################################################################
 # 通用请求处理器
@@ -53,67 +248,499 @@ class MuxHandler(socketserver.BaseRequestHandler):
     
     def setup(self):
         sock = self.request
-        sock.settimeout(30)
+        # 不设读超时, 空闲连接由服务器的时间轮统一淘汰 (见 BaseMuxpServer.idle_timeout)
+        sock.settimeout(None)
         sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # 设置了 sig_key 时每条连接一个加密会话, 对处理函数透明
+        self.session = SignatureSession(self.server.sig_key) if self.server.sig_key else None
+        self.negotiated: Negotiated = self.server.default_negotiated  # HELLO 协商后更新
+        self.metrics: Metrics = self.server.metrics
+        self.metrics.inc("connections_accepted")
+        self.fresh = True  # 还没有收到过请求 (HELLO 之后客户端紧接着发送请求, 此时关闭会丢掉它)
+        self.since = time.monotonic()
+        self.stopped = False
+        self.closed = False
+        self.last_active = self.since  # 最近一次收到或写出数据的时间
+        self.busy = 0                  # 正在执行的处理函数数
+        self._busy_lock = threading.Lock()
+        self.subscriber: Optional[ThreadSubscriber] = None  # 第一次订阅时创建
+        self.server._register_conn(self)
+    
+    def finish(self):
+        self.closed = True
+        if self.subscriber is not None:
+            self.subscriber.close()
+        self.server._unregister_conn(self)
+        self.metrics.inc("connections_closed")
+    
+    def stop_reading(self):
+        """
+        排空: 关闭读方向, 阻塞在 recv 上的读取立即返回, 已读到的帧处理完并写回后连接退出
+        直接调用 socket.socket.shutdown, SSLSocket.shutdown 会丢弃 TLS 状态导致无法写回响应
+        """
+        self.stopped = True
+        try:
+            socket.socket.shutdown(self.request, socket.SHUT_RD)
+        except OSError:
+            pass
+    
+    def abort(self):
+        try:
+            socket.socket.shutdown(self.request, socket.SHUT_RDWR)
+        except OSError:
+            pass
+    
+    def _write(self, out: bytes):
+        start = time.perf_counter()
+        self.request.sendall(out)
+        self.last_active = time.monotonic()
+        metrics = self.metrics
+        metrics.observe("write", time.perf_counter() - start)
+        metrics.inc("frames_out")
+        metrics.inc("bytes_out", len(out))
     
     def handle(self):
         sock = self.request
-        buffer = b""
+        metrics = self.metrics
+        decoder = FrameDecoder(MAX_BUFFER_SIZE)
+        sequencer = ResponseSequencer(self._write)
+        self.sequencer = sequencer
+        limit = self.server.concurrency
+        # concurrency > 1 时同一连接上最多 limit 帧并行交给处理线程池
+        inflight = threading.BoundedSemaphore(limit) if limit > 1 else None
+        streams: Dict[int, ChunkStream] = {}
         
-        while True:
-            try:
-                data = sock.recv(4096)
-                if not data:
+        try:
+            while True:
+                try:
+                    n = decoder.recv_into(sock)
+                    if not n:
+                        break
+                    self.last_active = time.monotonic()
+                    metrics.inc("bytes_in", n)
+                    for frame in decoder.frames():
+                        metrics.inc("frames_in")
+                        if frame.kind == FRAME_HELLO:
+                            out, self.negotiated = server_hello(frame.payload, self.server.compression,
+                                                                self.server.codecs, self.server.idle_timeout)
+                            sequencer.write(out)
+                            continue
+                        if frame.kind == FRAME_PING:
+                            metrics.inc("pings")
+                            sequencer.write(pong_frame(frame))
+                            continue
+                        self.fresh = False
+                        if frame.kind == FRAME_CHUNK:
+                            self._on_chunk(frame, streams)
+                            continue
+                        if frame.kind in PUBSUB_FRAMES:
+                            sequencer.write(self._on_pubsub(frame))
+                            continue
+                        if frame.kind != FRAME_DATA:
+                            continue
+                        job = frame._replace(payload=bytes(frame.payload))
+                        seq = sequencer.reserve(job)
+                        if inflight is None:
+                            sequencer.complete(seq, self.process(job))
+                            continue
+                        inflight.acquire()
+                        self.server.handler_pool().submit(self._process_job, job, seq, sequencer, inflight,
+                                                          time.perf_counter())
+                except (ConnectionResetError, BrokenPipeError):
                     break
-                buffer += data
-                if len(buffer) > MAX_BUFFER_SIZE:
-                    logger.warning("[!] buffer too large, closing")
+                except ValueError as e:
+                    logger.warning(f"[!] 帧格式错误, 关闭连接: {e}")
                     break
-                msgs, buffer = decode_data(buffer)
-                for msg in msgs:
-                    try:
-                        resp = self.server.handle_message(msg)
-                        if resp is not None:
-                            sock.sendall(encode_data(resp))
-                    except Exception as be:
-                        logger.error(f"[业务异常] {be}")
-                        traceback.print_exc()
-            except socket.timeout:
-                break
-            except ConnectionResetError:
-                break
-            except Exception as e:
-                logger.error(f"[socket error] {e}")
-                traceback.print_exc()
-                break
+                except Exception as e:
+                    logger.error(f"[socket error] {e}")
+                    traceback.print_exc()
+                    break
+        finally:
+            for stream in streams.values():
+                stream.abort(ConnectionError("连接已断开"))
+            if inflight is not None:
+                # 等待在途帧处理并写回后再关闭连接
+                for _ in range(limit):
+                    inflight.acquire()
+    
+    def _on_chunk(self, frame: Frame, streams: Dict[int, ChunkStream]):
+        """
+        分块流: 首块到达时把流交给处理线程池中的处理函数, 之后的分块放入流中
+        流中未消费的分块达到上限时 put 阻塞当前连接的读取, 对发送方形成背压
+        """
+        stream = streams.get(frame.stream_id)
+        if stream is None:
+            stream = ChunkStream(unseal=self.session.decrypt if self.session else None)
+            streams[frame.stream_id] = stream
+            self.server.handler_pool().submit(self._process_stream, frame._replace(payload=b""), stream)
+        if frame.flags & FLAG_ERROR:
+            stream.abort(ConnectionError(f"发送方中止了流: {bytes(frame.payload).decode('utf-8', 'replace')}"))
+        elif len(frame.payload):
+            stream.put(bytes(frame.payload))
+        if frame.flags & (FLAG_END | FLAG_ERROR):
+            stream.end()
+            del streams[frame.stream_id]
+    
+    def _on_pubsub(self, frame: Frame) -> bytes:
+        """订阅、退订与客户端发布在读取线程中直接完成, 确认帧与普通响应一样加密"""
+        pubsub = self.server.pubsub
+        try:
+            resp = b""
+            if frame.kind == FRAME_PUBLISH:
+                topic, data = decode_publish(frame.payload)
+                data = bytes(data)
+                if self.session is not None:
+                    data = self.session.decrypt(data)
+                data = inflate(frame, data, self.negotiated.compressor)
+                if self.negotiated.codec is not None:
+                    data = self.negotiated.codec.decode(data)
+                resp = str(pubsub.publish(topic, data)).encode('utf-8')
+            elif frame.kind == FRAME_SUBSCRIBE:
+                if self.subscriber is None:
+                    self.subscriber = ThreadSubscriber(pubsub, self.negotiated.codec, self.negotiated.compressor,
+                                                       self._push, self.abort, self.metrics, self.server.push_pool)
+                pubsub.subscribe(self.subscriber, pubsub_topic(frame))
+            elif self.subscriber is not None:
+                pubsub.unsubscribe(self.subscriber, pubsub_topic(frame))
+            if self.session is not None:
+                resp = self.session.encrypt(resp)
+            return reply_frame(frame, resp)
+        except Exception as e:
+            self.metrics.inc("errors")
+            logger.error(f"[订阅异常] {e}")
+            return error_frame(frame, e)
+    
+    def _push(self, frames: List[bytes]):
+        """由推送线程池调用, 与响应共用写锁"""
+        start = time.perf_counter()
+        with self.sequencer.lock:
+            sent = sendmsg_all(self.request, frames)
+        self.last_active = time.monotonic()
+        metrics = self.metrics
+        metrics.observe("write", time.perf_counter() - start)
+        metrics.inc("frames_out", len(frames))
+        metrics.inc("bytes_out", sent)
+    
+    def process(self, frame: Frame, stream: Optional[ChunkStream] = None) -> Optional[bytes]:
+        # 处理函数执行期间连接不算空闲, 即使很久没有收发数据
+        with self._busy_lock:
+            self.busy += 1
+        try:
+            return self._admit(frame, stream)
+        finally:
+            with self._busy_lock:
+                self.busy -= 1
+                self.last_active = time.monotonic()
+    
+    def _admit(self, frame: Frame, stream: Optional[ChunkStream] = None) -> Optional[bytes]:
+        slots = self.server.handler_slots
+        if slots is None:
+            return self._process(frame, stream)
+        busy = self.server.overload == Overload.BUSY and frame.stream_id is not None
+        if not slots.acquire(blocking=not busy):
+            self.metrics.inc("busy")
+            return busy_frame(frame)
+        try:
+            return self._process(frame, stream)
+        finally:
+            slots.release()
+    
+    def _process(self, frame: Frame, stream: Optional[ChunkStream] = None) -> Optional[bytes]:
+        metrics = self.metrics
+        cache = self.server.cache
+        flight = None  # 响应缓存的查询结果, 未命中时本请求负责计算并填充缓存
+        try:
+            # 先按帧头中的路由 ID 找到路由, 未注册的路由不解码负载
+            route = self.server.router.resolve(frame.route) if self.server.router is not None else None
+            if stream is not None:
+                data = stream
+            else:
+                start = time.perf_counter()
+                data = frame.payload
+                if self.session is not None:
+                    data = self.session.decrypt(data)
+                if cache is not None:
+                    flight = cache.claim(cache.frame_key(frame, data, self.negotiated.codec, self.negotiated.compressor))
+                if flight is None or not flight.hit:
+                    data = inflate(frame, data, self.negotiated.compressor)
+                    if self.negotiated.codec is not None:
+                        data = self.negotiated.codec.decode(data)
+                    if cache is not None and flight is None:
+                        flight = cache.claim(cache.data_key(frame.route, data))
+                metrics.observe("decode", time.perf_counter() - start)
+            if flight is not None and flight.hit:
+                resp = flight.value
+            else:
+                start = time.perf_counter()
+                resp = route.call(data, metrics) if route is not None else self.server.handle_message(data)
+                metrics.observe("handler", time.perf_counter() - start)
+                if flight is not None:
+                    flight.complete(resp)
+            if is_stream_source(resp):
+                return self._reply_stream(frame, resp)
+            start = time.perf_counter()
+            if self.negotiated.codec is not None and resp is not None:
+                resp = self.negotiated.codec.encode(resp)
+            resp, flags = deflate(frame, resp, self.negotiated.compressor)
+            if self.session is not None and resp is not None:
+                resp = self.session.encrypt(resp)
+            metrics.observe("encode", time.perf_counter() - start)
+            return reply_frame(frame, resp, flags)
+        except Exception as be:
+            if flight is not None:
+                flight.fail(be)
+            metrics.inc("errors")
+            logger.error(f"[业务异常] {be}")
+            traceback.print_exc()
+            return error_frame(frame, be)
+        finally:
+            if flight is not None:
+                flight.abandon()
+    
+    def _reply_stream(self, frame: Frame, source) -> Optional[bytes]:
+        """处理函数返回文件对象或迭代器时以分块流写回; 旧版帧不支持分块, 拼接成一条消息"""
+        seal = self.session.encrypt if self.session is not None else None
+        if frame.stream_id is None:
+            resp = join_chunks(source)
+            return reply_frame(frame, seal(resp) if seal else resp)
+        send_stream(self.request, self.sequencer.lock, frame.stream_id, source, seal=seal)
+        return None
+    
+    def _process_stream(self, frame: Frame, stream: ChunkStream):
+        try:
+            out = self.process(frame, stream)
+            if out is not None:
+                self.sequencer.write(out)
+        except OSError:
+            pass
+        finally:
+            # 处理函数没有读完的分块直接丢弃, 读取端不再阻塞
+            stream.close()
+    
+    def _process_job(self, frame: Frame, seq: Optional[int], sequencer: ResponseSequencer,
+                     inflight: threading.BoundedSemaphore, queued: float):
+        self.metrics.observe("queue_wait", time.perf_counter() - queued)
+        try:
+            sequencer.complete(seq, self.process(frame))
+        except OSError:
+            # 连接已断开, 由读取端负责退出
+            pass
+        finally:
+            inflight.release()
 
 ###############################################################################
 # 基础服务器类
 ###############################################################################
 
-class BaseMuxpServer:
+class BaseMuxpServer(MetricsMixIn):
     """所有服务器实现的公共基类"""
     
     allow_reuse_address = True
+    concurrency = 1        # 单连接上并行处理的最大帧数, 1 表示逐帧顺序处理
+    handler_workers = 64   # concurrency > 1 时帧处理线程池的大小
+    handshake_timeout = 10.0  # TLS 握手超时, 握手在连接的工作线程中进行, 不阻塞 accept
+    push_workers = 16      # 向订阅者写出推送的线程池大小, 写给慢连接的线程会阻塞到对端读走数据
     
-    def __init__(self, addr, handler_func: Callable, auth: Optional[Auth] = None):
+    def __init__(self, addr, handler_func: Callable, auth: Optional[Auth] = None, concurrency: int = 1,
+                 sig_key: Optional[str] = None, sock: Optional[socket.socket] = None, reuse_port: bool = False,
+                 compression: Optional[Compression] = None, codecs: Optional[Sequence[str]] = None,
+                 metrics: Optional[Metrics] = None, max_handlers: Optional[int] = None,
+                 overload: Overload = Overload.REJECT, idle_timeout: Optional[float] = IDLE_TIMEOUT,
+                 pubsub: Optional[PubSub] = None, cache: Optional[ResponseCache] = None):
+        self.router = handler_func if isinstance(handler_func, Router) else None
+        if asyncio.iscoroutinefunction(handler_func) or (self.router is not None and self.router.has_async()):
+            raise ValueError("async 处理函数仅支持 Mode.ASYNCIO")
         self.auth = auth
         self.handle_message = handler_func
+        self.overload = overload
+        # 所有连接共享的处理并发上限, None 表示不限制
+        self.handler_slots = threading.BoundedSemaphore(max_handlers) if max_handlers else None
+        self.concurrency = max(concurrency, 1)
+        self.sig_key = sig_key
+        self.compression = compression
+        self.codecs = resolve_codecs(codecs)
+        self.default_negotiated = Negotiated(codec=JSONCodec if self.codecs is not None else None)
+        self._init_metrics(metrics)
+        self.reuse_port = reuse_port
+        self._listen_sock = sock  # 多进程模式下从父进程继承 (或热重启时从旧进程接管) 的监听 socket
+        self._handler_pool: Optional[ThreadPoolExecutor] = None
+        self._handler_pool_lock = threading.Lock()
+        self._conns: set = set()  # 活动连接的 MuxHandler, 排空时逐个关闭
+        self._conns_changed = threading.Condition()
+        self._draining = False
+        self._drained = threading.Event()
+        # 空闲淘汰的时间轮由 serve_forever 的轮询 (service_actions) 推进, 为 None 时不淘汰
+        self.idle_timeout = idle_timeout
+        self._idle_wheel = TimerWheel(IDLE_TICK) if idle_timeout else None
+        # 发布/订阅: 不指定时每个服务器一个注册表, 处理函数可通过 server.publish 或共享的 PubSub 推送
+        self.pubsub = pubsub if pubsub is not None else PubSub()
+        self.pubsub.bind(self.metrics, sig_key)
+        self._push_pool: Optional[PushWorkers] = None
+        # 幂等处理函数的响应缓存, 为 None 时不缓存
+        self.cache = cache
+        if cache is not None:
+            cache.bind(self.metrics)
         super().__init__(addr, MuxHandler)
     
+    def _register_conn(self, handler: MuxHandler):
+        with self._conns_changed:
+            self._conns.add(handler)
+        if self._idle_wheel is not None:
+            self._idle_wheel.schedule(handler, self.idle_timeout)
+    
+    def _unregister_conn(self, handler: MuxHandler):
+        if self._idle_wheel is not None:
+            self._idle_wheel.discard(handler)
+        with self._conns_changed:
+            self._conns.discard(handler)
+            self._conns_changed.notify_all()
+    
+    def service_actions(self):
+        super().service_actions()
+        wheel = self._idle_wheel
+        if wheel is None:
+            return
+        now = time.monotonic()
+        for handler in wheel.advance(now):
+            if handler.closed:
+                continue
+            idle = now - handler.last_active
+            if handler.busy or idle < self.idle_timeout:
+                wheel.schedule(handler, self.idle_timeout - idle if not handler.busy else self.idle_timeout)
+                continue
+            self.metrics.inc("idle_evicted")
+            logger.debug(f"[*] 连接 {handler.client_address} 空闲 {idle:.0f} 秒, 关闭")
+            # 读取端的 recv 返回空, 连接线程随之退出
+            handler.abort()
+    
+    def serve_forever(self, poll_interval: float = 0.5):
+        super().serve_forever(poll_interval)
+        if self._draining:
+            self._drained.wait()
+    
+    def begin_drain(self, timeout: float):
+        """在后台线程中排空 (见 drain), 可在信号处理函数中调用"""
+        threading.Thread(target=self.drain, args=(timeout,), name="muxp-drain", daemon=True).start()
+    
+    def drain(self, timeout: float):
+        """
+        优雅排空: 停止 accept 并关闭监听 socket, 关闭所有连接的读方向; 空闲连接立即退出,
+        处理中的连接写回在途帧的响应后退出, 超过 timeout 秒仍未退出的连接被强制关闭
+        不能在运行 serve_forever 的线程中调用, serve_forever 在排空结束后返回
+        """
+        with self._conns_changed:
+            if self._draining:
+                return
+            self._draining = True
+            count = len(self._conns)
+        logger.info(f"[*] 开始排空: 停止接收新连接, 等待 {count} 条连接结束 (最长 {timeout} 秒)")
+        deadline = time.monotonic() + timeout
+        try:
+            self._stop_accepting()
+            while True:
+                now = time.monotonic()
+                with self._conns_changed:
+                    conns = list(self._conns)
+                if not conns or now >= deadline:
+                    break
+                # 包括排空开始后才从线程池中取出的连接; 新连接等到收到数据或超过宽限期
+                for handler in conns:
+                    if not handler.stopped and (not handler.fresh or now - handler.since >= NEW_CONN_GRACE):
+                        handler.stop_reading()
+                with self._conns_changed:
+                    self._conns_changed.wait_for(lambda: not self._conns, min(deadline - now, 0.05))
+            with self._conns_changed:
+                remaining = list(self._conns)
+            if remaining:
+                logger.warning(f"[!] 排空超时, 强制关闭 {len(remaining)} 条连接")
+                self.metrics.inc("drain_aborted", len(remaining))
+                for handler in remaining:
+                    handler.abort()
+            logger.info("[*] 排空完成")
+        finally:
+            self._drained.set()
+    
+    def _stop_accepting(self):
+        socketserver.BaseServer.shutdown(self)
+        # 监听 socket 已交给新进程时对方持有副本, 监听队列中的连接由新进程 accept
+        self.socket.close()
+    
+    def handler_pool(self) -> ThreadPoolExecutor:
+        """帧级任务线程池, 与连接线程分开, 避免连接占满线程后帧任务无法执行"""
+        if self._handler_pool is None:
+            with self._handler_pool_lock:
+                if self._handler_pool is None:
+                    self._handler_pool = ThreadPoolExecutor(max_workers=self.handler_workers,
+                                                            thread_name_prefix="muxp-handler")
+        return self._handler_pool
+    
+    def push_pool(self) -> PushWorkers:
+        """写出订阅推送的线程池, 与帧处理线程池分开, 慢订阅者不会占用处理请求的线程"""
+        if self._push_pool is None:
+            with self._handler_pool_lock:
+                if self._push_pool is None:
+                    self._push_pool = PushWorkers(self.push_workers)
+        return self._push_pool
+    
+    def publish(self, topic: str, message: Any) -> int:
+        """向订阅了 topic 的所有连接推送 message, 返回接受推送的订阅者数, 见 PubSub.publish"""
+        return self.pubsub.publish(topic, message)
+    
+    def server_close(self):
+        if self._handler_pool:
+            self._handler_pool.shutdown(wait=False)
+            self._handler_pool = None
+        if self._push_pool:
+            self._push_pool.shutdown()
+            self._push_pool = None
+        super().server_close()
+    
     def server_bind(self):
-        ctx = ssl_server_context(self.auth)
+        # 监听 socket 保持为普通 socket, accept 只完成 TCP 连接, TLS 握手推迟到 finish_request
+        self.ssl_ctx = ssl_server_context(self.auth) if self.auth else None
+        if self._listen_sock is not None:
+            self.socket = self._listen_sock
+            self.server_address = self.socket.getsockname()
+            return
         raw = socket.socket(self.address_family, self.socket_type)
         raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         
         if hasattr(socket, 'SO_KEEPALIVE'):
             raw.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if self.reuse_port:
+            raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         
-        self.socket = raw if not self.auth else ctx.wrap_socket(raw, server_side=True)
+        self.socket = raw
         self.socket.bind(self.server_address)
         self.socket.listen(self.request_queue_size)
         self.server_address = self.socket.getsockname()
+    
+    def finish_request(self, request, client_address):
+        """在连接的工作线程中执行: 先完成 TLS 握手 (有独立的超时), 再交给 MuxHandler"""
+        if self.ssl_ctx is None:
+            return super().finish_request(request, client_address)
+        start = time.perf_counter()
+        try:
+            request.settimeout(self.handshake_timeout)
+            tls = self.ssl_ctx.wrap_socket(request, server_side=True, do_handshake_on_connect=False)
+        except OSError as e:
+            self.metrics.inc("tls_handshake_failed")
+            logger.debug(f"[*] 连接 {client_address} 已断开: {e}")
+            return
+        try:
+            tls.do_handshake()
+        except (OSError, ValueError) as e:
+            # 包括 socket.timeout 与 ssl.SSLError; wrap_socket 已接管文件描述符, 原 socket 的关闭不再生效
+            self.metrics.inc("tls_handshake_failed")
+            logger.debug(f"[*] 连接 {client_address} TLS 握手失败: {e}")
+            self.shutdown_request(tls)
+            return
+        self.metrics.observe("tls_handshake", time.perf_counter() - start)
+        try:
+            super().finish_request(tls, client_address)
+        finally:
+            self.shutdown_request(tls)
 
 ###############################################################################
 # 1) ThreadingMixIn 服务器
@@ -124,8 +751,14 @@ class ThreadingMuxpServer(socketserver.ThreadingMixIn, BaseMuxpServer, socketser
     
     daemon_threads = True
     
-    def __init__(self, addr, handler_func: Callable, auth: Optional[Auth] = None):
-        super().__init__(addr, handler_func, auth)
+    def __init__(self, addr, handler_func: Callable, auth: Optional[Auth] = None, concurrency: int = 1,
+                 sig_key: Optional[str] = None, sock: Optional[socket.socket] = None, reuse_port: bool = False,
+                 compression: Optional[Compression] = None, codecs: Optional[Sequence[str]] = None,
+                 metrics: Optional[Metrics] = None, max_handlers: Optional[int] = None,
+                 overload: Overload = Overload.REJECT, idle_timeout: Optional[float] = IDLE_TIMEOUT,
+                 pubsub: Optional[PubSub] = None, cache: Optional[ResponseCache] = None):
+        super().__init__(addr, handler_func, auth, concurrency, sig_key, sock, reuse_port, compression, codecs,
+                         metrics, max_handlers, overload, idle_timeout, pubsub, cache)
         logger.info(f"[*] ThreadingMixIn 服务器已初始化，最大线程数受限于系统")
 
 ###############################################################################
@@ -133,14 +766,20 @@ class ThreadingMuxpServer(socketserver.ThreadingMixIn, BaseMuxpServer, socketser
 ###############################################################################
 
 class ThreadPoolMixIn:
-    """使用 ThreadPoolExecutor 处理请求"""
+    """
+    使用 ThreadPoolExecutor 处理请求
+    排队与处理中的连接数达到 max_pending 时按 overload 策略降级:
+    REJECT/BUSY 立即关闭新连接, PAUSE 暂停 accept 直到有连接结束
+    """
     
     max_workers = 200
     max_pending = 1000
+    overload = Overload.REJECT
     _pool: Optional[ThreadPoolExecutor] = None
     _pool_lock = threading.Lock()
     _pending_count = 0
-    _pending_lock = threading.Lock()
+    _pending_lock = threading.Condition()
+    _closing = False
     
     def _ensure_pool(self):
         if self._pool is None:
@@ -151,19 +790,27 @@ class ThreadPoolMixIn:
     
     def process_request(self, request, client_address):
         with self._pending_lock:
+            if self._pending_count >= self.max_pending and self.overload == Overload.PAUSE:
+                # 阻塞 accept 线程, 之后的新连接留在内核监听队列中
+                self.metrics.inc("accept_paused")
+                while self._pending_count >= self.max_pending and not self._closing:
+                    self._pending_lock.wait(0.5)
             if self._pending_count >= self.max_pending:
                 try:
                     request.close()
                 except:
                     pass
+                self.metrics.inc("connections_rejected")
                 logger.warning(f"[!] 连接队列已满，拒绝连接 {client_address}")
                 return
             self._pending_count += 1
         
         self._ensure_pool()
-        self._pool.submit(self._process_request_worker, request, client_address)
+        self._pool.submit(self._process_request_worker, request, client_address, time.perf_counter())
     
-    def _process_request_worker(self, request, client_address):
+    def _process_request_worker(self, request, client_address, queued: float):
+        # 连接在线程池中的排队时间, 与帧级的 queue_wait 分开统计
+        self.metrics.observe("conn_queue_wait", time.perf_counter() - queued)
         try:
             self.finish_request(request, client_address)
         except Exception:
@@ -174,6 +821,7 @@ class ThreadPoolMixIn:
         finally:
             with self._pending_lock:
                 self._pending_count -= 1
+                self._pending_lock.notify()
             try:
                 self.shutdown_request(request)
             except Exception:
@@ -193,7 +841,15 @@ class ThreadPoolMixIn:
         except AttributeError:
             pass
     
+    def _stop_accepting(self):
+        # 唤醒因 PAUSE 策略阻塞在 process_request 中的 accept 线程
+        self._closing = True
+        with self._pending_lock:
+            self._pending_lock.notify_all()
+        super()._stop_accepting()
+    
     def shutdown(self):
+        self._closing = True
         try:
             super().shutdown()
         except AttributeError:
@@ -204,94 +860,1505 @@ class ThreadPoolMixIn:
 class ThreadPoolMuxpServer(ThreadPoolMixIn, BaseMuxpServer, socketserver.TCPServer):
     """使用线程池的服务器"""
     
-    def __init__(self, addr, handler_func: Callable, auth: Optional[Auth] = None):
-        super().__init__(addr, handler_func, auth)
+    def __init__(self, addr, handler_func: Callable, auth: Optional[Auth] = None, max_workers: Optional[int] = None,
+                 concurrency: int = 1, sig_key: Optional[str] = None, sock: Optional[socket.socket] = None,
+                 reuse_port: bool = False, compression: Optional[Compression] = None,
+                 codecs: Optional[Sequence[str]] = None, metrics: Optional[Metrics] = None,
+                 max_pending: Optional[int] = None, max_handlers: Optional[int] = None,
+                 overload: Overload = Overload.REJECT, idle_timeout: Optional[float] = IDLE_TIMEOUT,
+                 pubsub: Optional[PubSub] = None, cache: Optional[ResponseCache] = None):
+        if max_workers:
+            self.max_workers = max_workers
+        if max_pending:
+            self.max_pending = max_pending
+        super().__init__(addr, handler_func, auth, concurrency, sig_key, sock, reuse_port, compression, codecs,
+                         metrics, max_handlers, overload, idle_timeout, pubsub, cache)
+        self.metrics.gauge("connections_pending", lambda: self._pending_count)
         logger.info(f"[*] ThreadPool 服务器已初始化，最大线程数: {self.max_workers}, 最大等待队列: {self.max_pending}")
 
 ###############################################################################
 # 3) asyncio + TLS 服务器（高性能）
 ###############################################################################
 
-class AsyncioMuxpServer:
-    """异步高性能服务端，可选 TLS/纯 TCP"""
+class _Closing(ConnectionAbortedError):
+    """排空或空闲淘汰时注入空闲连接的 StreamReader, 使读取循环退出"""
+
+class _AsyncConn:
+    """asyncio 引擎中一条连接的排空与空闲淘汰相关状态"""
+    
+    __slots__ = ("reader", "writer", "tasks", "reading", "fresh", "since", "paused", "last_active", "subscriber")
     
-    def __init__(self, addr: Tuple[str, int], handler_func: Callable, auth: Optional[Auth] = None):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, tasks: set):
+        self.reader = reader
+        self.writer = writer
+        self.tasks = tasks     # 在途的帧处理任务
+        self.reading = False   # 读取循环正等待新数据 (没有正在顺序处理的帧)
+        self.fresh = True      # 还没有收到过请求 (HELLO 不算)
+        self.since = time.monotonic()
+        self.paused = False    # 排空中已停止从 socket 读取
+        self.last_active = self.since  # 最近一次收到或写出数据的时间
+        self.subscriber: Optional[AsyncSubscriber] = None  # 第一次订阅时创建
+    
+    def pause(self, now: float):
+        """排空: 新连接等到收到数据或超过宽限期后再停止读取"""
+        if not self.paused and (not self.fresh or now - self.since >= NEW_CONN_GRACE):
+            self.writer.transport.pause_reading()
+            self.paused = True
+    
+    def idle(self) -> bool:
+        return self.paused and self.reading and not self.tasks
+    
+    def stop(self, reason: str = "服务端正在排空"):
+        # 只用于空闲连接: 设置异常后 writer.drain 也会抛出, 会打断仍在写回的响应;
+        # 不用 feed_eof, 之后到达的数据会触发 feed_data 的断言
+        self.reader.set_exception(_Closing(reason))
+
+class AsyncioMuxpServer(MetricsMixIn):
+    """
+    异步高性能服务端，可选 TLS/纯 TCP
+    - async def 处理函数直接在事件循环中 await
+    - 同步处理函数默认派发到线程池, 用 loop_safe 标记的同步处理函数直接在事件循环中调用
+    - 准入控制: max_connections 限制连接数, concurrency 限制单连接在途帧数, max_handlers 限制全局处理并发,
+      超出时按 overload 策略降级 (见 Overload)
+    - 写缓冲超过 max_outbound 时暂停读取该连接, 直到对端读走数据
+    - 发布/订阅: 订阅者的推送直接写入 transport, 写缓冲超过 max_outbound 后进入有界的推送队列 (见 PubSub)
+    """
+    
+    max_workers = ThreadPoolMixIn.max_workers
+    offload_threshold = 64 * 1024  # 超过该长度的负载在线程池中加解密
+    max_outbound = MAX_BUFFER_SIZE  # 单连接写缓冲上限
+    
+    def __init__(self, addr: Tuple[str, int], handler_func: Callable, auth: Optional[Auth] = None,
+                 max_workers: Optional[int] = None, concurrency: int = 1, sig_key: Optional[str] = None,
+                 sock: Optional[socket.socket] = None, reuse_port: bool = False,
+                 compression: Optional[Compression] = None, codecs: Optional[Sequence[str]] = None,
+                 metrics: Optional[Metrics] = None, max_connections: Optional[int] = None,
+                 max_handlers: Optional[int] = None, max_outbound: Optional[int] = None,
+                 overload: Overload = Overload.REJECT, idle_timeout: Optional[float] = IDLE_TIMEOUT,
+                 pubsub: Optional[PubSub] = None, cache: Optional[ResponseCache] = None):
         self.addr = addr
         self.auth = auth
         self.handle_message = handler_func
         self.ssl_ctx = ssl_server_context(auth) if auth else None
+        if max_workers:
+            self.max_workers = max_workers
+        self.concurrency = max(concurrency, 1)  # 单连接上并行处理的最大帧数
+        self.sig_key = sig_key
+        self.compression = compression
+        self.codecs = resolve_codecs(codecs)
+        self.default_negotiated = Negotiated(codec=JSONCodec if self.codecs is not None else None)
+        self._init_metrics(metrics)
+        self.max_connections = max_connections
+        self.max_handlers = max_handlers
+        if max_outbound:
+            self.max_outbound = max_outbound
+        self.overload = overload
+        # 信号量在 start() 中创建, 绑定到运行服务器的事件循环
+        self._conn_slots: Optional[asyncio.Semaphore] = None
+        self._handler_slots: Optional[asyncio.Semaphore] = None
+        self.sock = sock
+        self.reuse_port = reuse_port
         self._server: Optional[asyncio.AbstractServer] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: set = set()  # 活动连接的 _AsyncConn, 排空时逐个关闭
+        self._drain_task: Optional[asyncio.Task] = None
+        # 空闲淘汰: 一个时间轮由 start() 中的一个任务推进, 取代每次读取的超时
+        self.idle_timeout = idle_timeout
+        self._idle_wheel = TimerWheel(IDLE_TICK) if idle_timeout else None
+        self.pubsub = pubsub if pubsub is not None else PubSub()
+        self.pubsub.bind(self.metrics, sig_key)
+        self._is_async = asyncio.iscoroutinefunction(handler_func)
+        self._loop_safe = getattr(handler_func, "__muxp_loop_safe__", False)
+        self.router = handler_func if isinstance(handler_func, Router) else None
+        self.cache = cache
+        if cache is not None:
+            cache.bind(self.metrics)
+    
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="muxp-handler")
+            logger.info(f"[*] 同步处理函数将在线程池中执行，最大工作线程数: {self.max_workers}")
+        return self._executor
+    
+    async def call_handler(self, data, offload: bool = False, route: Optional[Route] = None) -> Optional[bytes]:
+        if route is not None:
+            start = time.perf_counter()
+            resp = await route.call_async(data, self.metrics, self._ensure_executor, offload)
+            self.metrics.observe("handler", time.perf_counter() - start)
+            return resp
+        if self._is_async or (self._loop_safe and not offload):
+            start = time.perf_counter()
+            resp = self.handle_message(data)
+            if inspect.isawaitable(resp):
+                resp = await resp
+            self.metrics.observe("handler", time.perf_counter() - start)
+            return resp
+        return await asyncio.get_running_loop().run_in_executor(self._ensure_executor(), self._run_handler,
+                                                                data, time.perf_counter())
+    
+    def _run_handler(self, data, queued: float):
+        """在线程池中执行同步处理函数, 分别记录排队时间与处理时间"""
+        start = time.perf_counter()
+        self.metrics.observe("queue_wait", start - queued)
+        resp = self.handle_message(data)
+        self.metrics.observe("handler", time.perf_counter() - start)
+        return resp
+    
+    async def _crypt(self, func: Callable[[bytes], Any], data: bytes, heavy: bool) -> Any:
+        """加解密与压缩: 需要运行 PBKDF2 或负载较大时放到线程池, 避免阻塞事件循环"""
+        if heavy or len(data) >= self.offload_threshold:
+            return await asyncio.get_running_loop().run_in_executor(self._ensure_executor(), func, data)
+        return func(data)
+    
+    async def process(self, frame: Frame, session: Optional[SignatureSession] = None,
+                      gate: Optional[WriteGate] = None, stream: Optional[AsyncChunkStream] = None,
+                      negotiated: Negotiated = Negotiated()) -> Optional[bytes]:
+        slots = self._handler_slots
+        if slots is None:
+            return await self._process(frame, session, gate, stream, negotiated)
+        if slots.locked() and self.overload == Overload.BUSY and frame.stream_id is not None:
+            self.metrics.inc("busy")
+            return busy_frame(frame)
+        async with slots:
+            return await self._process(frame, session, gate, stream, negotiated)
+    
+    async def _process(self, frame: Frame, session: Optional[SignatureSession], gate: Optional[WriteGate],
+                       stream: Optional[AsyncChunkStream], negotiated: Negotiated) -> Optional[bytes]:
+        metrics = self.metrics
+        cache = self.cache
+        flight = None
+        try:
+            route = self.router.resolve(frame.route) if self.router is not None else None
+            if stream is not None:
+                # 同步处理函数在线程池中用普通 for 迭代分块流, 不能在事件循环中执行
+                resp = await self.call_handler(stream, offload=True, route=route)
+            else:
+                start = time.perf_counter()
+                data = frame.payload
+                if session is not None:
+                    data = await self._crypt(session.decrypt, data, session.needs_derive(data))
+                if cache is not None:
+                    flight = await cache.claim_async(cache.frame_key(frame, data, negotiated.codec, negotiated.compressor))
+                if flight is None or not flight.hit:
+                    if frame.flags & FLAG_COMPRESSED:
+                        data = await self._crypt(lambda d: inflate(frame, d, negotiated.compressor), data, False)
+                    if negotiated.codec is not None:
+                        data = await self._crypt(negotiated.codec.decode, data, False)
+                    if cache is not None and flight is None:
+                        flight = await cache.claim_async(cache.data_key(frame.route, data))
+                metrics.observe("decode", time.perf_counter() - start)
+                if flight is not None and flight.hit:
+                    resp = flight.value
+                else:
+                    resp = await self.call_handler(data, route=route)
+                    if flight is not None:
+                        flight.complete(resp)
+            if is_stream_source(resp):
+                return await self._reply_stream(frame, resp, session, gate)
+            start = time.perf_counter()
+            if negotiated.codec is not None and resp is not None:
+                resp = negotiated.codec.encode(resp)
+            flags = 0
+            if negotiated.compressor is not None and resp:
+                resp, flags = await self._crypt(lambda r: deflate(frame, r, negotiated.compressor), resp, False)
+            if session is not None and resp is not None:
+                resp = await self._crypt(session.encrypt, resp, False)
+            metrics.observe("encode", time.perf_counter() - start)
+            return reply_frame(frame, resp, flags)
+        except Exception as be:
+            if flight is not None:
+                flight.fail(be)
+            metrics.inc("errors")
+            traceback.print_exc()
+            return error_frame(frame, be)
+        finally:
+            if flight is not None:
+                # 被取消时让等待同一个键的请求各自重新计算
+                flight.abandon()
+    
+    async def _reply_stream(self, frame: Frame, source, session: Optional[SignatureSession],
+                            gate: WriteGate) -> Optional[bytes]:
+        """处理函数返回文件对象或(异步)迭代器时以分块流写回; 旧版帧不支持分块, 拼接成一条消息"""
+        if frame.stream_id is None:
+            if hasattr(source, "__aiter__"):
+                resp = b"".join([bytes(chunk) async for chunk in source])
+            else:
+                resp = await asyncio.get_running_loop().run_in_executor(self._ensure_executor(), join_chunks, source)
+            if session is not None:
+                resp = await self._crypt(session.encrypt, resp, False)
+            return reply_frame(frame, resp)
+        await send_stream_async(gate, frame.stream_id, source, seal=session.encrypt if session else None)
+        return None
+    
+    async def _process_task(self, frame: Frame, session: Optional[SignatureSession], seq: Optional[int],
+                            sequencer: ResponseSequencer, inflight: Optional[asyncio.Semaphore],
+                            gate: WriteGate, stream: Optional[AsyncChunkStream] = None,
+                            negotiated: Negotiated = Negotiated()):
+        try:
+            sequencer.complete(seq, await self.process(frame, session, gate, stream, negotiated))
+            await self._drain(gate)
+        except ConnectionError:
+            pass
+        finally:
+            if stream is not None:
+                # 处理函数没有读完的分块直接丢弃, 读取协程不再挂起
+                stream.close()
+            if inflight is not None:
+                inflight.release()
+    
+    async def _on_chunk(self, frame: Frame, streams: Dict[int, AsyncChunkStream], session: Optional[SignatureSession],
+                        sequencer: ResponseSequencer, gate: WriteGate, tasks: set,
+                        negotiated: Negotiated = Negotiated()):
+        """分块流: 首块到达时启动处理任务, 之后的分块放入流中, 流中分块达到上限时挂起读取形成背压"""
+        stream = streams.get(frame.stream_id)
+        if stream is None:
+            stream = AsyncChunkStream(unseal=session.decrypt if session else None)
+            streams[frame.stream_id] = stream
+            task = asyncio.ensure_future(
+                self._process_task(frame._replace(payload=b""), session, None, sequencer, None, gate, stream,
+                                   negotiated))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if frame.flags & FLAG_ERROR:
+            stream.abort(ConnectionError(f"发送方中止了流: {bytes(frame.payload).decode('utf-8', 'replace')}"))
+        elif len(frame.payload):
+            await stream.put(bytes(frame.payload))
+        if frame.flags & (FLAG_END | FLAG_ERROR):
+            await stream.end()
+            del streams[frame.stream_id]
+    
+    async def _on_pubsub(self, frame: Frame, conn: _AsyncConn, session: Optional[SignatureSession],
+                         negotiated: Negotiated, gate: WriteGate, push: Callable[[List[bytes]], Any]) -> bytes:
+        """订阅、退订与客户端发布在读取协程中直接完成, 确认帧与普通响应一样加密"""
+        pubsub = self.pubsub
+        try:
+            resp = b""
+            if frame.kind == FRAME_PUBLISH:
+                topic, data = decode_publish(frame.payload)
+                data = bytes(data)
+                if session is not None:
+                    data = await self._crypt(session.decrypt, data, session.needs_derive(data))
+                data = inflate(frame, data, negotiated.compressor)
+                if negotiated.codec is not None:
+                    data = negotiated.codec.decode(data)
+                resp = str(pubsub.publish(topic, data)).encode('utf-8')
+            elif frame.kind == FRAME_SUBSCRIBE:
+                if conn.subscriber is None:
+                    conn.subscriber = AsyncSubscriber(pubsub, negotiated.codec, negotiated.compressor, push, gate.drain,
+                                                      conn.writer.transport, self.max_outbound, self.metrics)
+                pubsub.subscribe(conn.subscriber, pubsub_topic(frame))
+            elif conn.subscriber is not None:
+                pubsub.unsubscribe(conn.subscriber, pubsub_topic(frame))
+            if session is not None:
+                resp = session.encrypt(resp)
+            return reply_frame(frame, resp)
+        except Exception as e:
+            self.metrics.inc("errors")
+            logger.error(f"[订阅异常] {e}")
+            return error_frame(frame, e)
+    
+    def publish(self, topic: str, message: Any) -> int:
+        """向订阅了 topic 的所有连接推送 message, 可在任意线程中调用, 见 PubSub.publish"""
+        return self.pubsub.publish(topic, message)
+    
+    async def _drain(self, gate: WriteGate):
+        start = time.perf_counter()
+        await gate.drain()
+        self.metrics.observe("write", time.perf_counter() - start)
     
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        buffer = b""
+        slots = self._conn_slots
+        if slots is None:
+            return await self._serve_client(reader, writer)
+        if slots.locked() and self.overload != Overload.PAUSE:
+            self.metrics.inc("connections_rejected")
+            logger.warning(f"[!] 连接数已达上限 {self.max_connections}，拒绝连接 {writer.get_extra_info('peername')}")
+            writer.transport.abort()
+            return
+        # PAUSE: 等待空出连接槽位期间不读取, 客户端的请求留在 socket 缓冲中
+        if slots.locked():
+            self.metrics.inc("accept_paused")
+        async with slots:
+            await self._serve_client(reader, writer)
+    
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        metrics = self.metrics
+        metrics.inc("connections_accepted")
+        decoder = FrameDecoder(MAX_BUFFER_SIZE)
         peer = writer.get_extra_info("peername")
+        # 写缓冲超过 max_outbound 时 drain 挂起, 读取循环随之暂停
+        transport = writer.transport
+        transport.set_write_buffer_limits(high=self.max_outbound)
+        gate = WriteGate(writer)
+        
+        def write(out: bytes):
+            gate.write(out)
+            conn.last_active = time.monotonic()
+            metrics.inc("frames_out")
+            metrics.inc("bytes_out", len(out))
+        
+        def push(frames: List[bytes]):
+            gate.writelines(frames)
+            conn.last_active = time.monotonic()
+            metrics.inc("frames_out", len(frames))
+            metrics.inc("bytes_out", sum(len(f) for f in frames))
+        
+        sequencer = ResponseSequencer(write)
+        # concurrency > 1 时同一连接上最多 concurrency 帧作为独立任务并行处理
+        inflight = asyncio.Semaphore(self.concurrency)
+        # 设置了 sig_key 时每条连接一个加密会话, 对处理函数透明
+        session = SignatureSession(self.sig_key) if self.sig_key else None
+        negotiated = self.default_negotiated  # HELLO 协商后更新
+        tasks = set()
+        streams: Dict[int, AsyncChunkStream] = {}
+        conn = _AsyncConn(reader, writer, tasks)
+        self._clients.add(conn)
+        wheel = self._idle_wheel
+        if wheel is not None:
+            wheel.schedule(conn, self.idle_timeout)
         try:
             while True:
                 try:
-                    data = await asyncio.wait_for(reader.read(4096), timeout=30.0)
+                    conn.reading = True
+                    data = await reader.read(decoder.read_size())
+                    conn.reading = False
                     if not data:
                         break
-                    buffer += data
-                    if len(buffer) > MAX_BUFFER_SIZE:
-                        break
-                    msgs, buffer = decode_data(buffer)
-                    for msg in msgs:
-                        try:
-                            resp = self.handle_message(msg)
-                            if resp:
-                                writer.write(encode_data(resp))
-                                await writer.drain()
-                        except Exception:
-                            traceback.print_exc()
-                except asyncio.TimeoutError:
-                    continue
+                    conn.last_active = time.monotonic()
+                    metrics.inc("bytes_in", len(data))
+                    decoder.feed(data)
+                    for frame in decoder.frames():
+                        metrics.inc("frames_in")
+                        if frame.kind == FRAME_HELLO:
+                            out, negotiated = server_hello(frame.payload, self.compression, self.codecs,
+                                                           self.idle_timeout)
+                            write(out)
+                            continue
+                        if frame.kind == FRAME_PING:
+                            metrics.inc("pings")
+                            write(pong_frame(frame))
+                            continue
+                        conn.fresh = False
+                        if frame.kind == FRAME_CHUNK:
+                            await self._on_chunk(frame, streams, session, sequencer, gate, tasks, negotiated)
+                            continue
+                        if frame.kind in PUBSUB_FRAMES:
+                            job = frame._replace(payload=bytes(frame.payload))
+                            write(await self._on_pubsub(job, conn, session, negotiated, gate, push))
+                            continue
+                        if frame.kind != FRAME_DATA:
+                            continue
+                        job = frame._replace(payload=bytes(frame.payload))
+                        seq = sequencer.reserve(job)
+                        if self.concurrency <= 1:
+                            sequencer.complete(seq, await self.process(job, session, gate, negotiated=negotiated))
+                            if transport.get_write_buffer_size() > self.max_outbound:
+                                # 一次读取可能包含大量请求, 逐帧写回时不能等整批处理完才 drain
+                                await self._drain(gate)
+                            continue
+                        await inflight.acquire()
+                        task = asyncio.ensure_future(
+                            self._process_task(job, session, seq, sequencer, inflight, gate, negotiated=negotiated))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    await self._drain(gate)
+                except ValueError as e:
+                    logger.warning(f"[!] 帧格式错误, 关闭连接 {peer}: {e}")
+                    break
+                except _Closing:
+                    break
         except Exception:
             traceback.print_exc()
         finally:
+            if conn.subscriber is not None:
+                conn.subscriber.close()
+            for stream in streams.values():
+                stream.abort(ConnectionError("连接已断开"))
+            if tasks:
+                # 等待在途帧处理并写回后再关闭连接
+                await asyncio.gather(*tasks, return_exceptions=True)
             try:
                 writer.close()
                 await writer.wait_closed()
             except Exception:
                 pass
+            self._clients.discard(conn)
+            if wheel is not None:
+                wheel.discard(conn)
+            metrics.inc("connections_closed")
     
     async def start(self):
-        self._server = await asyncio.start_server(
-            self.handle_client,
-            self.addr[0],
-            self.addr[1],
-            ssl=self.ssl_ctx,
-            reuse_address=True,
-        )
+        self._loop = asyncio.get_running_loop()
+        self._conn_slots = asyncio.Semaphore(self.max_connections) if self.max_connections else None
+        self._handler_slots = asyncio.Semaphore(self.max_handlers) if self.max_handlers else None
+        if self.sock is not None:
+            self._server = await asyncio.start_server(self.handle_client, sock=self.sock, ssl=self.ssl_ctx)
+        else:
+            self._server = await asyncio.start_server(
+                self.handle_client,
+                self.addr[0],
+                self.addr[1],
+                ssl=self.ssl_ctx,
+                reuse_address=True,
+                reuse_port=self.reuse_port or None,
+            )
         mode = "TLS" if self.ssl_ctx else "TCP"
         logger.info(f"[*] asyncio muxp {mode} 服务器监听在 {self.addr}")
-        async with self._server:
-            await self._server.serve_forever()
+        sweeper = asyncio.ensure_future(self._evict_idle()) if self._idle_wheel is not None else None
+        try:
+            try:
+                async with self._server:
+                    await self._server.serve_forever()
+            except asyncio.CancelledError:
+                # close() 与 drain() 会取消 serve_forever, 视为正常退出
+                if self._server.is_serving():
+                    raise
+            if self._drain_task is not None:
+                await self._drain_task
+        finally:
+            if sweeper is not None:
+                sweeper.cancel()
+            if self._executor:
+                self._executor.shutdown(wait=False)
+                self._executor = None
     
     def close(self):
         if self._server and self._server.is_serving():
             self._server.close()
+    
+    async def _evict_idle(self):
+        """按时间轮关闭空闲连接: 只关闭正在等待新数据且没有在途帧的连接"""
+        wheel = self._idle_wheel
+        while True:
+            await asyncio.sleep(max(wheel.next_expiry() - time.monotonic(), 0))
+            now = time.monotonic()
+            for conn in wheel.advance(now):
+                if conn not in self._clients:
+                    continue
+                idle = now - conn.last_active
+                if not conn.reading or conn.tasks:
+                    wheel.schedule(conn, self.idle_timeout)
+                elif idle < self.idle_timeout:
+                    wheel.schedule(conn, self.idle_timeout - idle)
+                else:
+                    self.metrics.inc("idle_evicted")
+                    logger.debug(f"[*] 连接 {conn.writer.get_extra_info('peername')} 空闲 {idle:.0f} 秒, 关闭")
+                    conn.stop("连接空闲超时")
+    
+    def begin_drain(self, timeout: float):
+        """在事件循环中排空 (见 drain), 可在其他线程或信号处理函数中调用"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._start_drain, timeout)
+    
+    def _start_drain(self, timeout: float):
+        if self._drain_task is None:
+            self._drain_task = asyncio.ensure_future(self.drain(timeout))
+    
+    async def drain(self, timeout: float):
+        """
+        优雅排空: 停止监听, 所有连接不再读取新的请求; 空闲连接立即关闭, 处理中的连接写回在途帧的响应后关闭,
+        超过 timeout 秒仍未关闭的连接被强制断开; start() 在排空结束后返回
+        """
+        if self._drain_task is None:
+            self._drain_task = asyncio.current_task()
+        elif self._drain_task is not asyncio.current_task():
+            return await self._drain_task
+        logger.info(f"[*] 开始排空: 停止接收新连接, 等待 {len(self._clients)} 条连接结束 (最长 {timeout} 秒)")
+        # 已 accept 但还未建立 transport 的连接若在 Server.close() 之后才建立, 会在 Server._attach 的断言上失败
+        # 并被直接关闭 (客户端收到 RST); 先停止 accept, 让排队中的连接建立完成后再关闭
+        loop = asyncio.get_running_loop()
+        for sock in (self._server.sockets if self._server else ()):
+            try:
+                loop.remove_reader(sock.fileno())
+            except (NotImplementedError, ValueError):
+                pass
+        await asyncio.sleep(0)
+        self.close()
+        # 不再从 socket 读取新的请求, 已读入缓冲的帧照常处理; 在途帧都写回后连接变为空闲并被关闭
+        start = time.monotonic()
+        deadline = start + timeout
+        # 已 accept 的连接 (包括 TLS 握手中的) 要过几轮事件循环才进入 _clients, start() 返回后
+        # asyncio.run 会取消它们, 所以宽限期内即使没有连接也继续等待
+        grace = start + min(NEW_CONN_GRACE, timeout)
+        while time.monotonic() < deadline and (self._clients or time.monotonic() < grace):
+            now = time.monotonic()
+            for conn in list(self._clients):
+                conn.pause(now)
+                if conn.idle():
+                    conn.stop()
+            await asyncio.sleep(0.05)
+        if self._clients:
+            logger.warning(f"[!] 排空超时, 强制关闭 {len(self._clients)} 条连接")
+            self.metrics.inc("drain_aborted", len(self._clients))
+            for conn in list(self._clients):
+                conn.writer.transport.abort()
+        logger.info("[*] 排空完成")
+
+###############################################################################
+# 4) selectors 单线程服务器（非阻塞, 连接开销最小）
+###############################################################################
+
+class _SelectorConn:
+    """selectors 引擎中单条连接的状态: 读写缓冲、可选的 MemoryBIO TLS 与在途请求"""
+    
+    __slots__ = ("sock", "peer", "tls", "incoming", "outgoing", "handshaking", "decoder", "out",
+                 "session", "negotiated", "sequencer", "backlog", "inflight", "streams", "streaming", "blocked", "posted",
+                 "events", "eof", "closed", "metrics", "fresh", "since", "last_active")
+    
+    def __init__(self, sock: socket.socket, peer, ssl_ctx: Optional[ssl.SSLContext], sig_key: Optional[str],
+                 negotiated: Negotiated, metrics: Metrics):
+        self.sock = sock
+        self.peer = peer
+        self.tls: Optional[ssl.SSLObject] = None
+        self.incoming = self.outgoing = None
+        if ssl_ctx is not None:
+            self.incoming = ssl.MemoryBIO()
+            self.outgoing = ssl.MemoryBIO()
+            self.tls = ssl_ctx.wrap_bio(self.incoming, self.outgoing, server_side=True)
+        self.handshaking = self.tls is not None
+        self.decoder = FrameDecoder(MAX_BUFFER_SIZE, initial_size=0)  # 空闲连接不占用接收缓冲
+        self.out = bytearray()
+        self.session = SignatureSession(sig_key) if sig_key else None
+        self.negotiated = negotiated  # HELLO 协商后更新
+        self.sequencer = ResponseSequencer(self.write)
+        self.backlog: Deque[Tuple[Frame, Optional[int]]] = deque()  # 已解码但尚未派发的帧
+        self.inflight = 0
+        self.streams: Dict[int, ChunkStream] = {}  # 正在接收的分块流
+        self.streaming = 0                         # 线程池中处理分块流或写回分块流的任务数
+        self.blocked: Optional[ChunkStream] = None  # 未消费分块已满、暂停读取的流
+        self.posted = 0                            # 线程池已交回、事件循环尚未写入缓冲的字节数
+        self.events = 0
+        self.eof = False
+        self.closed = False
+        self.metrics = metrics
+        self.fresh = True  # 还没有收到过请求帧 (HELLO 不算)
+        self.since = time.monotonic()
+        self.last_active = self.since  # 最近一次可读或可写的时间
+    
+    def write(self, data: bytes):
+        self.metrics.inc("frames_out")
+        self.metrics.inc("bytes_out", len(data))
+        if self.tls is not None:
+            self.tls.write(data)
+            self.out += self.outgoing.read()
+        else:
+            self.out += data
+
+
+class SelectorsMuxpServer(MetricsMixIn):
+    """
+    基于 selectors (epoll/kqueue) 的单线程服务器
+    - 所有连接使用非阻塞 socket, 由一个事件循环线程读写, 每条连接只占用少量内存
+    - TLS 通过 SSLObject + MemoryBIO 在事件循环中非阻塞地握手与加解密
+    - 用 loop_safe 标记或 max_workers=0 时处理函数直接在事件循环中执行,
+      否则派发到线程池, 结果通过唤醒 socket 交回事件循环写回
+    - 连接写缓冲超过 write_high_water 或在途帧达到 concurrency 时暂停读取该连接
+    - max_connections 与 max_handlers (线程池中同时执行的处理函数数) 超出时按 overload 策略降级;
+      PAUSE 时停止监听 socket 的可读事件, 新连接留在内核监听队列中
+    - 空闲连接 (包括握手未完成的) 由事件循环推进的时间轮关闭, 见 idle_timeout
+    """
+    
+    max_workers = ThreadPoolMixIn.max_workers
+    request_queue_size = 1024
+    accept_batch = 64                     # 每次可读事件最多 accept 的连接数
+    recv_size = 256 * 1024                # TLS 连接每次读取的最大字节数
+    write_high_water = MAX_BUFFER_SIZE    # 写缓冲超过该值时暂停读取
+    
+    def __init__(self, addr: Tuple[str, int], handler_func: Callable, auth: Optional[Auth] = None,
+                 max_workers: Optional[int] = None, concurrency: int = 1, sig_key: Optional[str] = None,
+                 sock: Optional[socket.socket] = None, reuse_port: bool = False,
+                 compression: Optional[Compression] = None, codecs: Optional[Sequence[str]] = None,
+                 metrics: Optional[Metrics] = None, max_connections: Optional[int] = None,
+                 max_handlers: Optional[int] = None, overload: Overload = Overload.REJECT,
+                 idle_timeout: Optional[float] = IDLE_TIMEOUT, cache: Optional[ResponseCache] = None):
+        self.router = handler_func if isinstance(handler_func, Router) else None
+        if asyncio.iscoroutinefunction(handler_func) or (self.router is not None and self.router.has_async()):
+            raise ValueError("async 处理函数仅支持 Mode.ASYNCIO")
+        self.addr = addr
+        self.auth = auth
+        self.handle_message = handler_func
+        self.ssl_ctx = ssl_server_context(auth) if auth else None
+        if max_workers is not None:
+            self.max_workers = max_workers
+        self.concurrency = max(concurrency, 1)
+        self.sig_key = sig_key
+        self.compression = compression
+        self.codecs = resolve_codecs(codecs)
+        self.default_negotiated = Negotiated(codec=JSONCodec if self.codecs is not None else None)
+        self._init_metrics(metrics)
+        self.cache = cache
+        if cache is not None:
+            cache.bind(self.metrics)
+        self.max_connections = max_connections
+        self.max_handlers = max_handlers
+        self.overload = overload
+        self._running = 0                    # 线程池中正在执行的请求数
+        self._starved: Deque[_SelectorConn] = deque()  # 因 max_handlers 已满而暂缓派发的连接
+        self._accept_paused = False
+        self.inline = self.max_workers == 0 or getattr(handler_func, "__muxp_loop_safe__", False)
+        self._selector = selectors.DefaultSelector()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conns: Dict[int, _SelectorConn] = {}
+        self._completed: Deque[Tuple[_SelectorConn, Optional[int], Optional[bytes]]] = deque()
+        # 分块流任务交回的数据: (连接, 待写出的帧, 任务是否结束)
+        self._posted: Deque[Tuple[_SelectorConn, Optional[bytes], bool]] = deque()
+        self._resumed: Deque[_SelectorConn] = deque()
+        self._writable = threading.Condition()
+        self._write_waiters = 0  # 等待写缓冲排空的线程池任务数
+        self._stopping = False
+        self._drain_timeout: Optional[float] = None  # begin_drain 设置, 由事件循环开始排空
+        self._drain_deadline: Optional[float] = None
+        self.idle_timeout = idle_timeout
+        self._idle_wheel = TimerWheel(IDLE_TICK) if idle_timeout else None
+        self._waker_r, self._waker_w = socket.socketpair()
+        self._waker_r.setblocking(False)
+        self._waker_w.setblocking(False)
+        
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(addr)
+            sock.listen(self.request_queue_size)
+        sock.setblocking(False)
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        self._selector.register(sock, selectors.EVENT_READ)
+        self._selector.register(self._waker_r, selectors.EVENT_READ)
+        logger.info(f"[*] selectors 服务器已初始化 ({type(self._selector).__name__}), "
+                    f"处理函数{'在事件循环中执行' if self.inline else f'在线程池中执行，最大工作线程数: {self.max_workers}'}")
+    
+    # ---- 事件循环 ----
+    
+    def serve_forever(self):
+        mode = "TLS" if self.ssl_ctx else "TCP"
+        logger.info(f"[*] selectors muxp {mode} 服务器监听在 {self.server_address}")
+        wheel = self._idle_wheel
+        try:
+            while not self._stopping:
+                timeout = None
+                if self._drain_deadline is not None:
+                    timeout = self._drain_deadline - time.monotonic()
+                    if not self._conns or timeout <= 0:
+                        self._finish_drain()
+                        break
+                    if self._drain_idle():
+                        timeout = min(timeout, 0.05)
+                if wheel is not None:
+                    now = time.monotonic()
+                    if now >= wheel.next_expiry():
+                        self._evict_idle(now)
+                    wait = max(wheel.next_expiry() - now, 0)
+                    timeout = wait if timeout is None else min(timeout, wait)
+                for key, mask in self._selector.select(timeout):
+                    if key.fileobj is self.socket:
+                        self._accept()
+                    elif key.fileobj is self._waker_r:
+                        self._drain_completed()
+                    else:
+                        conn = key.data
+                        if mask & selectors.EVENT_WRITE and not conn.closed:
+                            self._flush(conn)
+                        if mask & selectors.EVENT_READ and not conn.closed:
+                            self._on_readable(conn)
+        finally:
+            self.server_close()
+    
+    def shutdown(self):
+        """可以在其他线程中调用"""
+        self._stopping = True
+        self._wakeup()
+    
+    def begin_drain(self, timeout: float):
+        """
+        优雅排空, 可以在其他线程或信号处理函数中调用: 停止 accept 并关闭监听 socket, 所有连接不再读取;
+        空闲连接立即关闭, 处理中的连接写回在途帧的响应后关闭, 超过 timeout 秒仍未关闭的连接被强制关闭,
+        之后 serve_forever 返回
+        """
+        self._drain_timeout = timeout
+        self._wakeup()
+    
+    def _start_drain(self):
+        timeout, self._drain_timeout = self._drain_timeout, None
+        if self._drain_deadline is not None:
+            return
+        logger.info(f"[*] 开始排空: 停止接收新连接, 等待 {len(self._conns)} 条连接结束 (最长 {timeout} 秒)")
+        self._drain_deadline = time.monotonic() + timeout
+        if not self._accept_paused:
+            self._selector.unregister(self.socket)
+        self._accept_paused = False
+        # 监听 socket 已交给新进程时对方持有副本, 监听队列中的连接由新进程 accept
+        self.socket.close()
+        self._drain_idle()
+    
+    def _drain_idle(self) -> bool:
+        """让可以结束的连接停止读取, 返回是否还有处于宽限期内的新连接"""
+        now = time.monotonic()
+        waiting = False
+        for conn in list(self._conns.values()):
+            if conn.eof:
+                continue
+            if conn.fresh and now - conn.since < NEW_CONN_GRACE:
+                waiting = True
+                continue
+            # 与对端关闭写端的处理相同: 不再读取, 在途帧写回后关闭
+            conn.eof = True
+            self._maybe_finish(conn)
+        return waiting
+    
+    def _evict_idle(self, now: float):
+        """关闭超过 idle_timeout 没有读写且没有在途帧的连接"""
+        wheel = self._idle_wheel
+        for conn in wheel.advance(now):
+            if conn.closed:
+                continue
+            idle = now - conn.last_active
+            if conn.inflight or conn.streaming or conn.backlog:
+                wheel.schedule(conn, self.idle_timeout)
+            elif idle < self.idle_timeout:
+                wheel.schedule(conn, self.idle_timeout - idle)
+            else:
+                self.metrics.inc("idle_evicted")
+                logger.debug(f"[*] 连接 {conn.peer} 空闲 {idle:.0f} 秒, 关闭")
+                self._close(conn)
+    
+    def _finish_drain(self):
+        if self._conns:
+            logger.warning(f"[!] 排空超时, 强制关闭 {len(self._conns)} 条连接")
+            self.metrics.inc("drain_aborted", len(self._conns))
+        logger.info("[*] 排空完成")
+    
+    def server_close(self):
+        for conn in list(self._conns.values()):
+            self._close(conn)
+        for sock in (self.socket, self._waker_r, self._waker_w):
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            sock.close()
+        self._selector.close()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def _wakeup(self):
+        try:
+            self._waker_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            # 唤醒缓冲已满说明事件循环已有待处理的唤醒
+            pass
+    
+    def _accept(self):
+        if self._drain_deadline is not None:
+            # 同一批事件中监听 socket 已在排空开始时关闭
+            return
+        for _ in range(self.accept_batch):
+            if self.max_connections and len(self._conns) >= self.max_connections and self.overload == Overload.PAUSE:
+                self._selector.unregister(self.socket)
+                self._accept_paused = True
+                self.metrics.inc("accept_paused")
+                return
+            try:
+                sock, peer = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # 例如文件描述符耗尽, 留待下一次可读事件重试
+                logger.error(f"[socket error] accept 失败: {e}")
+                return
+            if self.max_connections and len(self._conns) >= self.max_connections:
+                self.metrics.inc("connections_rejected")
+                logger.warning(f"[!] 连接数已达上限 {self.max_connections}，拒绝连接 {peer}")
+                sock.close()
+                continue
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            conn = _SelectorConn(sock, peer, self.ssl_ctx, self.sig_key, self.default_negotiated, self.metrics)
+            self._conns[sock.fileno()] = conn
+            if self._idle_wheel is not None:
+                self._idle_wheel.schedule(conn, self.idle_timeout)
+            self.metrics.inc("connections_accepted")
+            self._update(conn)
+    
+    def _update(self, conn: _SelectorConn):
+        """按连接状态重新计算关注的事件"""
+        if conn.closed:
+            return
+        events = 0
+        if conn.blocked is not None and not conn.blocked.full():
+            conn.blocked = None
+        if not conn.eof and not conn.backlog and conn.blocked is None and len(conn.out) < self.write_high_water:
+            events |= selectors.EVENT_READ
+        if conn.out:
+            events |= selectors.EVENT_WRITE
+        if events == conn.events:
+            return
+        if not conn.events:
+            self._selector.register(conn.sock, events, conn)
+        elif not events:
+            self._selector.unregister(conn.sock)
+        else:
+            self._selector.modify(conn.sock, events, conn)
+        conn.events = events
+    
+    def _close(self, conn: _SelectorConn):
+        if conn.closed:
+            return
+        conn.closed = True
+        self.metrics.inc("connections_closed")
+        for stream in conn.streams.values():
+            stream.abort(ConnectionError("连接已断开"))
+        conn.streams.clear()
+        if self._write_waiters:
+            with self._writable:
+                self._writable.notify_all()
+        if conn.events:
+            self._selector.unregister(conn.sock)
+            conn.events = 0
+        self._conns.pop(conn.sock.fileno(), None)
+        if self._idle_wheel is not None:
+            self._idle_wheel.discard(conn)
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+        conn.decoder.clear()
+        if self._accept_paused and not self._stopping and self._drain_deadline is None:
+            self._accept_paused = False
+            self._selector.register(self.socket, selectors.EVENT_READ)
+    
+    def _maybe_finish(self, conn: _SelectorConn):
+        """对端已关闭写端时, 等在途帧处理完并写回后再关闭连接"""
+        if conn.eof and not conn.inflight and not conn.streaming and not conn.backlog and not conn.out:
+            self._close(conn)
+        else:
+            self._update(conn)
+    
+    # ---- 读写 ----
+    
+    def _on_readable(self, conn: _SelectorConn):
+        conn.last_active = time.monotonic()
+        try:
+            if conn.tls is None:
+                n = conn.decoder.recv_into(conn.sock)
+                if not n:
+                    conn.eof = True
+                self.metrics.inc("bytes_in", n)
+            else:
+                data = conn.sock.recv(self.recv_size)
+                if not data:
+                    conn.eof = True
+                else:
+                    conn.incoming.write(data)
+                    self._tls_read(conn)
+            if not conn.handshaking:
+                self._dispatch(conn)
+        except (BlockingIOError, InterruptedError, ssl.SSLWantReadError):
+            pass
+        except ValueError as e:
+            logger.warning(f"[!] 帧格式错误, 关闭连接 {conn.peer}: {e}")
+            self._close(conn)
+            return
+        except (ConnectionError, ssl.SSLError, OSError) as e:
+            logger.debug(f"[*] 连接 {conn.peer} 异常断开: {e}")
+            self._close(conn)
+            return
+        if conn.out:
+            self._flush(conn)
+        if not conn.closed:
+            self._maybe_finish(conn)
+    
+    def _tls_read(self, conn: _SelectorConn):
+        if conn.handshaking:
+            try:
+                conn.tls.do_handshake()
+                conn.handshaking = False
+            except ssl.SSLWantReadError:
+                pass
+            conn.out += conn.outgoing.read()
+            if conn.handshaking:
+                return
+        while True:
+            try:
+                chunk = conn.tls.read(self.recv_size)
+            except ssl.SSLWantReadError:
+                break
+            except ssl.SSLZeroReturnError:
+                conn.eof = True
+                break
+            if not chunk:
+                conn.eof = True
+                break
+            self.metrics.inc("bytes_in", len(chunk))
+            conn.decoder.feed(chunk)
+        # 读取过程中可能产生 TLS 控制消息 (如 TLS 1.3 的 KeyUpdate)
+        conn.out += conn.outgoing.read()
+    
+    def _flush(self, conn: _SelectorConn):
+        conn.last_active = time.monotonic()
+        start = time.perf_counter()
+        try:
+            while conn.out:
+                n = conn.sock.send(conn.out)
+                del conn.out[:n]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            logger.debug(f"[*] 连接 {conn.peer} 写入失败: {e}")
+            self._close(conn)
+            return
+        self.metrics.observe("write", time.perf_counter() - start)
+        if self._write_waiters and len(conn.out) < self.write_high_water:
+            with self._writable:
+                self._writable.notify_all()
+        self._maybe_finish(conn)
+    
+    # ---- 请求处理 ----
+    
+    def _dispatch(self, conn: _SelectorConn):
+        for frame in conn.decoder.frames():
+            self.metrics.inc("frames_in")
+            if frame.kind == FRAME_HELLO:
+                out, conn.negotiated = server_hello(frame.payload, self.compression, self.codecs, self.idle_timeout)
+                conn.sequencer.write(out)
+                continue
+            if frame.kind == FRAME_PING:
+                self.metrics.inc("pings")
+                conn.sequencer.write(pong_frame(frame))
+                continue
+            conn.fresh = False
+            if frame.kind == FRAME_CHUNK:
+                self._on_chunk(conn, frame)
+                continue
+            if frame.kind in PUBSUB_FRAMES:
+                conn.sequencer.write(error_frame(frame, RuntimeError("selectors 引擎不支持发布/订阅")))
+                continue
+            if frame.kind != FRAME_DATA:
+                continue
+            job = frame._replace(payload=bytes(frame.payload))
+            conn.backlog.append((job, conn.sequencer.reserve(job)))
+        self._submit(conn)
+    
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            # max_workers=0 时分块流任务仍需要线程, 使用默认大小
+            workers = self.max_workers or SelectorsMuxpServer.max_workers
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="muxp-handler")
+        return self._executor
+    
+    def _submit(self, conn: _SelectorConn):
+        while conn.backlog and conn.inflight < self.concurrency:
+            if self.inline or self._inline_route(conn.backlog[0][0]):
+                job, seq = conn.backlog.popleft()
+                conn.sequencer.complete(seq, self.process(conn, job, in_loop=True))
+                continue
+            if self.max_handlers and self._running >= self.max_handlers:
+                job, seq = conn.backlog[0]
+                if self.overload == Overload.BUSY and job.stream_id is not None:
+                    conn.backlog.popleft()
+                    self.metrics.inc("busy")
+                    conn.sequencer.complete(seq, busy_frame(job))
+                    continue
+                # 积压非空时不再读取该连接, 有处理函数结束后再派发
+                self._starved.append(conn)
+                return
+            job, seq = conn.backlog.popleft()
+            conn.inflight += 1
+            self._running += 1
+            self._pool().submit(self._process_job, conn, job, seq, time.perf_counter())
+    
+    def _inline_route(self, frame: Frame) -> bool:
+        """inline 路由 (以及未注册的路由, 直接返回错误帧) 在事件循环中处理"""
+        if self.router is None:
+            return False
+        route = self.router.find(frame.route)
+        return route is None or route.inline
+    
+    def _on_chunk(self, conn: _SelectorConn, frame: Frame):
+        """
+        分块流: 首块到达时把流交给线程池中的处理函数 (无论是否 inline), 之后的分块放入流中
+        流中未消费的分块达到上限时暂停读取该连接, 处理函数取走分块后由 on_drain 唤醒事件循环恢复读取
+        """
+        stream = conn.streams.get(frame.stream_id)
+        if stream is None:
+            stream = ChunkStream(unseal=conn.session.decrypt if conn.session else None,
+                                 on_drain=lambda: self._resume(conn))
+            conn.streams[frame.stream_id] = stream
+            conn.streaming += 1
+            self._pool().submit(self._process_stream_job, conn, frame._replace(payload=b""), stream)
+        if frame.flags & FLAG_ERROR:
+            stream.abort(ConnectionError(f"发送方中止了流: {bytes(frame.payload).decode('utf-8', 'replace')}"))
+        elif len(frame.payload):
+            stream.put(bytes(frame.payload), block=False)
+            if stream.full():
+                conn.blocked = stream
+        if frame.flags & (FLAG_END | FLAG_ERROR):
+            stream.end()
+            del conn.streams[frame.stream_id]
+    
+    def _resume(self, conn: _SelectorConn):
+        self._resumed.append(conn)
+        self._wakeup()
+    
+    def process(self, conn: _SelectorConn, frame: Frame, stream: Optional[ChunkStream] = None,
+                in_loop: bool = False) -> Optional[bytes]:
+        session = conn.session
+        metrics = self.metrics
+        cache = self.cache
+        flight = None
+        try:
+            route = self.router.resolve(frame.route) if self.router is not None else None
+            if stream is not None:
+                data = stream
+            else:
+                start = time.perf_counter()
+                data = frame.payload
+                if session is not None:
+                    data = session.decrypt(data)
+                # 同一个键总是同一条路由, 在事件循环中处理的请求不会等待线程池中的计算
+                if cache is not None:
+                    flight = cache.claim(cache.frame_key(frame, data, conn.negotiated.codec, conn.negotiated.compressor))
+                if flight is None or not flight.hit:
+                    data = inflate(frame, data, conn.negotiated.compressor)
+                    if conn.negotiated.codec is not None:
+                        data = conn.negotiated.codec.decode(data)
+                    if cache is not None and flight is None:
+                        flight = cache.claim(cache.data_key(frame.route, data))
+                metrics.observe("decode", time.perf_counter() - start)
+            if flight is not None and flight.hit:
+                resp = flight.value
+            else:
+                start = time.perf_counter()
+                resp = route.call(data, metrics) if route is not None else self.handle_message(data)
+                metrics.observe("handler", time.perf_counter() - start)
+                if flight is not None:
+                    flight.complete(resp)
+            if is_stream_source(resp):
+                if frame.stream_id is None:
+                    # 旧版帧不支持分块, 拼接成一条消息
+                    resp = join_chunks(resp)
+                elif in_loop:
+                    # 事件循环中不能等待写缓冲排空, 交给线程池逐块写回
+                    conn.streaming += 1
+                    self._pool().submit(self._stream_reply_job, conn, frame, resp)
+                    return None
+                else:
+                    self._stream_reply(conn, frame, resp)
+                    return None
+            start = time.perf_counter()
+            if conn.negotiated.codec is not None and resp is not None:
+                resp = conn.negotiated.codec.encode(resp)
+            resp, flags = deflate(frame, resp, conn.negotiated.compressor)
+            if session is not None and resp is not None:
+                resp = session.encrypt(resp)
+            metrics.observe("encode", time.perf_counter() - start)
+            return reply_frame(frame, resp, flags)
+        except Exception as be:
+            if flight is not None:
+                flight.fail(be)
+            metrics.inc("errors")
+            logger.error(f"[业务异常] {be}")
+            traceback.print_exc()
+            return error_frame(frame, be)
+        finally:
+            if flight is not None:
+                flight.abandon()
+    
+    def _stream_reply(self, conn: _SelectorConn, frame: Frame, source):
+        """在线程池中执行: 逐块交给事件循环写出, 写缓冲超过 write_high_water 时等待排空"""
+        seal = conn.session.encrypt if conn.session is not None else None
+        for data in chunk_frames(frame.stream_id, source, seal=seal):
+            with self._writable:
+                self._write_waiters += 1
+                try:
+                    self._writable.wait_for(lambda: conn.closed or conn.posted + len(conn.out) < self.write_high_water)
+                finally:
+                    self._write_waiters -= 1
+                if conn.closed:
+                    raise ConnectionError("连接已断开")
+                conn.posted += len(data)
+            self._posted.append((conn, data, False))
+            self._wakeup()
+    
+    def _process_job(self, conn: _SelectorConn, frame: Frame, seq: Optional[int], queued: float):
+        """在线程池中执行, 结果交回事件循环线程写回"""
+        self.metrics.observe("queue_wait", time.perf_counter() - queued)
+        self._completed.append((conn, seq, self.process(conn, frame)))
+        self._wakeup()
+    
+    def _process_stream_job(self, conn: _SelectorConn, frame: Frame, stream: ChunkStream):
+        try:
+            out = self.process(conn, frame, stream)
+        finally:
+            # 处理函数没有读完的分块直接丢弃, 并恢复读取
+            stream.close()
+        self._posted.append((conn, out, True))
+        self._wakeup()
+    
+    def _stream_reply_job(self, conn: _SelectorConn, frame: Frame, source):
+        out = None
+        try:
+            self._stream_reply(conn, frame, source)
+        except Exception as be:
+            logger.error(f"[业务异常] {be}")
+            out = error_frame(frame, be)
+        self._posted.append((conn, out, True))
+        self._wakeup()
+    
+    def _drain_completed(self):
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        if self._drain_timeout is not None:
+            self._start_drain()
+        touched = set()
+        while self._completed:
+            conn, seq, out = self._completed.popleft()
+            conn.inflight -= 1
+            self._running -= 1
+            if conn.closed:
+                continue
+            conn.sequencer.complete(seq, out)
+            touched.add(conn)
+        while self._posted:
+            conn, out, done = self._posted.popleft()
+            if done:
+                conn.streaming -= 1
+            if out is not None and not done:
+                with self._writable:
+                    conn.posted -= len(out)
+            if conn.closed:
+                continue
+            if out is not None:
+                conn.write(out)
+            touched.add(conn)
+        while self._resumed:
+            touched.add(self._resumed.popleft())
+        while self._starved and (not self.max_handlers or self._running < self.max_handlers):
+            touched.add(self._starved.popleft())
+        for conn in touched:
+            if conn.closed:
+                continue
+            self._submit(conn)
+            if conn.out:
+                self._flush(conn)
+            else:
+                self._maybe_finish(conn)
+
+###############################################################################
+# 5) 多进程服务器（利用多核）
+###############################################################################
+
+class MultiProcessMuxpServer:
+    """
+    多进程服务器: fork 出 workers 个子进程, 每个子进程运行一个 asyncio、selectors 或 threadpool 引擎
+    - 支持 SO_REUSEPORT 时每个子进程各自监听同一端口, 由内核分发连接;
+      否则由父进程创建监听 socket, 子进程继承后共同 accept
+    - 子进程异常退出时自动重启, 父进程收到 SIGTERM/SIGINT 时通知所有子进程退出并等待;
+      设置了 drain_timeout 时子进程收到 SIGTERM 后先优雅排空
+    """
+    
+    restart_delay = 1.0       # 子进程连续崩溃时的重启间隔
+    shutdown_timeout = 10.0   # 等待子进程退出的最长时间, 超时后 SIGKILL
+    
+    def __init__(self, addr: Tuple[str, int], handler_func: Callable, auth: Optional[Auth] = None,
+                 workers: Optional[int] = None, engine: Mode = Mode.ASYNCIO, reuse_port: Optional[bool] = None,
+                 metrics_address: Optional[Tuple[str, int]] = None, sock: Optional[socket.socket] = None,
+                 drain_timeout: Optional[float] = None, **engine_options):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Mode.MULTIPROCESS 需要支持 fork 的平台")
+        if engine not in (Mode.ASYNCIO, Mode.THREADPOOL, Mode.SELECTORS):
+            raise ValueError(f"多进程模式不支持的引擎：{engine}")
+        self.addr = addr
+        self.handle_message = handler_func
+        self.auth = auth
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.engine_options = engine_options
+        if sock is not None:
+            # 热重启时从旧进程接管的监听 socket, 由所有子进程共享
+            reuse_port = False
+        elif reuse_port is None:
+            # 端口为 0 时各进程会拿到不同的随机端口, 只能共享继承的 socket
+            reuse_port = hasattr(socket, "SO_REUSEPORT") and addr[1] != 0
+        self.reuse_port = reuse_port
+        self.drain_timeout = drain_timeout
+        if drain_timeout is not None:
+            self.shutdown_timeout = max(self.shutdown_timeout, drain_timeout + 5.0)
+        # 每个子进程的指标相互独立, worker i 的指标端点监听在 metrics_address 的端口 + i
+        self.metrics_address = metrics_address
+        if auth:
+            # 在 fork 之前创建 (并缓存) TLS context, 各 worker 共用同一份会话票据密钥, 客户端换到其他 worker 也能恢复会话
+            ssl_server_context(auth)
+        self._sock: Optional[socket.socket] = sock
+        self._children: Dict[int, int] = {}  # pid -> worker 序号
+        self._stopping = False
+    
+    def _listen(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.addr)
+        sock.listen(socketserver.TCPServer.request_queue_size * self.workers)
+        self.addr = sock.getsockname()
+        return sock
+    
+    def _spawn(self, index: int):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = index
+            return
+        code = 0
+        try:
+            self._worker_main(index)
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # 子进程不能回到父进程的调用栈
+            os._exit(code)
+    
+    def _worker_main(self, index: int):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        logger.info(f"[*] worker {index} (pid {os.getpid()}) 使用 {self.engine.value} 引擎启动")
+        options = dict(self.engine_options, sock=self._sock, reuse_port=self.reuse_port)
+        drain = self.drain_timeout
+        if self.engine == Mode.ASYNCIO:
+            server = AsyncioMuxpServer(self.addr, self.handle_message, self.auth, **options)
+            self._serve_metrics(server, index)
+            
+            async def serve():
+                on_term = server.close if drain is None else lambda: server.begin_drain(drain)
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_term)
+                await server.start()
+            
+            asyncio.run(serve())
+        elif self.engine == Mode.SELECTORS:
+            srv = SelectorsMuxpServer(self.addr, self.handle_message, self.auth, **options)
+            self._serve_metrics(srv, index)
+            signal.signal(signal.SIGTERM, lambda *_: srv.shutdown() if drain is None else srv.begin_drain(drain))
+            srv.serve_forever()
+        else:
+            srv = ThreadPoolMuxpServer(self.addr, self.handle_message, self.auth, **options)
+            self._serve_metrics(srv, index)
+            if drain is None:
+                # shutdown 会等待 serve_forever 退出, 不能在同一线程的信号处理函数里直接调用
+                signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=srv.shutdown, daemon=True).start())
+            else:
+                signal.signal(signal.SIGTERM, lambda *_: srv.begin_drain(drain))
+            srv.serve_forever()
+    
+    def _serve_metrics(self, server: MetricsMixIn, index: int):
+        if self.metrics_address is not None:
+            host, port = self.metrics_address
+            server.serve_metrics((host, port + index if port else 0))
+    
+    def _on_signal(self, signum, frame):
+        self._stopping = True
+    
+    def begin_drain(self, timeout: Optional[float] = None):
+        """通知所有子进程排空后退出 (排空时长为构造时的 drain_timeout), 可以在其他线程中调用"""
+        self._stopping = True
+    
+    def serve_forever(self):
+        if not self.reuse_port and self._sock is None:
+            self._sock = self._listen()
+        previous = {sig: signal.signal(sig, self._on_signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+        mode = "SO_REUSEPORT" if self.reuse_port else "共享监听 socket"
+        logger.info(f"[*] 多进程服务器启动 {self.workers} 个 worker ({mode}) {self.addr}")
+        try:
+            for index in range(self.workers):
+                self._spawn(index)
+            last_crash = 0.0
+            while not self._stopping:
+                # 阻塞的 waitpid 在收到信号后会被自动重试 (PEP 475), 这里轮询以便及时响应退出信号
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if not pid:
+                    time.sleep(0.2)
+                    continue
+                index = self._children.pop(pid, None)
+                if index is None or self._stopping:
+                    continue
+                logger.warning(f"[!] worker {index} (pid {pid}) 异常退出, 状态码 {status}, 正在重启")
+                now = time.monotonic()
+                if now - last_crash < self.restart_delay:
+                    time.sleep(self.restart_delay)
+                last_crash = now
+                self._spawn(index)
+        finally:
+            self.shutdown()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+    
+    def shutdown(self):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._children.pop(pid, None)
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._children and time.monotonic() < deadline:
+            for pid in list(self._children):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    self._children.pop(pid, None)
+            time.sleep(0.05)
+        for pid in list(self._children):
+            logger.warning(f"[!] worker (pid {pid}) 未能按时退出, 强制结束")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._children.pop(pid, None)
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        logger.info("[*] 多进程服务器已退出")
 
 ###############################################################################
 # 统一入口
 ###############################################################################
 
+def _serve(srv, serve: Callable[[], None], drain_timeout: Optional[float], restart: Optional[Handoff]):
+    """运行服务器直到退出; 设置了 drain_timeout 时 SIGTERM 触发优雅排空, 启用了热重启时新进程接管也触发排空"""
+    if drain_timeout is None:
+        return serve()
+    if threading.current_thread() is threading.main_thread():
+        # MULTIPROCESS 的父进程在 serve_forever 中另行处理 SIGTERM
+        signal.signal(signal.SIGTERM, lambda *_: srv.begin_drain(drain_timeout))
+    if restart is None:
+        return serve()
+    restart.on_takeover = lambda: srv.begin_drain(drain_timeout)
+    restart.ready()
+    try:
+        serve()
+    finally:
+        restart.close()
+
 def run(
     address: Tuple[str, int],
     handler_func: Callable,
     mode: Mode = Mode.THREADING,
     auth: Optional[Auth] = None,
+    max_workers: Optional[int] = None,
+    concurrency: int = 1,
+    sig_key: Optional[str] = None,
+    workers: Optional[int] = None,
+    engine: Mode = Mode.ASYNCIO,
+    compression: Optional[Compression] = None,
+    codecs: Optional[Sequence[str]] = None,
+    metrics_address: Optional[Tuple[str, int]] = None,
+    max_connections: Optional[int] = None,
+    max_handlers: Optional[int] = None,
+    overload: Overload = Overload.REJECT,
+    drain_timeout: Optional[float] = DRAIN_TIMEOUT,
+    handoff: Optional[str] = None,
+    idle_timeout: Optional[float] = IDLE_TIMEOUT,
+    pubsub: Optional[PubSub] = None,
+    cache: Optional[ResponseCache] = None,
+    hot_restart: bool = False,
 ):
+    """
+    启动 muxp 服务器
+    handler_func: 处理函数, 或按路由 ID 分派到多个处理函数的 Router (各路由可单独设置执行方式、超时与并发上限)
+    max_workers: THREADPOOL 模式下的连接线程池大小; ASYNCIO/SELECTORS 模式下同步处理函数的线程池大小,
+                 SELECTORS 模式下为 0 时处理函数直接在事件循环中执行
+    concurrency: 单连接上并行处理的最大帧数, 旧版帧的响应按请求顺序写回, 带流 ID 的响应完成即写回
+    sig_key: 设置后在传输层对每帧负载透明加解密 (会话模式), 处理函数收发的都是明文
+    workers/engine: MULTIPROCESS 模式下的进程数 (默认 CPU 核数) 与每个进程使用的引擎 (ASYNCIO、SELECTORS 或 THREADPOOL)
+    compression: 允许客户端协商的帧压缩配置, 为 None 时不压缩
+    codecs: 允许客户端协商的编解码器名称 (见 register_codec); 设置后处理函数收发的是对象而不是 bytes,
+            未协商的连接使用 JSONCodec
+    metrics_address: 设置后在该地址提供 Prometheus 指标 (/metrics) 与 JSON 快照 (/stats), 建议只监听 127.0.0.1;
+                     MULTIPROCESS 模式下 worker i 监听端口 + i
+    max_connections: 最大连接数 (THREADPOOL 模式下为排队与处理中的连接数, 即 max_pending), THREADING 模式不限制
+    max_handlers: 所有连接共享的处理函数并发上限
+    overload: 达到上述上限时的降级策略, 见 Overload
+    drain_timeout: 收到 SIGTERM 或被新进程接管后优雅排空的最长时间 (秒): 停止 accept, 空闲连接立即关闭,
+                   在途帧写回后关闭其余连接; 为 None 时不处理 SIGTERM 且不支持热重启
+    handoff: 热重启用的 Unix socket 路径; 以相同 handoff 启动的新进程经该路径接管监听 socket (SCM_RIGHTS),
+             旧进程随即排空退出, 同时启用 SIGUSR2 (见 hot_restart)
+             (MULTIPROCESS 模式需要设置 handoff, 此时各 worker 共享监听 socket 而不使用 SO_REUSEPORT)
+    idle_timeout: 超过该时长 (秒) 没有收发数据且没有在途请求的连接被关闭, 为 None 时不关闭;
+                  协商了 v2 帧头的客户端会按更短的间隔发送心跳, 其连接不会因空闲被关闭
+    pubsub: 发布/订阅的主题注册表, 处理函数可以调用 pubsub.publish 向订阅者推送; 不设置时每个服务器各有一个
+            (THREADING、THREADPOOL、ASYNCIO 引擎支持, MULTIPROCESS 模式下每个 worker 的订阅者相互独立)
+    cache: 幂等处理函数的响应缓存 (见 ResponseCache), 相同的请求直接返回缓存的响应; MULTIPROCESS 模式下每个 worker 各有一份
+    hot_restart: 启用热重启 (设置了 handoff 时总是启用): 向进程发送 SIGUSR2 时以相同命令行启动继承监听 socket 的新进程,
+                 新进程就绪后本进程排空退出; 默认不启用, 嵌入其他程序时不会因信号重新启动整个进程
+    """
+    if pubsub is not None and Mode.SELECTORS in (mode, engine if mode == Mode.MULTIPROCESS else None):
+        raise ValueError("selectors 引擎不支持发布/订阅")
+    if (handoff is not None or hot_restart) and drain_timeout is None:
+        raise ValueError("热重启需要设置 drain_timeout")
+    restart = Handoff(handoff) if handoff is not None or hot_restart else None
+    sock = None
+    if restart is not None and (mode != Mode.MULTIPROCESS or handoff is not None):
+        sock = restart.acquire(address, socket.SOMAXCONN)
     if mode == Mode.THREADING:
         logger.info(f"[*] 使用 ThreadingMixIn 启动 muxp 服务器 {address}")
-        srv = ThreadingMuxpServer(address, handler_func, auth)
-        srv.serve_forever()
+        srv = ThreadingMuxpServer(address, handler_func, auth, concurrency, sig_key, sock=sock, compression=compression,
+                                  codecs=codecs, max_handlers=max_handlers, overload=overload, idle_timeout=idle_timeout,
+                                  pubsub=pubsub, cache=cache)
+        if metrics_address is not None:
+            srv.serve_metrics(metrics_address)
+        _serve(srv, srv.serve_forever, drain_timeout, restart)
     elif mode == Mode.THREADPOOL:
         logger.info(f"[*] 使用 ThreadPoolExecutor 启动 muxp 服务器 {address}")
-        srv = ThreadPoolMuxpServer(address, handler_func, auth)
-        srv.serve_forever()
+        srv = ThreadPoolMuxpServer(address, handler_func, auth, max_workers, concurrency, sig_key, sock=sock,
+                                   compression=compression, codecs=codecs, max_pending=max_connections,
+                                   max_handlers=max_handlers, overload=overload, idle_timeout=idle_timeout,
+                                   pubsub=pubsub, cache=cache)
+        if metrics_address is not None:
+            srv.serve_metrics(metrics_address)
+        _serve(srv, srv.serve_forever, drain_timeout, restart)
     elif mode == Mode.ASYNCIO:
         logger.info(f"[*] 使用 asyncio + TLS 启动 muxp 服务器 {address}")
-        server = AsyncioMuxpServer(address, handler_func, auth)
-        asyncio.run(server.start())
+        server = AsyncioMuxpServer(address, handler_func, auth, max_workers, concurrency, sig_key, sock=sock,
+                                   compression=compression, codecs=codecs, max_connections=max_connections,
+                                   max_handlers=max_handlers, overload=overload, idle_timeout=idle_timeout,
+                                   pubsub=pubsub, cache=cache)
+        if metrics_address is not None:
+            server.serve_metrics(metrics_address)
+        _serve(server, lambda: asyncio.run(server.start()), drain_timeout, restart)
+    elif mode == Mode.SELECTORS:
+        logger.info(f"[*] 使用 selectors 启动 muxp 服务器 {address}")
+        srv = SelectorsMuxpServer(address, handler_func, auth, max_workers, concurrency, sig_key, sock=sock,
+                                  compression=compression, codecs=codecs, max_connections=max_connections,
+                                  max_handlers=max_handlers, overload=overload, idle_timeout=idle_timeout,
+                                  cache=cache)
+        if metrics_address is not None:
+            srv.serve_metrics(metrics_address)
+        _serve(srv, srv.serve_forever, drain_timeout, restart)
+    elif mode == Mode.MULTIPROCESS:
+        # 每个 worker 各自限制连接数
+        options = {"max_pending" if engine == Mode.THREADPOOL else "max_connections": max_connections}
+        if pubsub is not None:
+            # fork 后每个 worker 持有各自的副本
+            options["pubsub"] = pubsub
+        if cache is not None:
+            options["cache"] = cache
+        logger.info(f"[*] 使用多进程 ({engine.value}) 启动 muxp 服务器 {address}")
+        srv = MultiProcessMuxpServer(address, handler_func, auth, workers, engine, metrics_address=metrics_address,
+                                     sock=sock, drain_timeout=drain_timeout, max_workers=max_workers,
+                                     concurrency=concurrency, sig_key=sig_key, compression=compression, codecs=codecs,
+                                     max_handlers=max_handlers, overload=overload, idle_timeout=idle_timeout, **options)
+        _serve(srv, srv.serve_forever, drain_timeout, restart)
     else:
         raise ValueError(f"未知模式：{mode}")
@@ -0,0 +1,74 @@
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class TimerWheel:
+    """
+    哈希时间轮: 大量连接的超时检查共用一个定时器, 登记、取消与每次推进都是 O(1) (与到期数量成正比)
+    - 时间被划分为 tick 秒的槽, 共 slots 个; 超过一圈 (tick * slots) 的延迟按一圈登记, 到期后由调用方重新检查
+    - 条目只按槽的精度到期 (不会提前, 最多晚一个 tick), 适合空闲淘汰、心跳这类不要求精确的定时
+    - 条目须可哈希; 同一条目只有一个到期时间, 重复登记时以最后一次为准
+    登记与推进可以在不同线程中进行
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64):
+        if tick <= 0 or slots <= 0:
+            raise ValueError("tick 与 slots 必须为正数")
+        self.tick = tick
+        self._slots: List[Dict[Any, None]] = [{} for _ in range(slots)]
+        self._where: Dict[Any, int] = {}  # 条目 -> 槽序号
+        self._lock = threading.Lock()
+        self._cursor = 0  # 下一个待处理的槽
+        self._next = time.monotonic() + tick  # 下一个槽到期的时间
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def next_expiry(self) -> float:
+        """下一个槽到期的 monotonic 时间, 供事件循环计算 select 的超时"""
+        return self._next
+
+    def schedule(self, item: Any, delay: float):
+        """delay 秒后 (按槽取整) 由 advance 返回 item"""
+        ticks = min(max(int(math.ceil(delay / self.tick)), 0), len(self._slots) - 1)
+        with self._lock:
+            old = self._where.get(item)
+            if old is not None:
+                del self._slots[old][item]
+            # 当前槽在 _next (不超过一个 tick 之后) 到期, 往后数 ticks 个槽保证不会提前到期
+            index = (self._cursor + ticks) % len(self._slots)
+            self._slots[index][item] = None
+            self._where[item] = index
+
+    def discard(self, item: Any):
+        with self._lock:
+            index = self._where.pop(item, None)
+            if index is not None:
+                del self._slots[index][item]
+
+    def advance(self, now: Optional[float] = None) -> List[Any]:
+        """处理 now 之前到期的所有槽, 返回到期的条目 (已从时间轮中移除)"""
+        if now is None:
+            now = time.monotonic()
+        expired: List[Any] = []
+        with self._lock:
+            if now - self._next >= self.tick * len(self._slots):
+                # 长时间没有推进 (如进程被挂起): 所有条目都已到期, 直接对齐到当前时间
+                expired.extend(self._where)
+                self._where.clear()
+                for slot in self._slots:
+                    slot.clear()
+                self._next = now + self.tick
+                return expired
+            while self._next <= now:
+                slot = self._slots[self._cursor]
+                if slot:
+                    expired.extend(slot)
+                    for item in slot:
+                        del self._where[item]
+                    slot.clear()
+                self._cursor = (self._cursor + 1) % len(self._slots)
+                self._next += self.tick
+        return expired
@@ -0,0 +1,446 @@
+"""
+muxp 压测工具: 在本地子进程中启动指定模式的服务器, 用 N 个并发的同步或异步客户端持续发送请求
+- 报告吞吐、延迟分位数 (p50/p99/p999)、服务端与压测端的 CPU 占用和常驻内存
+- --json 输出机器可读的结果, --baseline 与之前的结果比较, 吞吐下降或 p99 上升超过 --tolerance 时以状态码 1 退出
+
+用法:
+    python -m muxp.bench --modes threading,threadpool,asyncio --clients 32 --size 1024
+    python -m muxp.bench --modes asyncio --client async --tls --sig-key secret --json result.json
+    python -m muxp.bench --modes selectors --baseline result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from typing import Tuple, Optional, List, Dict, Any
+
+import muxp
+from muxp import Auth, Mode, Client, AsyncClient, Metrics, loop_safe
+
+
+HOST = "127.0.0.1"
+DEFAULT_MODES = "threading,threadpool,asyncio,selectors"
+PROC_CHILDREN = "/proc/{pid}/task/{pid}/children"
+
+
+###############################################################################
+# 服务端子进程
+###############################################################################
+
+def _handler(mode: Mode, engine: Mode, latency: float):
+    """回显处理函数; 设置了 latency 时模拟处理耗时, ASYNCIO 引擎下使用 async 处理函数"""
+    if not latency:
+        return loop_safe(lambda data: data)
+    if (engine if mode == Mode.MULTIPROCESS else mode) == Mode.ASYNCIO:
+        async def handler(data):
+            await asyncio.sleep(latency)
+            return data
+        return handler
+
+    def handler(data):
+        time.sleep(latency)
+        return data
+    return handler
+
+
+def _serve(config: Dict[str, Any]):
+    muxp.logger.setLevel("WARNING")
+    mode = Mode(config["mode"])
+    engine = Mode(config["engine"])
+    auth = Auth(**config["auth"]) if config["auth"] else None
+    muxp.run((HOST, config["port"]), _handler(mode, engine, config["handler_ms"] / 1000), mode=mode, auth=auth,
+             max_workers=config["max_workers"], concurrency=config["concurrency"], sig_key=config["sig_key"],
+             workers=config["workers"], engine=engine, metrics_address=(HOST, config["metrics_port"]))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def _start_server(config: Dict[str, Any]) -> subprocess.Popen:
+    env = dict(os.environ)
+    # 保证子进程导入的是同一份 muxp (例如以 PYTHONPATH=src 运行时)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(muxp.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (package_root, env.get("PYTHONPATH")) if p)
+    proc = subprocess.Popen([sys.executable, "-m", "muxp.bench", "--serve", json.dumps(config)], env=env)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{config['mode']} 服务器启动失败, 退出码 {proc.returncode}")
+        try:
+            socket.create_connection((HOST, config["port"]), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{config['mode']} 服务器启动超时")
+
+
+def _stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+###############################################################################
+# 资源采样 (Linux /proc, 其他平台不报告服务端资源)
+###############################################################################
+
+def _process_tree(pid: int) -> List[int]:
+    """pid 及其所有子进程, 多进程模式下的 worker 也计入服务端"""
+    pids = [pid]
+    for p in pids:
+        try:
+            with open(PROC_CHILDREN.format(pid=p)) as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def _cpu_seconds(pids: List[int]) -> Optional[float]:
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as f:
+                # comm 字段可能包含空格, 从最后一个 ')' 之后开始切分; utime/stime 为第 14、15 个字段
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+    except (OSError, IndexError, ValueError):
+        return None
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def _rss_mb(pids: List[int], key: str = "VmRSS:") -> Optional[float]:
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith(key))
+    except (OSError, StopIteration, ValueError):
+        return None
+    return total / 1024
+
+
+def _self_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+###############################################################################
+# 压测客户端
+###############################################################################
+
+class _State:
+    """压测进度: 预热结束后 measuring 为 True, 只统计测量窗口内完成的请求"""
+
+    def __init__(self):
+        self.measuring = False
+        self.stopped = False
+        self.metrics = Metrics()
+
+    def record(self, start: float, error: bool):
+        if not self.measuring:
+            return
+        if error:
+            self.metrics.inc("errors")
+        else:
+            self.metrics.inc("requests")
+            self.metrics.observe("latency", time.perf_counter() - start)
+
+
+def _sync_worker(address, auth: Optional[Auth], sig_key: Optional[str], payload: bytes, depth: int,
+                 state: _State, ready: threading.Barrier):
+    """每个线程一条连接, 每轮并发发出 depth 个请求并等待全部完成"""
+    client = Client(address, auth=auth, multiplex=True, sig_key=sig_key)
+    ready.wait()
+    try:
+        while not state.stopped:
+            batch = []
+            for _ in range(depth):
+                start = time.perf_counter()
+                fut = client.call(payload)
+                fut.add_done_callback(lambda f, start=start: state.record(start, f.exception() is not None))
+                batch.append(fut)
+            for fut in batch:
+                try:
+                    fut.result()
+                except Exception:
+                    pass
+    finally:
+        client.close()
+
+
+def _run_sync(address, auth, sig_key, payload, clients: int, depth: int, state: _State) -> List[threading.Thread]:
+    ready = threading.Barrier(clients + 1)
+    threads = [threading.Thread(target=_sync_worker, args=(address, auth, sig_key, payload, depth, state, ready),
+                                daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    return threads
+
+
+async def _async_worker(client: AsyncClient, payload: bytes, state: _State):
+    while not state.stopped:
+        start = time.perf_counter()
+        try:
+            await client.call(payload)
+        except Exception:
+            state.record(start, True)
+        else:
+            state.record(start, False)
+
+
+async def _async_main(address, auth, sig_key, payload, clients: int, depth: int, state: _State,
+                      ready: threading.Event):
+    """所有异步客户端共用一个事件循环, 每个客户端上有 depth 个协程各自串行发送"""
+    conns = [AsyncClient(address, auth=auth, multiplex=True, sig_key=sig_key) for _ in range(clients)]
+    await asyncio.gather(*(c.connect() for c in conns))
+    ready.set()
+    try:
+        await asyncio.gather(*(_async_worker(c, payload, state) for c in conns for _ in range(depth)))
+    finally:
+        await asyncio.gather(*(c.close() for c in conns), return_exceptions=True)
+
+
+def _run_async(address, auth, sig_key, payload, clients: int, depth: int, state: _State) -> List[threading.Thread]:
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(_async_main(address, auth, sig_key, payload, clients,
+                                                                    depth, state, ready),), daemon=True)
+    thread.start()
+    if not ready.wait(30):
+        raise RuntimeError("异步客户端连接超时")
+    return [thread]
+
+
+###############################################################################
+# 单项压测
+###############################################################################
+
+def _auth(certs: str, side: str) -> Dict[str, str]:
+    return {"certfile": os.path.join(certs, f"{side}.crt"), "keyfile": os.path.join(certs, f"{side}.key"),
+            "cafile": os.path.join(certs, "ca.crt")}
+
+
+def _fetch_stats(port: int, count: int) -> List[Dict[str, Any]]:
+    stats = []
+    for i in range(count):
+        try:
+            with urllib.request.urlopen(f"http://{HOST}:{port + i}/stats", timeout=5) as resp:
+                stats.append(json.loads(resp.read()))
+        except OSError:
+            pass
+    return stats
+
+
+def bench_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    workers = args.workers or os.cpu_count() or 1
+    config = {
+        "mode": mode, "engine": args.engine, "port": _free_port(), "metrics_port": _free_port(),
+        "auth": _auth(args.certs, "server") if args.tls else None,
+        "max_workers": args.max_workers, "concurrency": args.concurrency, "sig_key": args.sig_key,
+        "workers": workers, "handler_ms": args.handler_ms,
+    }
+    proc = _start_server(config)
+    try:
+        address = (HOST, config["port"])
+        auth = Auth(**_auth(args.certs, "client")) if args.tls else None
+        payload = os.urandom(args.size)
+        state = _State()
+        start_clients = _run_async if args.client == "async" else _run_sync
+        threads = start_clients(address, auth, args.sig_key, payload, args.clients, args.depth, state)
+        time.sleep(args.warmup)
+
+        pids = _process_tree(proc.pid)
+        server_cpu = _cpu_seconds(pids)
+        client_cpu = _self_cpu()
+        started = time.perf_counter()
+        state.measuring = True
+        time.sleep(args.duration)
+        state.measuring = False
+        elapsed = time.perf_counter() - started
+        server_end = _cpu_seconds(pids)
+        server_cpu = server_end - server_cpu if server_cpu is not None and server_end is not None else None
+        client_cpu = _self_cpu() - client_cpu
+        server_rss = _rss_mb(pids)
+        server_peak = _rss_mb(pids, "VmHWM:")
+
+        state.stopped = True
+        for t in threads:
+            t.join(timeout=15)
+        server_stats = _fetch_stats(config["metrics_port"], workers if mode == Mode.MULTIPROCESS.value else 1)
+    finally:
+        _stop_server(proc)
+
+    counters = state.metrics.counters()
+    latency = state.metrics.histogram("latency").summary()
+    requests = counters.get("requests", 0)
+    return {
+        "mode": mode,
+        "engine": args.engine if mode == Mode.MULTIPROCESS.value else None,
+        "client": args.client,
+        "clients": args.clients,
+        "depth": args.depth,
+        "size": args.size,
+        "tls": args.tls,
+        "signature": bool(args.sig_key),
+        "handler_ms": args.handler_ms,
+        "concurrency": args.concurrency,
+        "duration": elapsed,
+        "requests": requests,
+        "errors": counters.get("errors", 0),
+        "throughput": requests / elapsed,
+        "mb_per_s": requests * args.size * 2 / elapsed / 1024 / 1024,
+        "latency_ms": {k: v for k, v in latency.items() if k != "count"},
+        "server": {
+            "cpu_percent": server_cpu / elapsed * 100 if server_cpu is not None else None,
+            "rss_mb": server_rss,
+            "peak_rss_mb": server_peak,
+            "processes": len(pids),
+            "stats": server_stats,
+        },
+        "loadgen": {
+            "cpu_percent": client_cpu / elapsed * 100,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    }
+
+
+###############################################################################
+# 报告
+###############################################################################
+
+def _key(result: Dict[str, Any]) -> Tuple:
+    return tuple(result.get(k) for k in ("mode", "engine", "client", "clients", "depth", "size", "tls",
+                                         "signature", "handler_ms", "concurrency"))
+
+
+def _fmt(value: Optional[float], spec: str = ".1f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_header():
+    print(f"{'mode':>12} {'req/s':>9} {'MB/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'errors':>6} "
+          f"{'srv CPU%':>8} {'srv RSS':>8} {'gen CPU%':>8}")
+
+
+def print_result(result: Dict[str, Any]):
+    lat = result["latency_ms"]
+    server = result["server"]
+    print(f"{result['mode']:>12} {result['throughput']:>9.0f} {result['mb_per_s']:>7.1f} {lat['p50_ms']:>8.3f} "
+          f"{lat['p99_ms']:>8.3f} {lat['p999_ms']:>8.3f} {result['errors']:>6} {_fmt(server['cpu_percent']):>8} "
+          f"{_fmt(server['rss_mb']):>8} {result['loadgen']['cpu_percent']:>8.1f}")
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """与基线中配置相同的结果比较, 返回是否存在回退"""
+    previous = {_key(r): r for r in baseline.get("results", [])}
+    regressed = False
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None:
+            print(f"{result['mode']:>12} 基线中没有相同配置的结果")
+            continue
+        throughput = result["throughput"] / old["throughput"] - 1 if old["throughput"] else 0.0
+        p99 = result["latency_ms"]["p99_ms"] / old["latency_ms"]["p99_ms"] - 1 if old["latency_ms"]["p99_ms"] else 0.0
+        bad = throughput < -tolerance or p99 > tolerance
+        regressed = regressed or bad
+        print(f"{result['mode']:>12} 吞吐 {throughput:+.1%}  p99 {p99:+.1%}{'  <- 回退' if bad else ''}")
+    return regressed
+
+
+def _default_certs() -> str:
+    here = os.path.dirname(os.path.abspath(__file__))
+    candidates = [os.path.join("tests", "certs", "ssl"), os.path.join("certs", "ssl"),
+                  os.path.join(here, "..", "..", "tests", "certs", "ssl")]
+    return next((os.path.normpath(p) for p in candidates if os.path.isfile(os.path.join(p, "ca.crt"))),
+                candidates[0])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m muxp.bench", description="muxp 服务端压测")
+    parser.add_argument("--modes", default=DEFAULT_MODES, help=f"逗号分隔的运行模式 (默认 {DEFAULT_MODES})")
+    parser.add_argument("--engine", default=Mode.ASYNCIO.value, help="multiprocess 模式下每个 worker 的引擎")
+    parser.add_argument("--workers", type=int, default=None, help="multiprocess 模式的进程数 (默认 CPU 核数)")
+    parser.add_argument("--client", choices=("sync", "async"), default="sync",
+                        help="sync: 每个客户端一个线程; async: 所有客户端共用一个事件循环")
+    parser.add_argument("--clients", type=int, default=16, help="并发客户端 (连接) 数")
+    parser.add_argument("--depth", type=int, default=1, help="每个客户端的在途请求数")
+    parser.add_argument("--size", type=int, default=128, help="请求负载字节数 (服务端原样回显)")
+    parser.add_argument("--duration", type=float, default=5.0, help="测量时长 (秒)")
+    parser.add_argument("--warmup", type=float, default=1.0, help="预热时长 (秒), 不计入结果")
+    parser.add_argument("--tls", action="store_true", help="使用 TLS (双向认证)")
+    parser.add_argument("--certs", default=_default_certs(), help="证书目录, 需包含 ca.crt 与 server/client 证书")
+    parser.add_argument("--sig-key", default=None, help="设置后启用 Signature 会话加密")
+    parser.add_argument("--handler-ms", type=float, default=0.0, help="处理函数模拟耗时 (毫秒)")
+    parser.add_argument("--concurrency", type=int, default=1, help="服务端单连接上并行处理的最大帧数")
+    parser.add_argument("--max-workers", type=int, default=None, help="服务端线程池大小")
+    parser.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="与之前 --json 输出的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="判定回退的相对变化阈值 (默认 0.1)")
+    parser.add_argument("--serve", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.serve:
+        _serve(json.loads(args.serve))
+        return 0
+    modes = [Mode(m.strip()).value for m in args.modes.split(",") if m.strip()]
+    muxp.logger.setLevel("WARNING")
+    try:
+        # 每个客户端一个 socket, 大量并发连接时放宽文件描述符上限
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+    print(f"# client={args.client} clients={args.clients} depth={args.depth} size={args.size} tls={args.tls} "
+          f"signature={bool(args.sig_key)} handler_ms={args.handler_ms} duration={args.duration}s")
+    print_header()
+    results = []
+    for mode in modes:
+        result = bench_mode(mode, args)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "argv": sys.argv[1:] if argv is None else argv,
+            },
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"# 结果已写入 {args.json}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
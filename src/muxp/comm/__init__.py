@@ -1,16 +1,57 @@
 from ._proto import encode_data
 from ._proto import decode_data
+from ._proto import FrameDecoder
+from ._proto import Frame
+from ._proto import encode_frame
+from ._proto import frame_buffers
+from ._proto import sendmsg_all
+from ._proto import encode_hello
+from ._proto import decode_hello
+from ._proto import encode_publish
+from ._proto import decode_publish
+from ._proto import VERSION, FRAME_DATA, FRAME_HELLO, FRAME_CHUNK, FRAME_PING, FRAME_PONG, FLAG_ERROR, FLAG_END, FLAG_COMPRESSED, FLAG_BUSY, FLAG_ROUTE
+from ._proto import FRAME_SUBSCRIBE, FRAME_UNSUBSCRIBE, FRAME_PUBLISH
+from ._stream import ChunkStream
+from ._stream import AsyncChunkStream
+from ._stream import DEFAULT_CHUNK_SIZE
+from ._compress import Compression
+from ._compress import FrameCompressor
+from ._compress import train_dictionary
 from ._tls import Auth
 from ._tls import ssl_client_context
 from ._tls import ssl_server_context
 from ._codec import JSONCodec
+from ._codec import BinaryCodec
+from ._codec import StructCodec
+from ._codec import register_codec
+from ._codec import get_codec
+from ._codec import available_codecs
 
 
 __all__ = [
     Auth,
     encode_data,
     decode_data,
+    FrameDecoder,
+    Frame,
+    encode_frame,
+    frame_buffers,
+    sendmsg_all,
+    encode_hello,
+    decode_hello,
+    encode_publish,
+    decode_publish,
+    ChunkStream,
+    AsyncChunkStream,
+    Compression,
+    FrameCompressor,
+    train_dictionary,
     ssl_client_context,
     ssl_server_context,
     JSONCodec,
+    BinaryCodec,
+    StructCodec,
+    register_codec,
+    get_codec,
+    available_codecs,
 ]
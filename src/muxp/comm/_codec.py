@@ -1,5 +1,6 @@
 import json
-from typing import Any, Dict
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 class JSONCodec:
     @staticmethod
@@ -8,4 +9,405 @@ class JSONCodec:
 
     @staticmethod
     def decode(data: bytes) -> Any:
-        return json.loads(data.decode('utf-8'))
+        # str(..., 'utf-8') 同时接受 bytes 与 memoryview
+        return json.loads(str(data, 'utf-8'))
+
+
+class StructCodec:
+    """
+    定长消息的预编译 struct 编解码: 按字段顺序打包, 不写类型标记与字段名
+    fields 为 [(字段名, struct 格式), ...], 例如 [("id", "Q"), ("price", "d"), ("ok", "?")]
+    "s" 格式的字段解码为 bytes
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, str]], byte_order: str = "<"):
+        if not fields:
+            raise ValueError("struct 模式至少需要一个字段")
+        self.names: Tuple[str, ...] = tuple(name for name, _ in fields)
+        self._struct = struct.Struct(byte_order + "".join(fmt for _, fmt in fields))
+        self.size = self._struct.size
+
+    def encode(self, obj: Dict[str, Any]) -> bytes:
+        try:
+            return self._struct.pack(*[obj[name] for name in self.names])
+        except KeyError as e:
+            raise ValueError(f"缺少字段：{e}")
+        except struct.error as e:
+            raise ValueError(f"字段类型与 struct 模式不符: {e}")
+
+    def decode(self, data) -> Dict[str, Any]:
+        if len(data) != self.size:
+            raise ValueError(f"负载长度与 struct 模式不符: {len(data)} != {self.size}")
+        return dict(zip(self.names, self._struct.unpack_from(data)))
+
+
+###############################################################################
+# 紧凑二进制编码: 兼容 msgpack 格式的子集
+###############################################################################
+
+_BB = struct.Struct(">BB").pack
+_BH = struct.Struct(">BH").pack
+_BI = struct.Struct(">BI").pack
+_Bb = struct.Struct(">Bb").pack
+_Bh = struct.Struct(">Bh").pack
+_Bi = struct.Struct(">Bi").pack
+_BQ = struct.Struct(">BQ").pack
+_Bq = struct.Struct(">Bq").pack
+_Bd = struct.Struct(">Bd").pack
+_BBb = struct.Struct(">BBb").pack
+_BHb = struct.Struct(">BHb").pack
+_BIb = struct.Struct(">BIb").pack
+
+_H = struct.Struct(">H").unpack_from
+_I = struct.Struct(">I").unpack_from
+_Q = struct.Struct(">Q").unpack_from
+_b = struct.Struct(">b").unpack_from
+_h = struct.Struct(">h").unpack_from
+_i = struct.Struct(">i").unpack_from
+_q = struct.Struct(">q").unpack_from
+_f = struct.Struct(">f").unpack_from
+_d = struct.Struct(">d").unpack_from
+
+_MAX_SCHEMA_ID = 127  # msgpack 扩展类型为 int8, 负值保留给 msgpack 自身
+
+
+def _encode_header(out: bytearray, n: int, fix: int, fix_max: int, c8: Optional[int], c16: int, c32: int):
+    if n < fix_max:
+        out.append(fix | n)
+    elif c8 is not None and n < 0x100:
+        out += _BB(c8, n)
+    elif n < 0x10000:
+        out += _BH(c16, n)
+    elif n < 0x100000000:
+        out += _BI(c32, n)
+    else:
+        raise ValueError(f"长度超出编码范围: {n}")
+
+
+def _encode_int(out: bytearray, v: int):
+    if 0 <= v < 0x80:
+        out.append(v)
+    elif -0x20 <= v < 0:
+        out.append(v & 0xFF)
+    elif v >= 0:
+        if v < 0x100:
+            out += _BB(0xCC, v)
+        elif v < 0x10000:
+            out += _BH(0xCD, v)
+        elif v < 0x100000000:
+            out += _BI(0xCE, v)
+        elif v < 0x10000000000000000:
+            out += _BQ(0xCF, v)
+        else:
+            raise ValueError(f"整数超出 64 位范围: {v}")
+    elif v >= -0x80:
+        out += _Bb(0xD0, v)
+    elif v >= -0x8000:
+        out += _Bh(0xD1, v)
+    elif v >= -0x80000000:
+        out += _Bi(0xD2, v)
+    elif v >= -0x8000000000000000:
+        out += _Bq(0xD3, v)
+    else:
+        raise ValueError(f"整数超出 64 位范围: {v}")
+
+
+def _encode_bin(out: bytearray, data):
+    n = len(data) if not isinstance(data, memoryview) else data.nbytes
+    if n < 0x100:
+        out += _BB(0xC4, n)
+    elif n < 0x10000:
+        out += _BH(0xC5, n)
+    else:
+        out += _BI(0xC6, n)
+    out += data
+
+
+def _encode_ext(out: bytearray, ext_type: int, data: bytes):
+    n = len(data)
+    if n < 0x100:
+        out += _BBb(0xC7, n, ext_type)
+    elif n < 0x10000:
+        out += _BHb(0xC8, n, ext_type)
+    else:
+        out += _BIb(0xC9, n, ext_type)
+    out += data
+
+
+def _encode(obj, out: bytearray, schemas):
+    t = type(obj)
+    if t is str:
+        data = obj.encode('utf-8')
+        _encode_header(out, len(data), 0xA0, 32, 0xD9, 0xDA, 0xDB)
+        out += data
+    elif t is int:
+        _encode_int(out, obj)
+    elif t is dict:
+        if schemas is not None:
+            schema = schemas.get(frozenset(obj))
+            if schema is not None:
+                ext_type, codec = schema
+                try:
+                    packed = codec.encode(obj)
+                except ValueError:
+                    packed = None  # 字段类型不符时按通用格式编码
+                if packed is not None:
+                    _encode_ext(out, ext_type, packed)
+                    return
+        _encode_header(out, len(obj), 0x80, 16, None, 0xDE, 0xDF)
+        for key, value in obj.items():
+            _encode(key, out, schemas)
+            _encode(value, out, schemas)
+    elif t is list or t is tuple:
+        _encode_header(out, len(obj), 0x90, 16, None, 0xDC, 0xDD)
+        for item in obj:
+            _encode(item, out, schemas)
+    elif obj is None:
+        out.append(0xC0)
+    elif t is bool:
+        out.append(0xC3 if obj else 0xC2)
+    elif t is float:
+        out += _Bd(0xCB, obj)
+    elif t is bytes or t is bytearray or t is memoryview:
+        _encode_bin(out, obj)
+    # 子类 (IntEnum、OrderedDict 等) 走较慢的 isinstance 分支
+    elif isinstance(obj, bool):
+        out.append(0xC3 if obj else 0xC2)
+    elif isinstance(obj, int):
+        _encode_int(out, int(obj))
+    elif isinstance(obj, float):
+        out += _Bd(0xCB, float(obj))
+    elif isinstance(obj, str):
+        _encode(str(obj), out, schemas)
+    elif isinstance(obj, dict):
+        _encode(dict(obj), out, schemas)
+    elif isinstance(obj, (list, tuple)):
+        _encode(list(obj), out, schemas)
+    elif isinstance(obj, (bytes, bytearray)):
+        _encode_bin(out, bytes(obj))
+    else:
+        raise TypeError(f"无法编码的类型：{t.__name__}")
+
+
+def _decode(mv: memoryview, pos: int, codec: "BinaryCodec"):
+    b = mv[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    if b >= 0xE0:
+        return b - 0x100, pos
+    if b < 0x90:
+        return _decode_map(mv, pos, b & 0x0F, codec)
+    if b < 0xA0:
+        return _decode_array(mv, pos, b & 0x0F, codec)
+    if b < 0xC0:
+        end = pos + (b & 0x1F)
+        if end > len(mv):
+            raise ValueError("数据不完整")
+        return str(mv[pos:end], 'utf-8'), end
+    if b == 0xC0:
+        return None, pos
+    if b == 0xC2:
+        return False, pos
+    if b == 0xC3:
+        return True, pos
+    if b == 0xCB:
+        return _d(mv, pos)[0], pos + 8
+    if b == 0xCC:
+        return mv[pos], pos + 1
+    if b == 0xCD:
+        return _H(mv, pos)[0], pos + 2
+    if b == 0xCE:
+        return _I(mv, pos)[0], pos + 4
+    if b == 0xCF:
+        return _Q(mv, pos)[0], pos + 8
+    if b == 0xD0:
+        return _b(mv, pos)[0], pos + 1
+    if b == 0xD1:
+        return _h(mv, pos)[0], pos + 2
+    if b == 0xD2:
+        return _i(mv, pos)[0], pos + 4
+    if b == 0xD3:
+        return _q(mv, pos)[0], pos + 8
+    if b == 0xCA:
+        return _f(mv, pos)[0], pos + 4
+    if b in (0xD9, 0xDA, 0xDB):
+        n, pos = _decode_length(mv, pos, b - 0xD9)
+        end = pos + n
+        if end > len(mv):
+            raise ValueError("数据不完整")
+        return str(mv[pos:end], 'utf-8'), end
+    if b in (0xC4, 0xC5, 0xC6):
+        n, pos = _decode_length(mv, pos, b - 0xC4)
+        end = pos + n
+        if end > len(mv):
+            raise ValueError("数据不完整")
+        return (mv[pos:end] if codec.zero_copy else bytes(mv[pos:end])), end
+    if b in (0xDC, 0xDD):
+        n, pos = _decode_length(mv, pos, b - 0xDC + 1)
+        return _decode_array(mv, pos, n, codec)
+    if b in (0xDE, 0xDF):
+        n, pos = _decode_length(mv, pos, b - 0xDE + 1)
+        return _decode_map(mv, pos, n, codec)
+    if b in (0xC7, 0xC8, 0xC9):
+        n, pos = _decode_length(mv, pos, b - 0xC7)
+        return _decode_ext(mv, pos + 1, n, _b(mv, pos)[0], codec)
+    if 0xD4 <= b <= 0xD8:
+        return _decode_ext(mv, pos + 1, 1 << (b - 0xD4), _b(mv, pos)[0], codec)
+    raise ValueError(f"无法识别的类型标记: 0x{b:02x}")
+
+
+def _decode_length(mv: memoryview, pos: int, width: int) -> Tuple[int, int]:
+    """width: 0/1/2 分别对应 8/16/32 位长度"""
+    if width == 0:
+        return mv[pos], pos + 1
+    if width == 1:
+        return _H(mv, pos)[0], pos + 2
+    return _I(mv, pos)[0], pos + 4
+
+
+# 容器内最常见的正 fixint、fixstr 与 float64 就地解码, 省去一次递归调用
+
+def _decode_array(mv: memoryview, pos: int, n: int, codec: "BinaryCodec"):
+    items = []
+    append = items.append
+    for _ in range(n):
+        b = mv[pos]
+        if b < 0x80:
+            append(b)
+            pos += 1
+        elif 0xA0 <= b < 0xC0:
+            end = pos + 1 + (b & 0x1F)
+            if end > len(mv):
+                raise ValueError("数据不完整")
+            append(str(mv[pos + 1:end], 'utf-8'))
+            pos = end
+        elif b == 0xCB:
+            append(_d(mv, pos + 1)[0])
+            pos += 9
+        else:
+            item, pos = _decode(mv, pos, codec)
+            append(item)
+    return items, pos
+
+
+def _decode_map(mv: memoryview, pos: int, n: int, codec: "BinaryCodec"):
+    result = {}
+    for _ in range(n):
+        b = mv[pos]
+        if 0xA0 <= b < 0xC0:
+            end = pos + 1 + (b & 0x1F)
+            if end > len(mv):
+                raise ValueError("数据不完整")
+            key = str(mv[pos + 1:end], 'utf-8')
+            pos = end
+        else:
+            key, pos = _decode(mv, pos, codec)
+        b = mv[pos]
+        if b < 0x80:
+            result[key] = b
+            pos += 1
+        elif 0xA0 <= b < 0xC0:
+            end = pos + 1 + (b & 0x1F)
+            if end > len(mv):
+                raise ValueError("数据不完整")
+            result[key] = str(mv[pos + 1:end], 'utf-8')
+            pos = end
+        elif b == 0xCB:
+            result[key] = _d(mv, pos + 1)[0]
+            pos += 9
+        else:
+            result[key], pos = _decode(mv, pos, codec)
+    return result, pos
+
+
+def _decode_ext(mv: memoryview, pos: int, n: int, ext_type: int, codec: "BinaryCodec"):
+    schema = codec.schemas.get(ext_type)
+    if schema is None:
+        raise ValueError(f"未注册的扩展类型: {ext_type}")
+    end = pos + n
+    if end > len(mv):
+        raise ValueError("数据不完整")
+    return schema.decode(mv[pos:end]), end
+
+
+class BinaryCodec:
+    """
+    紧凑二进制编解码, 采用 msgpack 格式的子集 (None/bool/int/float/str/bytes/list/dict), 纯 Python 实现
+    - 解码直接在 memoryview 上按偏移读取, 不把负载拷贝成 bytes; zero_copy=True 时 bytes 字段
+      以指向输入缓冲的 memoryview 返回, 仅在输入缓冲有效期间可用
+    - schemas 为 {扩展类型号: StructCodec}: 键集合与某个模式的字段完全一致的 dict 打包成定长 struct,
+      作为 msgpack 扩展类型写出, 省去字段名与类型标记; 双方必须注册相同的模式
+    tuple 编码为数组, 解码得到 list
+    """
+
+    def __init__(self, schemas: Optional[Dict[int, StructCodec]] = None, zero_copy: bool = False):
+        self.schemas: Dict[int, StructCodec] = dict(schemas or {})
+        for ext_type in self.schemas:
+            if not 0 <= ext_type <= _MAX_SCHEMA_ID:
+                raise ValueError(f"扩展类型号需在 0-{_MAX_SCHEMA_ID} 之间: {ext_type}")
+        self._by_fields = {frozenset(codec.names): (ext_type, codec) for ext_type, codec in self.schemas.items()}
+        if len(self._by_fields) != len(self.schemas):
+            raise ValueError("多个 struct 模式的字段集合相同")
+        self.zero_copy = zero_copy
+
+    def encode(self, obj: Any) -> bytes:
+        out = bytearray()
+        _encode(obj, out, self._by_fields or None)
+        return bytes(out)
+
+    def decode(self, data) -> Any:
+        mv = data if isinstance(data, memoryview) else memoryview(data)
+        if mv.format != 'B' or mv.ndim != 1:
+            mv = mv.cast('B')
+        try:
+            obj, pos = _decode(mv, 0, self)
+        except (IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"数据不完整或已损坏: {e}")
+        except TypeError as e:
+            # 例如 map 的键解码为 list
+            raise ValueError(f"数据已损坏: {e}")
+        if pos != len(mv):
+            raise ValueError(f"解码后仍有 {len(mv) - pos} 字节多余数据")
+        return obj
+
+
+###############################################################################
+# 编解码注册表
+###############################################################################
+
+_CODECS: Dict[str, Any] = {}
+
+
+def register_codec(name: str, codec: Any):
+    """
+    注册编解码器, codec 需要提供 encode(obj) -> bytes 与 decode(data) -> obj
+    客户端与服务端按名称协商, 同名编解码器在两端必须兼容
+    """
+    if not callable(getattr(codec, "encode", None)) or not callable(getattr(codec, "decode", None)):
+        raise ValueError(f"编解码器 {name} 需要提供 encode 与 decode 方法")
+    _CODECS[name] = codec
+
+
+def get_codec(name: str) -> Any:
+    try:
+        return _CODECS[name]
+    except KeyError:
+        raise ValueError(f"未注册的编解码器：{name}")
+
+
+def available_codecs() -> List[str]:
+    return list(_CODECS)
+
+
+def resolve_codecs(names: Optional[Sequence[str]]) -> Optional[List[str]]:
+    """校验允许协商的编解码器名称, 未注册时抛出 ValueError"""
+    if names is None:
+        return None
+    for name in names:
+        get_codec(name)
+    return list(names)
+
+
+register_codec("json", JSONCodec)
+register_codec("binary", BinaryCodec())
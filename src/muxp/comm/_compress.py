@@ -0,0 +1,214 @@
+import hashlib
+import lzma
+import threading
+import zlib
+from collections import Counter
+from typing import Tuple, Optional, List, Dict, Any, Sequence, Iterable
+from ._proto import FLAG_COMPRESSED
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖, 未安装时只协商标准库算法
+    zstandard = None
+
+
+# 按默认优先级排列: zstd 压缩率与速度兼顾, zlib 最通用, lzma 压缩率最高但最慢
+ALGORITHMS: Tuple[str, ...] = tuple(name for name in ("zstd", "zlib", "lzma") if name != "zstd" or zstandard)
+
+DEFAULT_THRESHOLD = 256            # 小于该长度的负载压缩收益很小, 原样发送
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # 解压后的最大长度, 防止解压炸弹
+
+_DICT_ALGORITHMS = ("zstd", "zlib")  # lzma 不支持预置字典
+_ERRORS = (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def dictionary_id(zdict: Optional[bytes]) -> Optional[str]:
+    """共享字典的指纹, 协商时双方指纹一致才启用字典"""
+    return hashlib.sha256(zdict).hexdigest()[:16] if zdict else None
+
+
+def train_dictionary(samples: Sequence[bytes], size: int = 16 * 1024) -> bytes:
+    """
+    用一批典型消息训练共享字典, 用于提升小消息的压缩率
+    - 安装了 zstandard 时使用 zstd 的字典训练
+    - 否则从样本中统计出现最频繁的片段拼成 zlib 预置字典 (高频片段放在末尾, 匹配距离更短)
+    """
+    if not samples:
+        raise ValueError("训练字典至少需要一条样本")
+    if zstandard is not None:
+        try:
+            return zstandard.train_dictionary(size, list(samples)).as_bytes()
+        except zstandard.ZstdError:
+            # 样本过少时 zstd 训练会失败, 退化为片段统计
+            pass
+    counts: Counter = Counter()
+    for sample in samples:
+        sample = bytes(sample)
+        for width in (32, 16, 8):
+            for i in range(0, len(sample) - width + 1, width // 2):
+                counts[sample[i:i + width]] += width
+    zdict = bytearray()
+    for piece, _ in counts.most_common():
+        if len(zdict) + len(piece) > size:
+            break
+        if piece not in zdict:
+            zdict[:0] = piece
+    return bytes(zdict)
+
+
+class FrameCompressor:
+    """
+    单条连接上协商好的压缩器
+    - compress 返回 (负载, 帧标志), 负载过短或压缩后没有变小时原样返回且不设置 FLAG_COMPRESSED
+    - 可在多个线程中并发使用, zstd 的压缩/解压对象按线程缓存
+    """
+
+    def __init__(self, algorithm: str, level: Optional[int] = None, threshold: int = DEFAULT_THRESHOLD,
+                 zdict: Optional[bytes] = None, max_size: int = DEFAULT_MAX_SIZE):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"不支持的压缩算法：{algorithm}")
+        self.algorithm = algorithm
+        self.level = level
+        self.threshold = threshold
+        self.zdict = zdict if algorithm in _DICT_ALGORITHMS else None
+        self.max_size = max_size
+        self._local = threading.local()
+        self._zlib_base = None
+        self._zstd_dict = None
+        if algorithm == "zstd" and self.zdict:
+            self._zstd_dict = zstandard.ZstdCompressionDict(self.zdict)
+
+    def __repr__(self) -> str:
+        return f"FrameCompressor({self.algorithm!r}, zdict={dictionary_id(self.zdict)})"
+
+    def compress(self, data: bytes) -> Tuple[bytes, int]:
+        if len(data) < self.threshold:
+            return data, 0
+        packed = getattr(self, f"_compress_{self.algorithm}")(data)
+        if len(packed) >= len(data):
+            return data, 0
+        return packed, FLAG_COMPRESSED
+
+    def decompress(self, data) -> bytes:
+        try:
+            return getattr(self, f"_decompress_{self.algorithm}")(data)
+        except _ERRORS as e:
+            raise ValueError(f"解压失败: {e}")
+
+    def _too_large(self):
+        return ValueError(f"解压后的负载超出限制: > {self.max_size}")
+
+    # ---- zlib: raw deflate, 省去 zlib 头与校验和 ----
+
+    def _compress_zlib(self, data: bytes) -> bytes:
+        if self._zlib_base is None:
+            level = zlib.Z_DEFAULT_COMPRESSION if self.level is None else self.level
+            if self.zdict:
+                self._zlib_base = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=self.zdict)
+            else:
+                self._zlib_base = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        # 复制已载入字典的压缩对象, 比每条消息重新载入字典快约 3 倍
+        c = self._zlib_base.copy()
+        return c.compress(data) + c.flush()
+
+    def _decompress_zlib(self, data) -> bytes:
+        if self.zdict:
+            d = zlib.decompressobj(-zlib.MAX_WBITS, zdict=self.zdict)
+        else:
+            d = zlib.decompressobj(-zlib.MAX_WBITS)
+        out = d.decompress(data, self.max_size)
+        if d.unconsumed_tail:
+            raise self._too_large()
+        return out
+
+    # ---- lzma ----
+
+    def _compress_lzma(self, data: bytes) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_ALONE, preset=6 if self.level is None else self.level)
+
+    def _decompress_lzma(self, data) -> bytes:
+        d = lzma.LZMADecompressor(format=lzma.FORMAT_ALONE)
+        out = d.decompress(data, self.max_size)
+        if not d.eof:
+            raise self._too_large() if len(out) >= self.max_size else ValueError("lzma 数据不完整")
+        return out
+
+    # ---- zstd (可选) ----
+
+    def _zstd(self, kind: str):
+        obj = getattr(self._local, kind, None)
+        if obj is None:
+            if kind == "compressor":
+                obj = zstandard.ZstdCompressor(level=3 if self.level is None else self.level,
+                                               dict_data=self._zstd_dict, write_content_size=True)
+            else:
+                obj = zstandard.ZstdDecompressor(dict_data=self._zstd_dict)
+            setattr(self._local, kind, obj)
+        return obj
+
+    def _compress_zstd(self, data: bytes) -> bytes:
+        return self._zstd("compressor").compress(data)
+
+    def _decompress_zstd(self, data) -> bytes:
+        params = zstandard.get_frame_parameters(data)
+        if params.content_size > self.max_size:
+            raise self._too_large()
+        return self._zstd("decompressor").decompress(data, max_output_size=self.max_size)
+
+
+class Compression:
+    """
+    帧压缩配置, 客户端与服务端各自持有, 在 HELLO 协商时确定每条连接使用的算法
+    - algorithms: 本端支持的算法, 按优先级排列, 默认使用所有可用算法 (zstd 需要安装 zstandard)
+    - threshold: 负载不小于该长度才压缩
+    - level: 压缩级别, None 时使用各算法的默认值
+    - zdict: 预先训练的共享字典 (见 train_dictionary), 双方字典指纹一致且算法支持时才启用
+    - max_size: 解压后的最大长度
+    客户端按自己的优先级提出候选算法, 服务端选出双方都支持的第一个; 任一方未配置压缩或对端为旧版本时不压缩
+    压缩只作用于 v2 帧 (multiplex=True 的请求与响应), 旧版帧与分块流保持原样
+    """
+
+    def __init__(self, algorithms: Optional[Iterable[str]] = None, threshold: int = DEFAULT_THRESHOLD,
+                 level: Optional[int] = None, zdict: Optional[bytes] = None, max_size: int = DEFAULT_MAX_SIZE):
+        if algorithms is None:
+            algorithms = ALGORITHMS
+        self.algorithms: List[str] = []
+        for name in algorithms:
+            if name == "zstd" and zstandard is None:
+                raise ValueError("zstd 压缩需要安装 zstandard")
+            if name not in ("zstd", "zlib", "lzma"):
+                raise ValueError(f"不支持的压缩算法：{name}")
+            self.algorithms.append(name)
+        self.threshold = threshold
+        self.level = level
+        self.zdict = zdict
+        self.max_size = max_size
+        self.zdict_id = dictionary_id(zdict)
+
+    def _compressor(self, algorithm: str, use_dict: bool) -> FrameCompressor:
+        return FrameCompressor(algorithm, self.level, self.threshold,
+                               self.zdict if use_dict else None, self.max_size)
+
+    def offer(self) -> Dict[str, Any]:
+        """客户端 HELLO 中携带的压缩选项"""
+        return {"compression": self.algorithms, "zdict": self.zdict_id}
+
+    def accept(self, options: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[FrameCompressor]]:
+        """服务端: 根据客户端的候选算法做出选择, 返回 (HELLO 应答中的压缩选项, 压缩器)"""
+        offered = options.get("compression")
+        if not isinstance(offered, list):
+            return {}, None
+        chosen = next((name for name in offered if name in self.algorithms), None)
+        if chosen is None:
+            return {"compression": None}, None
+        use_dict = bool(self.zdict_id) and options.get("zdict") == self.zdict_id and chosen in _DICT_ALGORITHMS
+        return ({"compression": chosen, "zdict": self.zdict_id if use_dict else None},
+                self._compressor(chosen, use_dict))
+
+    def select(self, options: Dict[str, Any]) -> Optional[FrameCompressor]:
+        """客户端: 按服务端 HELLO 应答启用压缩, 应答中没有可用算法时返回 None"""
+        chosen = options.get("compression")
+        if chosen not in self.algorithms:
+            return None
+        use_dict = bool(self.zdict_id) and options.get("zdict") == self.zdict_id
+        return self._compressor(chosen, use_dict)
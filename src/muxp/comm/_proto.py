@@ -1,11 +1,137 @@
+import json
+import os
+import ssl
 import struct
-from typing import Tuple, List
+from typing import Tuple, List, Iterator, Optional, NamedTuple, Dict, Any, Iterable
 
 _HEAD_SIZE = 4
+_HEAD = struct.Struct(">I")
+
+# v2 帧头: magic, version, type, flags, stream_id, length
+# 旧版帧头为 >I 长度前缀, 帧长远小于 16MB, 首字节恒为 0, 因此可以按首字节区分两种帧
+MAGIC = 0xA7
+VERSION = 2
+_HEAD_V2 = struct.Struct(">BBBBII")
+_HEAD_V2_SIZE = _HEAD_V2.size
+
+# 帧类型
+FRAME_DATA = 0
+FRAME_HELLO = 1  # 连接建立时的协商帧, 负载为 JSON
+FRAME_CHUNK = 2  # 分块流中的一块, 同一流 ID 的分块按顺序组成一条消息
+FRAME_PING = 3   # 心跳, 流 ID 为 0, 对端以负载相同的 FRAME_PONG 应答
+FRAME_PONG = 4
+# 订阅: 客户端发出时带流 ID, 负载为 UTF-8 主题名, 服务端以同一流 ID 的 DATA 帧确认
+FRAME_SUBSCRIBE = 5
+FRAME_UNSUBSCRIBE = 6
+# 发布: 负载为 >H 主题长度 + 主题 + 消息; 客户端发布时带流 ID, 服务端的确认负载为收到消息的订阅者数;
+# 服务端向订阅者推送时流 ID 为 0
+FRAME_PUBLISH = 7
+
+# 帧标志位
+FLAG_ERROR = 0x01  # 服务端处理失败, 负载为错误信息; 用于分块帧时表示发送方中止了该流
+FLAG_END = 0x02    # 分块流的最后一块
+FLAG_COMPRESSED = 0x04  # 负载经过连接协商的算法压缩 (先压缩再加密)
+FLAG_BUSY = 0x08   # 与 FLAG_ERROR 同时出现: 服务端过载, 请求未被处理, 可以稍后重试
+# 负载前 2 字节 (>H) 为路由 ID, 属于帧头的扩展, 不参与压缩与加密, 服务端无需解码负载即可分派 (见 muxp.Router)
+FLAG_ROUTE = 0x10
+
+
+class Frame(NamedTuple):
+    payload: memoryview
+    stream_id: Optional[int] = None  # None 表示旧版帧
+    kind: int = FRAME_DATA
+    flags: int = 0
+    route: Optional[int] = None  # 带 FLAG_ROUTE 时的路由 ID, 已从负载中去除
+
+_ROUTE = struct.Struct(">H")
 
 def encode_data(data: bytes) -> bytes:
     return struct.pack(">I", len(data)) + data
 
+def frame_header(length: int, stream_id: Optional[int] = None, kind: int = FRAME_DATA, flags: int = 0) -> bytes:
+    if stream_id is None:
+        return _HEAD.pack(length)
+    return _HEAD_V2.pack(MAGIC, VERSION, kind, flags, stream_id, length)
+
+def encode_frame(data: bytes, stream_id: Optional[int] = None, kind: int = FRAME_DATA, flags: int = 0,
+                 route: Optional[int] = None) -> bytes:
+    """stream_id 为 None 时使用旧版帧格式, 否则使用 v2 帧头; route 不为 None 时在帧头后附加路由 ID"""
+    if stream_id is None:
+        if route is not None:
+            raise ValueError("旧版帧不支持路由 ID")
+        return encode_data(data)
+    if route is not None:
+        if not 0 <= route <= 0xFFFF:
+            raise ValueError(f"路由 ID 超出范围: {route}")
+        return _HEAD_V2.pack(MAGIC, VERSION, kind, flags | FLAG_ROUTE, stream_id, len(data) + _ROUTE.size) \
+            + _ROUTE.pack(route) + data
+    return _HEAD_V2.pack(MAGIC, VERSION, kind, flags, stream_id, len(data)) + data
+
+_TOPIC = struct.Struct(">H")
+
+def encode_publish(topic: str, data: bytes, stream_id: int = 0, flags: int = 0) -> bytes:
+    """编码 FRAME_PUBLISH 帧, data 为已经压缩/加密的消息 (flags 描述 data)"""
+    name = topic.encode('utf-8')
+    if len(name) > 0xFFFF:
+        raise ValueError("主题名过长")
+    payload = b"".join((_TOPIC.pack(len(name)), name, data))
+    return _HEAD_V2.pack(MAGIC, VERSION, FRAME_PUBLISH, flags, stream_id, len(payload)) + payload
+
+def decode_publish(payload) -> Tuple[str, memoryview]:
+    """拆分 FRAME_PUBLISH 的负载, 返回 (主题, 消息)"""
+    view = memoryview(payload)
+    if len(view) < _TOPIC.size:
+        raise ValueError("发布帧格式无效")
+    end = _TOPIC.size + _TOPIC.unpack_from(view)[0]
+    if len(view) < end:
+        raise ValueError("发布帧格式无效")
+    return bytes(view[_TOPIC.size:end]).decode('utf-8'), view[end:]
+
+def frame_buffers(payloads: Iterable[bytes], stream_id: Optional[int] = None) -> List[bytes]:
+    """为一批负载生成 [帧头, 负载, 帧头, 负载, ...], 负载不做拼接拷贝, 供 sendmsg/writelines 使用"""
+    buffers: List[bytes] = []
+    for data in payloads:
+        buffers.append(frame_header(len(data), stream_id))
+        buffers.append(data)
+    return buffers
+
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+
+def sendmsg_all(sock, buffers: List[bytes]) -> int:
+    """
+    scatter-gather 发送: 纯 TCP socket 上用 sendmsg 一次系统调用发送多段缓冲并处理部分发送,
+    不支持 sendmsg 的 socket (如 TLS) 退化为拼接后 sendall
+    """
+    total = sum(len(b) for b in buffers)
+    if not hasattr(sock, "sendmsg") or isinstance(sock, ssl.SSLSocket):
+        sock.sendall(b"".join(buffers))
+        return total
+    views = [memoryview(b) for b in buffers if len(b)]
+    while views:
+        sent = sock.sendmsg(views[:_IOV_MAX])
+        # 跳过已完整发送的缓冲, 截断发送了一部分的缓冲
+        index = 0
+        while index < len(views) and sent >= len(views[index]):
+            sent -= len(views[index])
+            index += 1
+        del views[:index]
+        if views and sent:
+            views[0] = views[0][sent:]
+    return total
+
+def encode_hello(options: Dict[str, Any]) -> bytes:
+    return encode_frame(json.dumps(options).encode('utf-8'), 0, FRAME_HELLO)
+
+def decode_hello(payload) -> Dict[str, Any]:
+    try:
+        options = json.loads(bytes(payload).decode('utf-8'))
+    except ValueError:
+        return {}
+    return options if isinstance(options, dict) else {}
+
 def decode_data(data: bytes) -> Tuple[List[bytes], bytes]:
     messages: List[bytes] = []
     offset = 0
@@ -19,3 +145,129 @@ def decode_data(data: bytes) -> Tuple[List[bytes], bytes]:
         else:
             break
     return messages, data[offset:]
+
+
+class FrameDecoder:
+    """
+    增量帧解码器
+
+    - 内部使用可增长的 bytearray 作为接收缓冲, 支持 recv_into 直接写入, 避免 buffer += data 的二次方拷贝
+    - 每帧只解析一次帧头, 已知帧长后一次性预留足够空间, 大帧可以大块读取
+    - 同时识别旧版长度前缀帧与 v2 帧头
+    - frames() 产出 Frame, 其中 payload 是指向内部缓冲的 memoryview,
+      仅在下一次 feed/recv_into 之前有效, 需要长期持有时请自行 bytes(payload)
+    """
+
+    INITIAL_SIZE = 64 * 1024
+    MIN_READ = 4096
+
+    def __init__(self, max_frame_size: Optional[int] = None, initial_size: int = INITIAL_SIZE):
+        self.max_frame_size = max_frame_size
+        self._initial_size = initial_size
+        self._buf = bytearray(initial_size)
+        self._start = 0  # 未消费数据的起点
+        self._end = 0    # 已写入数据的终点
+        self._length: Optional[int] = None  # 当前帧的负载长度(帧头已解析时)
+        self._head = _HEAD_SIZE
+        self._meta: Tuple[Optional[int], int, int] = (None, FRAME_DATA, 0)
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def _reserve(self, size: int):
+        """保证 _end 之后至少还有 size 字节可写"""
+        if len(self._buf) - self._end >= size:
+            return
+        pending = self._end - self._start
+        need = pending + size
+        if need <= len(self._buf):
+            # 原地搬移未消费数据到缓冲头部 (不改变 bytearray 大小)
+            self._buf[:pending] = self._buf[self._start:self._end]
+        else:
+            # 重新分配而不是 resize, 已导出的 memoryview 仍然指向旧缓冲
+            capacity = max(need, len(self._buf) * 2)
+            buf = bytearray(capacity)
+            buf[:pending] = self._buf[self._start:self._end]
+            self._buf = buf
+        self._start, self._end = 0, pending
+
+    def read_size(self) -> int:
+        """下一次读取的期望大小: 帧头已解析时一次性读完整个帧"""
+        pending = self._end - self._start
+        if self._length is not None:
+            return max(self._head + self._length - pending, self.MIN_READ)
+        return self.MIN_READ
+
+    def _compact(self):
+        if self._start == self._end:
+            self._start = self._end = 0
+            # 处理完大帧后收缩回初始大小, 避免空闲连接长期占用大缓冲
+            if len(self._buf) > self._initial_size and self._length is None:
+                self._buf = bytearray(self._initial_size)
+
+    def recv_into(self, sock, nbytes: int = 0) -> int:
+        """直接从 socket 读取到内部缓冲, 返回读取的字节数 (0 表示对端关闭)"""
+        self._compact()
+        size = nbytes or self.read_size()
+        self._reserve(size)
+        if not nbytes:
+            # 尽量填满剩余空间, 小帧场景下一次系统调用可以取回多帧
+            size = len(self._buf) - self._end
+        n = sock.recv_into(memoryview(self._buf)[self._end:self._end + size], size)
+        self._end += n
+        return n
+
+    def feed(self, data: bytes):
+        """追加外部读取到的数据 (asyncio 等拿到 bytes 的路径)"""
+        if not data:
+            return
+        self._compact()
+        self._reserve(len(data))
+        self._buf[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def _parse_head(self, pending: int) -> bool:
+        if self._buf[self._start] == MAGIC:
+            if pending < _HEAD_V2_SIZE:
+                return False
+            _, _, kind, flags, stream_id, length = _HEAD_V2.unpack_from(self._buf, self._start)
+            self._head = _HEAD_V2_SIZE
+            self._meta = (stream_id, kind, flags)
+        else:
+            if pending < _HEAD_SIZE:
+                return False
+            length = _HEAD.unpack_from(self._buf, self._start)[0]
+            self._head = _HEAD_SIZE
+            self._meta = (None, FRAME_DATA, 0)
+        if self.max_frame_size is not None and length > self.max_frame_size:
+            raise ValueError(f"帧长度超出限制: {length} > {self.max_frame_size}")
+        self._length = length
+        return True
+
+    def frames(self) -> Iterator[Frame]:
+        """产出缓冲中所有完整的帧"""
+        view = memoryview(self._buf)
+        while True:
+            pending = self._end - self._start
+            if self._length is None:
+                if not pending or not self._parse_head(pending):
+                    return
+            if pending < self._head + self._length:
+                return
+            start = self._start + self._head
+            end = start + self._length
+            self._start = end
+            self._length = None
+            stream_id, kind, flags = self._meta
+            if flags & FLAG_ROUTE:
+                if end - start < _ROUTE.size:
+                    raise ValueError("路由帧格式无效")
+                route = _ROUTE.unpack_from(self._buf, start)[0]
+                yield Frame(view[start + _ROUTE.size:end], stream_id, kind, flags & ~FLAG_ROUTE, route)
+            else:
+                yield Frame(view[start:end], stream_id, kind, flags)
+
+    def clear(self):
+        self._buf = bytearray(self._initial_size)
+        self._start = self._end = 0
+        self._length = None
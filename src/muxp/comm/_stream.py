@@ -0,0 +1,414 @@
+import asyncio
+import io
+import mmap
+import os
+import ssl
+import stat
+import threading
+from collections import deque
+from collections.abc import Iterator as _Iterator, AsyncIterator as _AsyncIterator
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+from ._proto import frame_header, sendmsg_all, FRAME_CHUNK, FLAG_END, FLAG_ERROR
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+STREAM_WINDOW = 8  # 接收端每个流最多缓存的未消费分块数
+
+_END = object()
+
+
+def is_stream_source(obj) -> bool:
+    """处理函数的返回值是否需要以分块流发送: 文件对象、迭代器或异步迭代器"""
+    return hasattr(obj, "read") or isinstance(obj, (_Iterator, _AsyncIterator))
+
+
+def _file_span(source) -> Optional[Tuple[int, int]]:
+    """普通文件返回 (当前偏移, 剩余长度), 可以走 sendfile/mmap; 其他对象返回 None"""
+    try:
+        st = os.fstat(source.fileno())
+        offset = source.tell()
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return offset, max(st.st_size - offset, 0)
+
+
+def _mmap_chunks(source, offset: int, size: int, chunk_size: int) -> Iterator[memoryview]:
+    """通过 mmap 读取文件, 分块直接引用映射内存, 不经过 read() 拷贝"""
+    mm = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        end = min(offset + size, len(mm))
+        for start in range(offset, end, chunk_size):
+            yield view[start:min(start + chunk_size, end)]
+        source.seek(end)
+    finally:
+        view.release()
+        try:
+            mm.close()
+        except BufferError:
+            # 仍有分块被发送缓冲引用, 由垃圾回收关闭映射
+            pass
+
+
+def iter_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """把 bytes、二进制文件对象或 bytes 可迭代对象切成不超过 chunk_size 的分块"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+        return
+    if hasattr(source, "read"):
+        span = _file_span(source)
+        if span is not None and span[1] > 0:
+            yield from _mmap_chunks(source, span[0], span[1], chunk_size)
+            return
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                return
+            yield data
+    for item in source:
+        if len(item) <= chunk_size:
+            yield item
+            continue
+        view = memoryview(item)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+
+def _with_last(chunks: Iterator[Any]) -> Iterator[Tuple[Any, bool]]:
+    """标记最后一块; 跳过空分块, 空流产出一个空的最后分块"""
+    prev = None
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        if prev is not None:
+            yield prev, False
+        prev = chunk
+    yield (b"" if prev is None else prev), True
+
+
+def _abort_frame(stream_id: int, exc: BaseException) -> bytes:
+    payload = str(exc).encode("utf-8")
+    return frame_header(len(payload), stream_id, FRAME_CHUNK, FLAG_END | FLAG_ERROR) + payload
+
+
+def send_stream(sock, lock, stream_id: int, source, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                seal: Optional[Callable[[bytes], bytes]] = None) -> int:
+    """
+    以分块帧发送 source, 返回发送的负载字节数
+    - 每块单独持锁发送, 同一连接上的其他帧可以穿插在分块之间
+    - 纯 TCP 且不加密时普通文件通过 socket.sendfile 零拷贝发送, 其余文件用 mmap 读取
+    - source 读取出错时发送中止帧后重新抛出原异常; socket 写入失败抛出 ConnectionError
+    """
+    if seal is None and not isinstance(sock, ssl.SSLSocket) and hasattr(source, "read"):
+        span = _file_span(source)
+        if span is not None and span[1] > 0:
+            return _sendfile_chunks(sock, lock, stream_id, source, span, chunk_size)
+    chunks = _with_last(iter_chunks(source, chunk_size))
+    total = 0
+    while True:
+        try:
+            chunk, last = next(chunks)
+            if seal is not None:
+                chunk = seal(bytes(chunk))
+        except StopIteration:
+            return total
+        except Exception as e:
+            try:
+                with lock:
+                    sock.sendall(_abort_frame(stream_id, e))
+            except OSError:
+                pass
+            raise
+        try:
+            with lock:
+                sendmsg_all(sock, [frame_header(len(chunk), stream_id, FRAME_CHUNK, FLAG_END if last else 0), chunk])
+        except OSError as e:
+            raise ConnectionError(f"发送失败: {e}") from e
+        total += len(chunk)
+
+
+def chunk_frames(stream_id: int, source, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 seal: Optional[Callable[[bytes], bytes]] = None) -> Iterator[bytes]:
+    """逐块产出编码好的分块帧, 供不直接写 socket 的引擎使用; source 读取出错时先产出中止帧再抛出异常"""
+    chunks = _with_last(iter_chunks(source, chunk_size))
+    while True:
+        try:
+            chunk, last = next(chunks)
+            chunk = seal(bytes(chunk)) if seal is not None else bytes(chunk)
+        except StopIteration:
+            return
+        except Exception as e:
+            yield _abort_frame(stream_id, e)
+            raise
+        yield frame_header(len(chunk), stream_id, FRAME_CHUNK, FLAG_END if last else 0) + chunk
+
+
+def _sendfile_chunks(sock, lock, stream_id: int, source, span: Tuple[int, int], chunk_size: int) -> int:
+    offset, size = span
+    end = offset + size
+    while offset < end:
+        count = min(chunk_size, end - offset)
+        last = offset + count >= end
+        try:
+            with lock:
+                sock.sendall(frame_header(count, stream_id, FRAME_CHUNK, FLAG_END if last else 0))
+                sent = sock.sendfile(source, offset, count)
+        except OSError as e:
+            # 帧头已发出, 无论是 socket 还是文件出错连接都无法继续使用
+            raise ConnectionError(f"发送失败: {e}") from e
+        if sent != count:
+            # 帧头已声明了长度, 无法继续, 只能断开连接
+            raise ConnectionError(f"文件在发送过程中被截断: 期望 {count} 字节, 实际 {sent} 字节")
+        offset += count
+    return size
+
+
+class ChunkStream:
+    """
+    分块流的接收端 (同步迭代器), 迭代得到每一块的 bytes, 迭代结束即流结束
+    - 读取端 put 分块, 未消费的分块超过 window 个时阻塞, 通过 TCP 对发送方形成背压
+    - 发送方中止或连接断开时迭代抛出 ConnectionError
+    - 不再读取时调用 close(), 之后到达的分块直接丢弃, 避免读取端一直阻塞
+    """
+
+    def __init__(self, window: int = STREAM_WINDOW, unseal: Optional[Callable[[bytes], bytes]] = None,
+                 on_drain: Optional[Callable[[], Any]] = None):
+        self._chunks: Deque[bytes] = deque()
+        self._cond = threading.Condition()
+        self._window = window
+        self._unseal = unseal
+        self._on_drain = on_drain  # 从已满状态取出分块时回调, 供非阻塞引擎恢复读取
+        self._ended = False
+        self._closed = False
+        self._error: Optional[Exception] = None
+
+    def full(self) -> bool:
+        return len(self._chunks) >= self._window and not self._closed
+
+    def put(self, chunk: bytes, block: bool = True):
+        with self._cond:
+            while block and len(self._chunks) >= self._window and not self._closed and self._error is None:
+                self._cond.wait()
+            if self._closed:
+                return
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def end(self):
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+
+    def abort(self, exc: Exception):
+        with self._cond:
+            self._error = exc
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._chunks.clear()
+            self._cond.notify_all()
+        if self._on_drain is not None:
+            self._on_drain()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        with self._cond:
+            while not self._chunks and not self._ended and self._error is None and not self._closed:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            if not self._chunks:
+                raise StopIteration
+            drained = len(self._chunks) >= self._window
+            chunk = self._chunks.popleft()
+            self._cond.notify_all()
+        if drained and self._on_drain is not None:
+            self._on_drain()
+        return self._unseal(chunk) if self._unseal else chunk
+
+    def read(self) -> bytes:
+        """读取剩余的全部分块并拼接 (会把整个流读入内存)"""
+        return b"".join(self)
+
+
+class AsyncChunkStream:
+    """
+    分块流的接收端 (asyncio), 支持 async for; 在其他线程中也可以用普通 for 迭代 (线程池中的同步处理函数)
+    - 读取协程 await put, 未消费的分块超过 window 个时挂起, 形成背压
+    """
+
+    def __init__(self, window: int = STREAM_WINDOW, unseal: Optional[Callable[[bytes], bytes]] = None):
+        self._queue: asyncio.Queue = asyncio.Queue(window)
+        self._loop = asyncio.get_running_loop()
+        self._unseal = unseal
+        self._ended = False
+        self._closed = False
+        self._error: Optional[Exception] = None
+
+    async def put(self, chunk: bytes):
+        if not self._closed:
+            await self._queue.put(chunk)
+
+    async def end(self):
+        if not self._closed:
+            await self._queue.put(_END)
+
+    def abort(self, exc: Exception):
+        self._error = exc
+        try:
+            self._queue.put_nowait(_END)
+        except asyncio.QueueFull:
+            # 队列已满说明消费者没有在等待, 下次取分块时会先检查错误
+            pass
+
+    def close(self):
+        """在事件循环线程中调用: 丢弃已缓存与之后到达的分块"""
+        self._closed = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def _next_raw(self) -> bytes:
+        if self._error is not None:
+            raise self._error
+        if self._ended:
+            raise StopAsyncIteration
+        chunk = await self._queue.get()
+        if self._error is not None:
+            raise self._error
+        if chunk is _END:
+            self._ended = True
+            raise StopAsyncIteration
+        return chunk
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        chunk = await self._next_raw()
+        return self._unseal(chunk) if self._unseal else chunk
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        """仅可在事件循环以外的线程中调用, 解密在调用线程中完成"""
+        try:
+            chunk = asyncio.run_coroutine_threadsafe(self._next_raw(), self._loop).result()
+        except StopAsyncIteration:
+            raise StopIteration
+        return self._unseal(chunk) if self._unseal else chunk
+
+    async def read(self) -> bytes:
+        """读取剩余的全部分块并拼接 (会把整个流读入内存)"""
+        return b"".join([chunk async for chunk in self])
+
+
+class WriteGate:
+    """
+    asyncio 连接的写入口
+    - loop.sendfile 进行期间 transport 不允许其他写入, 这期间的写入先暂存, 结束后按顺序写出
+    - drain 串行化 (Python 3.10 之前 drain 不支持多个协程同时等待)
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._held: Optional[List[bytes]] = None
+        self._sendfile_lock = asyncio.Lock()
+        self._drain_lock = asyncio.Lock()
+
+    def write(self, data: bytes):
+        if self._held is not None:
+            self._held.append(bytes(data))
+        else:
+            self.writer.write(data)
+
+    def writelines(self, buffers: Iterable[bytes]):
+        if self._held is not None:
+            self._held.extend(bytes(b) for b in buffers)
+        else:
+            self.writer.writelines(buffers)
+
+    async def drain(self):
+        async with self._drain_lock:
+            await self.writer.drain()
+
+    async def sendfile(self, header: bytes, file, offset: int, count: int) -> int:
+        async with self._sendfile_lock:
+            self.writer.write(header)
+            self._held = []
+            try:
+                return await asyncio.get_running_loop().sendfile(self.writer.transport, file, offset, count)
+            finally:
+                held, self._held = self._held, None
+                if held:
+                    self.writer.writelines(held)
+
+
+async def _aiter_chunks(source, chunk_size: int):
+    if hasattr(source, "__aiter__"):
+        async for item in source:
+            for chunk in iter_chunks(item, chunk_size):
+                yield chunk
+        return
+    for chunk in iter_chunks(source, chunk_size):
+        yield chunk
+
+
+async def send_stream_async(gate: WriteGate, stream_id: int, source, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            seal: Optional[Callable[[bytes], bytes]] = None) -> int:
+    """
+    send_stream 的 asyncio 版本, source 还可以是异步迭代器
+    纯 TCP 且不加密时普通文件通过 loop.sendfile 发送, 每块写出后 drain
+    """
+    tls = gate.writer.get_extra_info("sslcontext") is not None
+    if seal is None and not tls and hasattr(source, "read"):
+        span = _file_span(source)
+        if span is not None and span[1] > 0:
+            offset, size = span
+            end = offset + size
+            while offset < end:
+                count = min(chunk_size, end - offset)
+                flags = FLAG_END if offset + count >= end else 0
+                sent = await gate.sendfile(frame_header(count, stream_id, FRAME_CHUNK, flags), source, offset, count)
+                if sent != count:
+                    raise ConnectionError(f"文件在发送过程中被截断: 期望 {count} 字节, 实际 {sent} 字节")
+                offset += count
+            return size
+    total = 0
+    prev = None
+    chunks = _aiter_chunks(source, chunk_size)
+    while True:
+        try:
+            chunk = await chunks.__anext__()
+            if not len(chunk):
+                continue
+        except StopAsyncIteration:
+            chunk = None
+        except Exception as e:
+            gate.write(_abort_frame(stream_id, e))
+            await gate.drain()
+            raise
+        if prev is not None or chunk is None:
+            data = b"" if prev is None else prev
+            if seal is not None:
+                data = seal(bytes(data))
+            flags = FLAG_END if chunk is None else 0
+            gate.write(frame_header(len(data), stream_id, FRAME_CHUNK, flags))
+            gate.write(data)
+            total += len(data)
+            await gate.drain()
+        if chunk is None:
+            return total
+        prev = chunk
+
+
+def join_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> bytes:
+    """对端不支持分块流 (旧版帧) 时把流式响应拼接成一条消息"""
+    return b"".join(bytes(chunk) for chunk in iter_chunks(source, chunk_size))
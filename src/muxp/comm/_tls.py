@@ -1,6 +1,10 @@
+import contextvars
+import os
 import ssl
+import threading
+import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Dict, Tuple, Any
 
 @dataclass
 class Auth:
@@ -8,17 +12,107 @@ class Auth:
     keyfile: str
     cafile: str
 
-def ssl_server_context(auth: Optional[Auth]):
+# 进程级的 SSLContext 缓存: 加载证书链的开销只付一次, 同一 context 上的会话才能互相恢复
+# 键包含证书文件的修改时间, 原地轮换证书后会生成新的 context
+_lock = threading.Lock()
+_contexts: Dict[Tuple[Any, ...], ssl.SSLContext] = {}
+# 客户端可恢复的 TLS 会话, 键为 (context, host, port), 同一进程内的所有客户端共享
+_sessions: Dict[Tuple[ssl.SSLContext, str, int], ssl.SSLSession] = {}
+
+# TLS 1.3 每次完整握手后服务端下发的会话票据数; 客户端每次重连只用一张并换回一张新的, 多发只会浪费带宽
+SESSION_TICKETS = 1
+
+
+def _auth_key(side: str, auth: Optional[Auth]) -> Tuple[Any, ...]:
+    if not auth:
+        return (side,)
+    files = (auth.certfile, auth.keyfile, auth.cafile)
+    mtimes = []
+    for path in files:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return (side,) + files + tuple(mtimes)
+
+
+def _cached(key: Tuple[Any, ...], factory) -> ssl.SSLContext:
+    with _lock:
+        context = _contexts.get(key)
+        if context is None:
+            context = _contexts[key] = factory()
+        return context
+
+
+def _new_server_context(auth: Optional[Auth]) -> ssl.SSLContext:
     context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
     context.verify_mode = ssl.CERT_REQUIRED if auth else ssl.CERT_NONE
     if auth:
         context.load_cert_chain(auth.certfile, auth.keyfile)
         context.load_verify_locations(auth.cafile)
+    # 会话票据 (无状态恢复): 票据密钥属于 context, fork 出的子进程共用同一 context 时票据在各 worker 间通用
+    context.options &= ~ssl.OP_NO_TICKET
+    if hasattr(context, "num_tickets"):
+        context.num_tickets = SESSION_TICKETS
     return context
 
-def ssl_client_context(auth: Optional[Auth]):
-    context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+
+# asyncio 的 open_connection 不接受 session 参数, AsyncClient 在建立连接前把待恢复的会话放在这里;
+# 握手所在的回调继承发起连接的 Task 的上下文, 同一事件循环上并发连接互不干扰
+pending_session: "contextvars.ContextVar[Optional[ssl.SSLSession]]" = contextvars.ContextVar(
+    "muxp_pending_session", default=None)
+
+
+class _ResumableContext(ssl.SSLContext):
+    """wrap_bio 未指定会话时使用 pending_session"""
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = pending_session.get()
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
+def _new_client_context(auth: Optional[Auth]) -> ssl.SSLContext:
+    # 与 ssl.create_default_context(ssl.Purpose.SERVER_AUTH) 相同的配置
+    context = _ResumableContext(ssl.PROTOCOL_TLS_CLIENT)
     if auth:
         context.load_cert_chain(auth.certfile, auth.keyfile)
         context.load_verify_locations(auth.cafile)
+    else:
+        context.load_default_certs(ssl.Purpose.SERVER_AUTH)
     return context
+
+
+def ssl_server_context(auth: Optional[Auth]):
+    return _cached(_auth_key("server", auth), lambda: _new_server_context(auth))
+
+
+def ssl_client_context(auth: Optional[Auth]):
+    """进程内共享的客户端 context, 调用方不应再修改其配置"""
+    return _cached(_auth_key("client", auth), lambda: _new_client_context(auth))
+
+
+def get_session(context: ssl.SSLContext, address: Tuple[str, int]) -> Optional[ssl.SSLSession]:
+    """取出可用于恢复到 address 的会话, 没有或已过期时返回 None"""
+    key = (context, address[0], address[1])
+    session = _sessions.get(key)
+    if session is not None and session.timeout and session.time + session.timeout <= time.time():
+        _sessions.pop(key, None)
+        return None
+    return session
+
+
+def remember_session(context: ssl.SSLContext, address: Tuple[str, int], ssl_obj) -> bool:
+    """
+    保存连接上可恢复的会话, 供下次连接 address 时使用
+    TLS 1.3 的票据在握手之后才到达, 应在读到应用数据之后 (或关闭连接前) 调用
+    """
+    try:
+        session = ssl_obj.session
+    except (AttributeError, ValueError):
+        return False
+    if session is None or not (session.has_ticket or session.id):
+        return False
+    _sessions[(context, address[0], address[1])] = session
+    return True
+
@@ -1,6 +1,59 @@
 import hmac
 import hashlib
+import itertools
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+class KeyCache:
+    """
+    PBKDF2 主密钥的 LRU 缓存, 以 (sig_key, salt) 为键, 线程安全
+    会话模式下同一会话的所有消息共用一个 salt, 接收端每个会话只需派生一次
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._keys: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, item: Tuple[str, bytes]) -> bool:
+        with self._lock:
+            return item in self._keys
+
+    def get(self, sig_key: str, salt: bytes) -> bytes:
+        item = (sig_key, bytes(salt))
+        with self._lock:
+            key = self._keys.get(item)
+            if key is not None:
+                self._keys.move_to_end(item)
+                self.hits += 1
+                return key
+            self.misses += 1
+        # 派生过程较慢, 不持有锁
+        key = Signature.derive_key(item[1], sig_key)
+        with self._lock:
+            self._keys[item] = key
+            self._keys.move_to_end(item)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+key_cache = KeyCache()
+
 
 class Signature:
     """
@@ -10,6 +63,7 @@ class Signature:
     NONCE_LENGTH = 16
     HMAC_LENGTH = 32
     PBKDF2_ITER = 10_000  # 性能优化
+    NUMPY_THRESHOLD = 64 * 1024  # 超过该长度且安装了 numpy 时使用 numpy 异或
 
     @staticmethod
     def encrypt(data: bytes, sig_key: str = "hello") -> bytes:
@@ -22,6 +76,8 @@ class Signature:
 
     @staticmethod
     def decrypt(data: bytes, sig_key: str = "hello") -> bytes:
+        if data.startswith(SignatureSession.PREFIX):
+            return SignatureSession.open(data, sig_key)
         if not data.startswith(b"ENC"):
             raise ValueError("解密数据格式无效")
         salt = data[3:19]
@@ -39,16 +95,102 @@ class Signature:
     def derive_key(cls, salt: bytes, sig_key: str = "hello world") -> bytes:
         return hashlib.pbkdf2_hmac('sha256', sig_key.encode(), salt, Signature.PBKDF2_ITER, Signature.KEY_LENGTH)
 
+    @classmethod
+    def keystream(cls, key: bytes, length: int) -> bytes:
+        """
+        生成 length 字节的密钥流: sha256(key), sha256(上一块), ...
+        整批生成后一次拼接, 避免逐字节处理
+        """
+        sha256 = hashlib.sha256
+
+        def blocks():
+            block = sha256(key).digest()
+            while True:
+                yield block
+                block = sha256(block).digest()
+
+        count = (length + 31) // 32
+        return b"".join(itertools.islice(blocks(), count))[:length]
+
     @classmethod
     def stream_cipher(cls, data: bytes, key: bytes) -> bytes:
-        # 按块生成 keystream 避免效率低
-        keystream = hashlib.sha256(key).digest()
-        output = bytearray()
-        i = 0
-        for b in data:
-            if i >= len(keystream):
-                keystream = hashlib.sha256(keystream).digest()
-                i = 0
-            output.append(b ^ keystream[i])
-            i += 1
-        return bytes(output)
+        # 按块生成 keystream 避免效率低, 整个缓冲区一次性异或
+        n = len(data)
+        if not n:
+            return b""
+        keystream = cls.keystream(key, n)
+        if _np is not None and n >= cls.NUMPY_THRESHOLD:
+            return _np.bitwise_xor(_np.frombuffer(data, dtype=_np.uint8),
+                                   _np.frombuffer(keystream, dtype=_np.uint8)).tobytes()
+        return (int.from_bytes(data, "little") ^ int.from_bytes(keystream, "little")).to_bytes(n, "little")
+
+
+class SignatureSession:
+    """
+    会话模式的套接字数据加密解密
+    PBKDF2 每个会话/密钥周期只运行一次, 每条消息的密钥由 HMAC-SHA256(主密钥, nonce) 派生
+    数据格式: b"ENS" + salt + nonce + ciphertext + mac, salt 标识会话的密钥周期
+    """
+    PREFIX = b"ENS"
+    SALT_LENGTH = 16
+
+    def __init__(self, sig_key: str = "hello", max_messages: int = 1 << 20, max_age: float = 3600.0):
+        self.sig_key = sig_key
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._salt = b""
+        self._master = b""
+        self._count = 0
+        self._born = 0.0
+
+    def _epoch(self) -> Tuple[bytes, bytes]:
+        """返回当前密钥周期的 (salt, 主密钥), 超过消息数或时长时轮换"""
+        with self._lock:
+            if (not self._salt or self._count >= self.max_messages
+                    or time.monotonic() - self._born >= self.max_age):
+                self._salt = secrets.token_bytes(self.SALT_LENGTH)
+                self._master = key_cache.get(self.sig_key, self._salt)
+                self._count = 0
+                self._born = time.monotonic()
+            self._count += 1
+            return self._salt, self._master
+
+    @staticmethod
+    def _message_key(master: bytes, nonce: bytes) -> bytes:
+        return hmac.new(master, nonce, hashlib.sha256).digest()
+
+    def encrypt(self, data: bytes) -> bytes:
+        salt, master = self._epoch()
+        nonce = secrets.token_bytes(Signature.NONCE_LENGTH)
+        key = self._message_key(master, nonce)
+        ciphertext = Signature.stream_cipher(data, key)
+        mac = hmac.new(key, nonce + ciphertext, hashlib.sha256).digest()
+        return self.PREFIX + salt + nonce + ciphertext + mac
+
+    def decrypt(self, data: bytes) -> bytes:
+        """同时接受会话格式与 Signature.encrypt 的旧格式"""
+        return Signature.decrypt(data, self.sig_key)
+
+    def needs_derive(self, data: bytes) -> bool:
+        """解密 data 是否需要运行 PBKDF2 (可据此把解密移出事件循环)"""
+        if not data.startswith(self.PREFIX):
+            return True
+        salt = bytes(data[3:3 + self.SALT_LENGTH])
+        return (self.sig_key, salt) not in key_cache
+
+    @classmethod
+    def open(cls, data: bytes, sig_key: str = "hello") -> bytes:
+        head = len(cls.PREFIX) + cls.SALT_LENGTH + Signature.NONCE_LENGTH
+        if len(data) < head + Signature.HMAC_LENGTH:
+            raise ValueError("解密数据格式无效")
+        salt = data[3:3 + cls.SALT_LENGTH]
+        nonce = data[3 + cls.SALT_LENGTH:head]
+        mac_offset = len(data) - Signature.HMAC_LENGTH
+        ciphertext = data[head:mac_offset]
+        mac = data[mac_offset:]
+        key = cls._message_key(key_cache.get(sig_key, salt), nonce)
+        expected_mac = hmac.new(key, nonce + ciphertext, hashlib.sha256).digest()
+        if not hmac.compare_digest(mac, expected_mac):
+            raise ValueError("HMAC 认证失败, 数据可能已经被篡改或修改过.")
+        return Signature.stream_cipher(ciphertext, key)
@@ -0,0 +1,69 @@
+"""
+编解码基准: JSONCodec 对比 BinaryCodec (msgpack 子集) 与带 struct 模式的 BinaryCodec
+- 消息取自典型的 RPC 请求/响应结构
+- decode 的输入为 memoryview, 与服务端从接收缓冲中取出的负载一致
+
+用法: python bench_codec.py
+"""
+import random
+import time
+from muxp import JSONCodec, BinaryCodec, StructCodec
+
+
+ROUNDS = 2000
+
+QUOTE = StructCodec([("symbol_id", "I"), ("bid", "d"), ("ask", "d"), ("volume", "Q"), ("ts", "q")])
+
+
+def make_messages(rng: random.Random):
+    small = {
+        "method": "user.get",
+        "request_id": f"{rng.getrandbits(64):016x}",
+        "params": {"user_id": rng.randint(1, 10 ** 6), "fields": ["name", "email", "vip"]},
+    }
+    medium = {
+        "request_id": f"{rng.getrandbits(64):016x}",
+        "status": "ok",
+        "items": [
+            {
+                "id": rng.randint(1, 10 ** 9),
+                "name": rng.choice(["alpha", "beta", "gamma", "delta"]) + f"-{rng.randint(0, 999)}",
+                "price": round(rng.uniform(1, 1000), 2),
+                "tags": rng.sample(["new", "hot", "sale", "vip", "gift", "limited"], 3),
+                "in_stock": rng.random() > 0.3,
+            }
+            for _ in range(20)
+        ],
+    }
+    quotes = {
+        "channel": "quotes",
+        "quotes": [
+            {"symbol_id": rng.randint(1, 5000), "bid": rng.uniform(10, 500), "ask": rng.uniform(10, 500),
+             "volume": rng.randint(0, 10 ** 7), "ts": 1700000000000 + i}
+            for i in range(50)
+        ],
+    }
+    return [("small", small), ("medium", medium), ("quotes", quotes)]
+
+
+def timeit(func, arg) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(arg)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    codecs = [("json", JSONCodec), ("binary", BinaryCodec()), ("binary+schema", BinaryCodec({1: QUOTE}))]
+    print(f"{'message':>8} {'codec':>14} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for title, msg in make_messages(random.Random(42)):
+        for name, codec in codecs:
+            data = codec.encode(msg)
+            view = memoryview(bytearray(data))
+            assert codec.decode(view) == JSONCodec.decode(JSONCodec.encode(msg)), "解码结果不一致"
+            print(f"{title:>8} {name:>14} {len(data):>7} {timeit(codec.encode, msg):>10.1f} "
+                  f"{timeit(codec.decode, view):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
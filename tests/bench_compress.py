@@ -0,0 +1,69 @@
+"""
+帧压缩基准: 各算法在 JSONCodec 消息上的压缩率与压缩/解压速度, 以及共享字典对小消息的效果
+
+用法: python bench_compress.py
+"""
+import random
+import time
+from muxp import JSONCodec, train_dictionary
+from muxp.comm import FrameCompressor
+from muxp.comm._compress import ALGORITHMS
+
+
+def make_message(rng: random.Random, items: int) -> bytes:
+    return JSONCodec.encode({
+        "request_id": f"{rng.getrandbits(64):016x}",
+        "method": rng.choice(["user.get", "user.list", "order.create", "order.query"]),
+        "timestamp": 1700000000 + rng.randint(0, 10 ** 6),
+        "items": [
+            {
+                "id": rng.randint(1, 10 ** 6),
+                "name": rng.choice(["alpha", "beta", "gamma", "delta"]) + f"-{rng.randint(0, 999)}",
+                "price": round(rng.uniform(1, 1000), 2),
+                "tags": rng.sample(["new", "hot", "sale", "vip", "gift", "limited"], 3),
+                "in_stock": rng.random() > 0.3,
+            }
+            for _ in range(items)
+        ],
+    })
+
+
+def timeit(func, batch) -> float:
+    """整批处理的平均耗时, 批量较小时多跑几轮"""
+    rounds = max(1, (2 * 1024 * 1024) // max(sum(len(data) for data in batch), 1))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in batch:
+            func(data)
+    return (time.perf_counter() - start) / rounds
+
+
+def bench(title: str, messages, compressors):
+    raw = sum(len(m) for m in messages)
+    print(f"\n{title}: {len(messages)} 条, 平均 {raw // len(messages)} 字节")
+    print(f"{'algorithm':>12} {'ratio':>7} {'compress MB/s':>14} {'decompress MB/s':>16}")
+    for name, comp in compressors:
+        packed = [comp.compress(m) for m in messages]
+        size = sum(len(p) for p, _ in packed)
+        t_comp = timeit(comp.compress, messages)
+        t_decomp = timeit(comp.decompress, [p for p, flags in packed if flags])
+        for m, (p, flags) in zip(messages, packed):
+            assert (comp.decompress(p) if flags else p) == m, "解压结果不一致"
+        print(f"{name:>12} {raw / size:>6.2f}x {raw / t_comp / 1024 / 1024:>14.1f} "
+              f"{(raw / t_decomp / 1024 / 1024 if t_decomp else 0):>16.1f}")
+
+
+def main():
+    rng = random.Random(42)
+    large = [make_message(rng, 200) for _ in range(5)]
+    small = [make_message(rng, 1) for _ in range(200)]
+    zdict = train_dictionary([make_message(rng, 1) for _ in range(500)])
+    bench("大消息", large, [(name, FrameCompressor(name)) for name in ALGORITHMS])
+    compressors = [(name, FrameCompressor(name, threshold=0)) for name in ALGORITHMS]
+    compressors += [(f"{name}+dict", FrameCompressor(name, threshold=0, zdict=zdict))
+                    for name in ALGORITHMS if name != "lzma"]
+    bench(f"小消息 (字典 {len(zdict)} 字节)", small, compressors)
+
+
+if __name__ == '__main__':
+    main()
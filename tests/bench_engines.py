@@ -0,0 +1,158 @@
+"""
+服务器引擎对比基准: THREADING / THREADPOOL / ASYNCIO / SELECTORS
+- conn/s: 逐个建立连接, 完成一次请求后关闭
+- msg/s: 多条连接并发流水线发送旧版帧
+- RSS: 保持 IDLE 条空闲连接时服务端进程的常驻内存
+
+用法: python bench_engines.py [IDLE]
+"""
+import socket
+import subprocess
+import sys
+import threading
+import struct
+import time
+from muxp.comm import encode_data, FrameDecoder
+
+
+HOST = "127.0.0.1"
+DURATION = 2.0   # 每项测试时长(秒)
+CONNS = 8        # msg/s 测试的并发连接数
+BATCH = 64       # 每条连接每轮流水线发送的帧数
+IDLE = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+IDLE_DEADLINE = 60.0  # 建立空闲连接的最长时间, 积压队列溢出时 SYN 重传会让 connect 变得很慢
+
+LINGER_RST = struct.pack("ii", 1, 0)
+
+SERVER = """
+import sys, muxp
+from muxp import Mode
+muxp.logger.setLevel("WARNING")
+muxp.run(("127.0.0.1", int(sys.argv[1])), muxp.loop_safe(lambda data: data), mode=Mode(sys.argv[2]))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, mode: str) -> subprocess.Popen:
+    # RST 关闭会让部分引擎打印连接重置的堆栈, 不输出服务端 stderr
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(port), mode], stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{mode} 服务器启动失败")
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def roundtrip(sock: socket.socket, frames: bytes, count: int, decoder: FrameDecoder):
+    sock.sendall(frames)
+    n = 0
+    while n < count:
+        if not decoder.recv_into(sock):
+            raise ConnectionError("连接已关闭")
+        n += sum(1 for _ in decoder.frames())
+
+
+def bench_connections(port: int) -> float:
+    frame = encode_data(b"ping")
+    n = 0
+    deadline = time.perf_counter() + DURATION
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        sock = socket.create_connection((HOST, port))
+        roundtrip(sock, frame, 1, FrameDecoder())
+        # RST 关闭, 避免客户端大量 TIME_WAIT 耗尽本地端口
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+        sock.close()
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+def bench_messages(port: int) -> float:
+    frames = encode_data(b"x" * 128) * BATCH
+    counts = [0] * CONNS
+    deadline = time.perf_counter() + DURATION
+
+    def worker(i: int):
+        sock = socket.create_connection((HOST, port))
+        decoder = FrameDecoder()
+        while time.perf_counter() < deadline:
+            roundtrip(sock, frames, BATCH, decoder)
+            counts[i] += BATCH
+        sock.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CONNS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def bench_idle(port: int, pid: int):
+    """返回 (建立的连接数, 末尾连接中仍可用的数量, 基线 RSS MB, 空闲连接下的 RSS MB)"""
+    base = rss_mb(pid)
+    socks = []
+    deadline = time.perf_counter() + IDLE_DEADLINE
+    while len(socks) < IDLE and time.perf_counter() < deadline:
+        try:
+            socks.append(socket.create_connection((HOST, port), timeout=1))
+        except OSError:
+            # 监听积压队列已满, 稍后重试
+            time.sleep(0.01)
+    time.sleep(1.0)
+    # 线程池模式超出 max_workers + max_pending 的连接会被服务端关闭, 用一次带超时的请求确认存活
+    alive = 0
+    frame = encode_data(b"x")
+    for sock in socks[-20:]:
+        try:
+            sock.settimeout(1)
+            roundtrip(sock, frame, 1, FrameDecoder())
+            alive += 1
+        except OSError:
+            pass
+    used = rss_mb(pid)
+    for sock in socks:
+        sock.close()
+    return len(socks), alive, base, used
+
+
+def main():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    print(f"{'mode':>10} {'conn/s':>8} {'msg/s':>9} {'idle conns':>10} {'tail ok':>8} "
+          f"{'RSS base':>9} {'RSS idle':>9} (MB)")
+    for mode in ("threading", "threadpool", "asyncio", "selectors"):
+        port = free_port()
+        proc = start_server(port, mode)
+        try:
+            conns = bench_connections(port)
+            msgs = bench_messages(port)
+            opened, alive, base, used = bench_idle(port, proc.pid)
+            print(f"{mode:>10} {conns:>8.0f} {msgs:>9.0f} {opened:>10} {alive:>5}/20 {base:>9.1f} {used:>9.1f}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+发布/订阅扇出基准: CONNS 条订阅连接, 一次发布推送给所有订阅者
+- 单条延迟: 发布一条消息, 直到最后一个订阅者收到为止的时间 (p50/p99)
+- 吞吐: 连续发布 BURST 条消息, 所有订阅者收到的消息总数 / 耗时
+- 每条消息在服务端只编码一次, 同一份帧写给所有订阅者 (见 muxp.PubSub)
+订阅者用原始 socket + selectors 在一个线程中读取, 服务端运行在子进程中 (两端各需要 CONNS 个以上的文件描述符)
+
+用法: python bench_fanout.py [CONNS] [MODES]    例如 python bench_fanout.py 10000 asyncio,threading
+"""
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+import muxp
+from muxp.comm import FrameDecoder, encode_hello, encode_frame, FRAME_HELLO, FRAME_SUBSCRIBE, FRAME_PUBLISH
+
+
+HOST = "127.0.0.1"
+CONNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+MODES = sys.argv[2].split(",") if len(sys.argv) > 2 else ["asyncio", "threading"]
+SIZE = 128       # 消息负载字节数
+ROUNDS = 20      # 单条延迟的测量次数
+BURST = 50       # 吞吐测试连续发布的消息数
+TOPIC = "bench"
+
+SERVER = """
+import resource, sys, muxp
+from muxp import Mode, PubSub
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+muxp.logger.setLevel("ERROR")
+pubsub = PubSub()
+# 请求负载即要发布的消息, 响应为接受推送的订阅者数
+handler = muxp.loop_safe(lambda data: str(pubsub.publish("bench", data)).encode())
+muxp.run(("127.0.0.1", int(sys.argv[1])), handler, mode=Mode(sys.argv[2]), pubsub=pubsub, idle_timeout=None)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, mode: str) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(port), mode])
+    for _ in range(100):
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{mode} 服务器启动失败")
+
+
+class Subscribers:
+    """CONNS 条订阅连接, 由一个 selector 读取并统计收到的推送帧"""
+
+    def __init__(self, port: int, count: int):
+        self.selector = selectors.DefaultSelector()
+        self.decoders = {}
+        self.received = 0
+        self.acked = 0
+        hello = encode_hello({"version": 2}) + encode_frame(TOPIC.encode(), 1, FRAME_SUBSCRIBE)
+        for i in range(count):
+            sock = socket.create_connection((HOST, port), timeout=10)
+            sock.sendall(hello)
+            sock.setblocking(False)
+            self.decoders[sock] = FrameDecoder()
+            self.selector.register(sock, selectors.EVENT_READ)
+            if i % 500 == 499:
+                # 边建连接边读取确认, 避免服务端写缓冲堆积
+                self.poll(0)
+        while self.acked < count:
+            if not self.poll(10):
+                raise RuntimeError(f"订阅确认超时: {self.acked}/{count}")
+
+    def poll(self, timeout: float) -> bool:
+        events = self.selector.select(timeout)
+        for key, _ in events:
+            sock = key.fileobj
+            decoder = self.decoders[sock]
+            try:
+                if not decoder.recv_into(sock):
+                    raise RuntimeError("服务端关闭了订阅连接")
+            except BlockingIOError:
+                continue
+            for frame in decoder.frames():
+                if frame.kind == FRAME_PUBLISH:
+                    self.received += 1
+                elif frame.kind != FRAME_HELLO:
+                    self.acked += 1
+        return bool(events)
+
+    def wait(self, target: int, timeout: float = 30.0):
+        deadline = time.perf_counter() + timeout
+        while self.received < target:
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"推送超时: {self.received}/{target}")
+            self.poll(1)
+
+    def close(self):
+        for sock in self.decoders:
+            sock.close()
+        self.selector.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000
+
+
+def bench(mode: str):
+    port = free_port()
+    proc = start_server(port, mode)
+    subs = None
+    try:
+        start = time.perf_counter()
+        subs = Subscribers(port, CONNS)
+        setup = time.perf_counter() - start
+        publisher = muxp.Client((HOST, port), multiplex=True)
+        payload = b"x" * SIZE
+        latencies = []
+        for _ in range(ROUNDS):
+            target = subs.received + CONNS
+            start = time.perf_counter()
+            delivered = int(publisher.call(payload).result(10))
+            subs.wait(target)
+            latencies.append(time.perf_counter() - start)
+            assert delivered == CONNS, delivered
+        target = subs.received + CONNS * BURST
+        start = time.perf_counter()
+        for f in [publisher.call(payload) for _ in range(BURST)]:
+            f.result(30)
+        subs.wait(target, 60)
+        rate = CONNS * BURST / (time.perf_counter() - start)
+        publisher.close()
+        print(f"{mode:>10} {CONNS:>6} {setup:>8.1f} {percentile(latencies, 0.5):>9.1f} "
+              f"{percentile(latencies, 0.99):>9.1f} {rate:>11.0f}")
+    finally:
+        if subs is not None:
+            subs.close()
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < CONNS + 100:
+        print(f"文件描述符上限 {hard} 不足以建立 {CONNS} 条连接")
+        return
+    print(f"{'mode':>10} {'conns':>6} {'setup s':>8} {'p50 ms':>9} {'p99 ms':>9} {'pushes/s':>11}")
+    for mode in MODES:
+        bench(mode)
+
+
+if __name__ == '__main__':
+    main()
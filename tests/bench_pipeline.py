@@ -0,0 +1,106 @@
+"""
+单连接流水线基准: 快慢混合的处理函数下, 对比逐帧顺序处理与单连接并发处理的延迟
+
+用法: python bench_pipeline.py
+"""
+import threading
+import time
+import muxp
+from muxp import Mode
+
+
+HOST = "127.0.0.1"
+RATE = 450          # 每秒请求数
+DURATION = 3.0      # 每轮压测时长(秒)
+SLOW_EVERY = 10     # 每 10 个请求中有 1 个慢请求
+SLOW_DELAY = 0.02   # 慢请求耗时
+
+
+def handler(data: bytes) -> bytes:
+    if data[:1] == b"S":
+        time.sleep(SLOW_DELAY)
+    return data
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000
+
+
+def start_server(port: int, mode: Mode, concurrency: int):
+    t = threading.Thread(target=muxp.run, args=((HOST, port), handler),
+                         kwargs=dict(mode=mode, concurrency=concurrency), daemon=True)
+    t.start()
+    time.sleep(0.5)
+
+
+def payloads():
+    total = int(RATE * DURATION)
+    return [(b"S" if i % SLOW_EVERY == 0 else b"F") + i.to_bytes(4, "big") for i in range(total)]
+
+
+def paced(items):
+    start = time.perf_counter()
+    for i, item in enumerate(items):
+        delay = start + i / RATE - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield item
+
+
+def run_legacy(port: int):
+    """旧版帧: 一个线程按固定速率发送, 主线程按顺序接收"""
+    client = muxp.Client((HOST, port))
+    items = payloads()
+    sent = {}
+
+    def sender():
+        for item in paced(items):
+            sent[item] = time.perf_counter()
+            client.send(item)
+
+    t = threading.Thread(target=sender)
+    t.start()
+    latencies = []
+    for _ in items:
+        resp = client.recv(timeout=10)
+        latencies.append((resp[:1], time.perf_counter() - sent[resp]))
+    t.join()
+    client.close()
+    return latencies
+
+
+def run_streams(port: int):
+    """v2 帧头: 通过 call() 并发在途, 响应按流 ID 匹配"""
+    client = muxp.Client((HOST, port), multiplex=True)
+    items = payloads()
+    latencies = []
+    futs = []
+    for item in paced(items):
+        start = time.perf_counter()
+        fut = client.call(item)
+        fut.add_done_callback(lambda f, s=start, k=item[:1]: latencies.append((k, time.perf_counter() - s)))
+        futs.append(fut)
+    for fut in futs:
+        fut.result(10)
+    client.close()
+    return latencies
+
+
+def main():
+    port = 39000
+    print(f"{'mode':>10} {'conc':>4} {'framing':>8} {'fast p50':>9} {'fast p99':>9} {'all p99':>8} (ms)")
+    for mode in (Mode.THREADPOOL, Mode.ASYNCIO):
+        for concurrency in (1, 8):
+            for framing, bench in (("legacy", run_legacy), ("streams", run_streams)):
+                port += 1
+                start_server(port, mode, concurrency)
+                latencies = bench(port)
+                fast = [v for k, v in latencies if k == b"F"]
+                print(f"{mode.value:>10} {concurrency:>4} {framing:>8} "
+                      f"{percentile(fast, 0.5):>9.2f} {percentile(fast, 0.99):>9.2f} "
+                      f"{percentile([v for _, v in latencies], 0.99):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
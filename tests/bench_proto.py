@@ -0,0 +1,100 @@
+"""
+帧解码微基准: 旧的 buffer += data + decode_data 对比 FrameDecoder
+
+用法: python bench_proto.py
+"""
+import os
+import socket
+import threading
+import time
+from muxp.comm import encode_data, decode_data, FrameDecoder
+
+
+CHUNK = 4096
+SIZES = [1024, 64 * 1024, 4 * 1024 * 1024]
+TOTAL = 32 * 1024 * 1024  # 每种帧大小解码的总字节数
+
+
+def make_stream(size: int):
+    payload = os.urandom(size)
+    count = max(TOTAL // size, 2)
+    stream = encode_data(payload) * count
+    chunks = [stream[i:i + CHUNK] for i in range(0, len(stream), CHUNK)]
+    return chunks, count, len(stream)
+
+
+def bench_legacy(chunks) -> int:
+    buffer = b""
+    n = 0
+    for chunk in chunks:
+        buffer += chunk
+        msgs, buffer = decode_data(buffer)
+        n += len(msgs)
+    return n
+
+
+def bench_decoder(chunks) -> int:
+    decoder = FrameDecoder()
+    n = 0
+    for chunk in chunks:
+        decoder.feed(chunk)
+        for _ in decoder.frames():
+            n += 1
+    return n
+
+
+def bench_socket(size: int, count: int, use_decoder: bool) -> float:
+    """通过 socketpair 走真实的 recv/recv_into 路径"""
+    payload = encode_data(os.urandom(size))
+    a, b = socket.socketpair()
+
+    def writer():
+        for _ in range(count):
+            a.sendall(payload)
+        a.close()
+
+    t = threading.Thread(target=writer)
+    start = time.perf_counter()
+    t.start()
+    n = 0
+    if use_decoder:
+        decoder = FrameDecoder()
+        while decoder.recv_into(b):
+            for _ in decoder.frames():
+                n += 1
+    else:
+        buffer = b""
+        while True:
+            data = b.recv(CHUNK)
+            if not data:
+                break
+            buffer += data
+            msgs, buffer = decode_data(buffer)
+            n += len(msgs)
+    elapsed = time.perf_counter() - start
+    t.join()
+    b.close()
+    assert n == count
+    return elapsed
+
+
+def main():
+    print(f"{'frame':>8} {'path':>8} {'legacy MB/s':>12} {'decoder MB/s':>13} {'speedup':>8}")
+    for size in SIZES:
+        chunks, count, total = make_stream(size)
+        start = time.perf_counter()
+        assert bench_legacy(chunks) == count
+        legacy = time.perf_counter() - start
+        start = time.perf_counter()
+        assert bench_decoder(chunks) == count
+        decoder = time.perf_counter() - start
+        mb = total / 1024 / 1024
+        print(f"{size // 1024:>6}KB {'feed':>8} {mb / legacy:>12.1f} {mb / decoder:>13.1f} {legacy / decoder:>7.1f}x")
+
+        legacy = bench_socket(size, count, use_decoder=False)
+        decoder = bench_socket(size, count, use_decoder=True)
+        print(f"{size // 1024:>6}KB {'socket':>8} {mb / legacy:>12.1f} {mb / decoder:>13.1f} {legacy / decoder:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+TLS 新建连接基准: THREADING / THREADPOOL 模式下每秒完成的 TLS 握手 + 一次请求数
+- 对比没有慢客户端, 与存在 SLOW 条只建立 TCP 连接、不发送 ClientHello 的慢客户端两种情况
+- 握手在 accept 线程中进行时, 一条慢连接就会阻塞所有新连接
+
+用法: python bench_tls_accept.py [SLOW]
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from muxp import Auth
+from muxp.comm import encode_data, FrameDecoder, ssl_client_context
+
+
+HOST = "127.0.0.1"
+DURATION = 3.0   # 每项测试时长(秒)
+CONNS = 8        # 并发建立连接的线程数
+TIMEOUT = 2.0    # 单次连接 + 握手 + 请求的超时
+SLOW = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+CERTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "certs", "ssl")
+
+SERVER = """
+import sys, muxp
+from muxp import Mode, Auth
+muxp.logger.setLevel("ERROR")
+certs = sys.argv[3]
+auth = Auth(certfile=certs + "/server.crt", keyfile=certs + "/server.key", cafile=certs + "/ca.crt")
+muxp.run(("127.0.0.1", int(sys.argv[1])), muxp.loop_safe(lambda data: data), mode=Mode(sys.argv[2]), auth=auth)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, mode: str, ctx) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(port), mode, CERTS], stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            # 用完整的 TLS 握手探测, 只建立 TCP 连接的探测本身就是一条慢连接
+            with ctx.wrap_socket(socket.create_connection((HOST, port), timeout=1), server_hostname=HOST):
+                return proc
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{mode} 服务器启动失败")
+
+
+def bench_connect(port: int, ctx):
+    ok = [0] * CONNS
+    failed = [0] * CONNS
+    deadline = time.perf_counter() + DURATION
+    frame = encode_data(b"ping")
+
+    def worker(i: int):
+        while time.perf_counter() < deadline:
+            try:
+                raw = socket.create_connection((HOST, port), timeout=TIMEOUT)
+                with ctx.wrap_socket(raw, server_hostname=HOST) as sock:
+                    sock.sendall(frame)
+                    decoder = FrameDecoder()
+                    while not any(True for _ in decoder.frames()):
+                        if not decoder.recv_into(sock):
+                            raise ConnectionError("连接已关闭")
+                ok[i] += 1
+            except OSError:
+                failed[i] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CONNS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(ok) / (time.perf_counter() - start), sum(failed)
+
+
+def main():
+    ctx = ssl_client_context(Auth(certfile=os.path.join(CERTS, "client.crt"),
+                                  keyfile=os.path.join(CERTS, "client.key"),
+                                  cafile=os.path.join(CERTS, "ca.crt")))
+    print(f"{'mode':>10} {'slow':>5} {'conn/s':>8} {'failed':>7}")
+    for mode in ("threading", "threadpool"):
+        for slow in (0, SLOW):
+            port = free_port()
+            proc = start_server(port, mode, ctx)
+            idle = []
+            try:
+                for _ in range(slow):
+                    try:
+                        idle.append(socket.create_connection((HOST, port), timeout=TIMEOUT))
+                    except OSError:
+                        # accept 被阻塞时监听积压队列很快就满了
+                        break
+                rate, failed = bench_connect(port, ctx)
+                print(f"{mode:>10} {slow:>5} {rate:>8.0f} {failed:>7}")
+            finally:
+                for sock in idle:
+                    sock.close()
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+TLS 重连延迟基准: 客户端反复断开并重连 (mTLS), 对比完整握手与会话恢复
+- 每次重连后发送一次请求, 使 TLS 1.3 的会话票据随响应到达
+- connect 为 Client.connect() 的耗时 (TCP + TLS 握手), 另报告客户端统计中的会话恢复率
+
+用法: python bench_tls_resume.py [N] [MODE]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from muxp import Auth, Client, AsyncClient, Metrics
+
+
+HOST = "127.0.0.1"
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+MODE = sys.argv[2] if len(sys.argv) > 2 else "asyncio"
+CERTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "certs", "ssl")
+
+SERVER = """
+import sys, muxp
+from muxp import Mode, Auth
+muxp.logger.setLevel("ERROR")
+certs = sys.argv[3]
+auth = Auth(certfile=certs + "/server.crt", keyfile=certs + "/server.key", cafile=certs + "/ca.crt")
+muxp.run(("127.0.0.1", int(sys.argv[1])), muxp.loop_safe(lambda data: data), mode=Mode(sys.argv[2]), auth=auth)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, auth: Auth) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-c", SERVER, str(port), MODE, CERTS], stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            Client((HOST, port), auth=auth, auto_reconnect=False).close()
+            return proc
+        except ConnectionError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{MODE} 服务器启动失败")
+
+
+def bench_sync(port: int, auth: Auth, resume: bool) -> Metrics:
+    metrics = Metrics()
+    client = Client((HOST, port), auth=auth, tls_resume=resume, metrics=metrics)
+    client._min_reconnect_interval = 0  # 测量握手本身, 去掉重连节流
+    try:
+        for _ in range(N):
+            start = time.perf_counter()
+            client.connect()
+            metrics.observe("connect", time.perf_counter() - start)
+            client.send(b'"ping"')
+            client.recv(timeout=5)
+    finally:
+        client.close()
+    return metrics
+
+
+def bench_async(port: int, auth: Auth, resume: bool) -> Metrics:
+    metrics = Metrics()
+
+    async def run():
+        client = AsyncClient((HOST, port), auth=auth, tls_resume=resume, metrics=metrics)
+        for _ in range(N):
+            start = time.perf_counter()
+            await client.connect()
+            metrics.observe("connect", time.perf_counter() - start)
+            await client.send(b'"ping"')
+            await client.recv(timeout=5)
+            await client.close()
+
+    asyncio.run(run())
+    return metrics
+
+
+def main():
+    auth = Auth(certfile=os.path.join(CERTS, "client.crt"),
+                keyfile=os.path.join(CERTS, "client.key"),
+                cafile=os.path.join(CERTS, "ca.crt"))
+    port = free_port()
+    proc = start_server(port, auth)
+    print(f"server={MODE} reconnects={N}")
+    print(f"{'client':>7} {'resume':>7} {'p50_ms':>8} {'p99_ms':>8} {'mean_ms':>8} {'resumed':>8}")
+    try:
+        for name, bench in (("sync", bench_sync), ("async", bench_async)):
+            for resume in (False, True):
+                metrics = bench(port, auth, resume)
+                latency = metrics.histogram("connect").summary()
+                rate = metrics.gauges().get("tls_resumption_rate", 0.0)
+                print(f"{name:>7} {str(resume):>7} {latency['p50_ms']:>8.2f} {latency['p99_ms']:>8.2f} "
+                      f"{latency['mean_ms']:>8.2f} {rate:>8.0%}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == '__main__':
+    main()
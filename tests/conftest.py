@@ -0,0 +1,41 @@
+import os
+import shutil
+import subprocess
+import threading
+import pytest
+from muxp import Auth
+from muxp.api._server import ThreadingMuxpServer
+
+CERT_SCRIPT = os.path.join(os.path.dirname(__file__), "certs", "certfile.sh")
+
+
+@pytest.fixture
+def serve():
+    """在后台线程中启动 THREADING 服务器 (端口由系统分配), 返回 (地址, 服务器); 测试结束后关闭"""
+    servers = []
+
+    def start(handler, **options):
+        srv = ThreadingMuxpServer(("127.0.0.1", 0), handler, **options)
+        threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(srv)
+        return srv.server_address, srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+@pytest.fixture(scope="session")
+def certs(tmp_path_factory):
+    """用 certs/certfile.sh 在临时目录生成 CA 与双向认证证书, 返回 (服务端 Auth, 客户端 Auth)"""
+    if shutil.which("openssl") is None:
+        pytest.skip("需要 openssl 命令生成测试证书")
+    workdir = tmp_path_factory.mktemp("certs")
+    subprocess.run(["bash", CERT_SCRIPT], cwd=workdir, check=True, capture_output=True)
+    ssl_dir = workdir / "ssl"
+    server = Auth(certfile=str(ssl_dir / "server.crt"), keyfile=str(ssl_dir / "server.key"),
+                  cafile=str(ssl_dir / "ca.crt"))
+    client = Auth(certfile=str(ssl_dir / "client.crt"), keyfile=str(ssl_dir / "client.key"),
+                  cafile=str(ssl_dir / "ca.crt"))
+    return server, client
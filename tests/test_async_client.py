@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+from muxp import AsyncClient
+from muxp.api._client import _Inbox
+
+
+class FakeTransport:
+    def __init__(self):
+        self.paused = False
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+
+def test_inbox_backpressure():
+    transport = FakeTransport()
+    inbox = _Inbox(4, transport)
+    for i in range(3):
+        inbox.put(b"%d" % i)
+    assert not transport.paused
+    inbox.put(b"3")
+    assert transport.paused
+    # 消费到 limit / 2 以下才恢复读取
+    assert inbox.get_nowait() == b"0"
+    assert transport.paused
+    assert inbox.get_nowait() == b"1"
+    assert not transport.paused
+    assert len(inbox) == 2
+
+
+def test_inbox_wakes_waiter():
+    async def main():
+        inbox = _Inbox(10)
+        waiter = asyncio.ensure_future(inbox.get())
+        await asyncio.sleep(0)
+        inbox.put(b"msg")
+        assert await waiter == b"msg"
+        # 消息直接交给等待者, 不进入队列
+        assert len(inbox) == 0
+        assert await inbox.get(0.05) is None
+    asyncio.run(main())
+
+
+def test_inbox_cancelled_get_keeps_message():
+    async def main():
+        inbox = _Inbox(10)
+        waiter = asyncio.ensure_future(inbox.get())
+        await asyncio.sleep(0)
+        inbox.put(b"msg")
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert inbox.get_nowait() == b"msg"
+    asyncio.run(main())
+
+
+def test_inbox_close_wakes_waiters():
+    async def main():
+        inbox = _Inbox(10)
+        inbox.put(b"queued")
+        assert await inbox.get() == b"queued"
+        waiters = [asyncio.ensure_future(inbox.get()) for _ in range(2)]
+        await asyncio.sleep(0)
+        inbox.close()
+        assert await asyncio.gather(*waiters) == [None, None]
+    asyncio.run(main())
+
+
+def test_recv_and_recv_many(serve):
+    address, srv = serve(lambda data: data)
+
+    async def main():
+        client = AsyncClient(address, multiplex=True)
+        await client.connect()
+        try:
+            await client.subscribe("news")
+            assert await client.recv(0.05) is None
+            waiter = asyncio.ensure_future(client.recv(5))
+            await asyncio.sleep(0.01)
+            srv.publish("news", b"first")
+            assert await waiter == b"first"
+            for i in range(5):
+                srv.publish("news", b"m%d" % i)
+            received = []
+            while len(received) < 5:
+                batch = await client.recv_many(3, timeout=5)
+                assert 0 < len(batch) <= 3
+                received.extend(batch)
+            assert received == [b"m%d" % i for i in range(5)]
+            assert await client.recv_many(3, timeout=0.05) == []
+        finally:
+            await client.close()
+    asyncio.run(main())
+
+
+def test_async_for_ends_on_disconnect(serve):
+    address, srv = serve(lambda data: data)
+
+    async def main():
+        client = AsyncClient(address, multiplex=True, auto_reconnect=False)
+        await client.connect()
+        try:
+            await client.subscribe("news")
+            for i in range(3):
+                srv.publish("news", b"m%d" % i)
+            # 等待推送全部到达收件箱后断开, 已排队的消息仍应依次返回
+            for _ in range(100):
+                if len(client._inbox) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            for handler in list(srv._conns):
+                handler.abort()
+            received = [msg async for msg in client]
+            assert received == [b"m0", b"m1", b"m2"]
+        finally:
+            await client.close()
+    asyncio.run(main())
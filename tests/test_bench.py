@@ -0,0 +1,45 @@
+import copy
+import json
+from muxp import bench
+
+
+def result(mode="threading", throughput=1000.0, p99=2.0):
+    return {"mode": mode, "engine": None, "client": "sync", "clients": 4, "depth": 1, "size": 128, "tls": False,
+            "signature": False, "handler_ms": 0.0, "concurrency": 1, "throughput": throughput,
+            "latency_ms": {"p99_ms": p99}}
+
+
+def test_compare_detects_regressions():
+    baseline = {"results": [result(), result("asyncio")]}
+    assert not bench.compare([result(throughput=950.0, p99=2.1)], baseline, 0.1)
+    assert bench.compare([result(throughput=850.0)], baseline, 0.1)
+    assert bench.compare([result("asyncio", p99=2.5)], baseline, 0.1)
+
+
+def test_compare_matches_configuration(capsys):
+    baseline = {"results": [result()]}
+    other = result(throughput=1.0)
+    other["size"] = 4096
+    # 配置不同的结果不参与比较
+    assert not bench.compare([other], baseline, 0.1)
+    assert "基线中没有相同配置的结果" in capsys.readouterr().out
+
+
+def test_run_and_compare_with_baseline(tmp_path, capsys):
+    out = tmp_path / "result.json"
+    argv = ["--modes", "threading,asyncio", "--clients", "2", "--depth", "2", "--size", "64",
+            "--duration", "0.3", "--warmup", "0.1", "--json", str(out)]
+    assert bench.main(argv) == 0
+    report = json.loads(out.read_text())
+    assert [r["mode"] for r in report["results"]] == ["threading", "asyncio"]
+    for r in report["results"]:
+        assert r["requests"] > 0 and r["errors"] == 0
+        assert r["latency_ms"]["p99_ms"] > 0
+        assert r["server"]["stats"][0]["counters"]["frames_in"] >= r["requests"]
+    # 放宽阈值时与基线比较不回退; 基线吞吐远高于本次时判定为回退
+    assert bench.main(argv[:-2] + ["--baseline", str(out), "--tolerance", "100"]) == 0
+    faster = copy.deepcopy(report)
+    for r in faster["results"]:
+        r["throughput"] *= 1000
+    out.write_text(json.dumps(faster))
+    assert bench.main(argv[:-2] + ["--baseline", str(out)]) == 1
@@ -0,0 +1,188 @@
+import threading
+import time
+import pytest
+from muxp import Client, Metrics, ResponseCache, Router
+from muxp.api import _cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(_cache.time, "monotonic", clock)
+    return clock
+
+
+def fill(cache: ResponseCache, key, value):
+    flight = cache.claim(key)
+    assert not flight.hit
+    flight.complete(value)
+
+
+def test_ttl_expiry(clock):
+    cache = ResponseCache(ttl=10, metrics=Metrics())
+    fill(cache, "k", b"v")
+    clock.now += 9
+    flight = cache.claim("k")
+    assert flight.hit and flight.value == b"v"
+    clock.now += 2
+    flight = cache.claim("k")
+    assert not flight.hit
+    flight.abandon()
+    counters = cache.metrics.counters()
+    assert counters["cache_hits"] == 1
+    assert counters["cache_expired"] == 1
+    assert counters["cache_misses"] == 2
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2, metrics=Metrics())
+    fill(cache, "a", 1)
+    fill(cache, "b", 2)
+    # 命中的条目移到末尾, 淘汰最久未使用的 b
+    assert cache.claim("a").hit
+    fill(cache, "c", 3)
+    assert len(cache) == 2
+    assert cache.claim("a").hit and cache.claim("c").hit
+    flight = cache.claim("b")
+    assert not flight.hit
+    flight.abandon()
+    assert cache.metrics.counters()["cache_evictions"] == 1
+
+
+def test_invalid_options():
+    with pytest.raises(ValueError):
+        ResponseCache(max_entries=0)
+    with pytest.raises(ValueError):
+        ResponseCache(ttl=0)
+
+
+def wait_coalesced(cache: ResponseCache, count: int):
+    deadline = time.monotonic() + 5
+    while cache.metrics.counters().get("cache_coalesced", 0) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_single_flight():
+    cache = ResponseCache(metrics=Metrics())
+    leader = cache.claim("k")
+    assert not leader.hit
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.claim("k"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    wait_coalesced(cache, 4)
+    leader.complete(b"v")
+    for t in threads:
+        t.join(5)
+    assert [(f.hit, f.value) for f in results] == [(True, b"v")] * 4
+    assert cache.metrics.counters()["cache_misses"] == 1
+
+
+def test_single_flight_failure_is_shared():
+    cache = ResponseCache(metrics=Metrics())
+    leader = cache.claim("k")
+    errors = []
+
+    def wait():
+        try:
+            cache.claim("k")
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wait) for _ in range(3)]
+    for t in threads:
+        t.start()
+    wait_coalesced(cache, 3)
+    error = RuntimeError("处理失败")
+    leader.fail(error)
+    for t in threads:
+        t.join(5)
+    assert errors == [error] * 3
+    # 失败不缓存, 下一个请求重新计算
+    flight = cache.claim("k")
+    assert not flight.hit
+    flight.abandon()
+
+
+def test_abandon_elects_new_leader():
+    cache = ResponseCache(metrics=Metrics())
+    leader = cache.claim("k")
+    flights = []
+    waiter = threading.Thread(target=lambda: flights.append(cache.claim("k")))
+    waiter.start()
+    wait_coalesced(cache, 1)
+    leader.abandon()
+    waiter.join(5)
+    # 等待者重新查询并成为新的领头请求
+    assert not flights[0].hit
+    flights[0].complete(b"v")
+    assert cache.claim("k").value == b"v"
+
+
+def test_stream_response_not_cached():
+    cache = ResponseCache()
+    flight = cache.claim("k")
+    flight.complete(iter([b"chunk"]))
+    assert len(cache) == 0
+
+
+def test_invalidate_and_clear():
+    cache = ResponseCache(key=lambda data: data)
+    fill(cache, cache.data_key(1, "user"), b"a")
+    fill(cache, cache.data_key(2, "user"), b"b")
+    fill(cache, cache.data_key(1, "other"), b"c")
+    assert cache.data_key(1, None) is None
+    assert cache.invalidate("user")
+    assert not cache.invalidate("user")
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_server_hits(serve):
+    calls = []
+
+    def handler(data: bytes) -> bytes:
+        calls.append(data)
+        return data.upper()
+
+    address, srv = serve(handler, cache=ResponseCache())
+    with Client(address, multiplex=True) as client:
+        assert [client.call(b"abc").result(5) for _ in range(3)] == [b"ABC"] * 3
+        assert client.call(b"xyz").result(5) == b"XYZ"
+    assert calls == [b"abc", b"xyz"]
+    counters = srv.metrics.counters()
+    assert counters["cache_hits"] == 2
+    assert counters["cache_misses"] == 2
+    assert srv.metrics.gauges()["cache_entries"] == 2
+
+
+def test_server_routes(serve):
+    calls = []
+    router = Router()
+
+    @router.route(1)
+    def cached(data: bytes) -> bytes:
+        calls.append(1)
+        return data
+
+    @router.route(2)
+    def uncached(data: bytes) -> bytes:
+        calls.append(2)
+        return data
+
+    address, _ = serve(router, cache=ResponseCache(routes={1}))
+    with Client(address, multiplex=True) as client:
+        for _ in range(2):
+            assert client.call(b"x", route=1).result(5) == b"x"
+            assert client.call(b"x", route=2).result(5) == b"x"
+    assert calls == [1, 2, 2]
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from muxp import AsyncClient, Client
+
+
+def test_multiplexed_calls(serve):
+    address, _ = serve(lambda data: data[::-1])
+    with Client(address, multiplex=True) as client:
+        calls = [client.call(str(i).encode() * 3) for i in range(50)]
+        assert [f.result(5) for f in calls] == [str(i).encode()[::-1] * 3 for i in range(50)]
+        assert len(client._inflight) == 0
+        assert client.stats()["counters"]["requests"] == 50
+
+
+def test_route_requires_v2(serve):
+    address, _ = serve(lambda data: data)
+    with Client(address) as client:
+        with pytest.raises(ConnectionError, match="v2"):
+            client.call(b"x", route=1)
+        # 被拒绝的请求不登记、不计数, 之后的请求照常按顺序匹配响应
+        assert len(client._inflight) == 0
+        assert "requests" not in client.stats()["counters"]
+        assert client.call(b"y").result(5) == b"y"
+
+
+def test_failed_pack_is_not_registered(serve):
+    address, _ = serve(lambda data: data)
+    with Client(address, multiplex=True) as client:
+        with pytest.raises(TypeError):
+            client.call("not bytes")
+        assert len(client._inflight) == 0
+        assert client.call(b"ok").result(5) == b"ok"
+
+
+def test_async_route_requires_v2(serve):
+    address, _ = serve(lambda data: data)
+
+    async def main():
+        client = AsyncClient(address, multiplex=False)
+        await client.connect()
+        try:
+            with pytest.raises(ConnectionError, match="v2"):
+                await client.call(b"x", route=1)
+            assert len(client._inflight) == 0
+            assert await client.call(b"y") == b"y"
+        finally:
+            await client.close()
+
+    asyncio.run(main())
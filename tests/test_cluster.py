@@ -0,0 +1,208 @@
+import asyncio
+import time
+import pytest
+from muxp import AsyncClusterClient, ServerBusyError
+
+
+class FakeClient:
+    """按脚本返回结果的节点: error 为异常类时抛出, 否则返回节点名"""
+
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+        self.calls = 0
+
+    async def call(self, data, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error("fake")
+        return self.name
+
+    async def close(self):
+        pass
+
+
+def make_cluster(n=2, **options):
+    cluster = AsyncClusterClient([("127.0.0.1", 1 + i) for i in range(n)], **options)
+    fakes = []
+    for i, ep in enumerate(cluster._endpoints):
+        ep.client = FakeClient(f"node{i}".encode())
+        fakes.append(ep.client)
+    return cluster, fakes
+
+
+def ejected(cluster):
+    return [ep["ejected"] for ep in cluster.stats()["endpoints"]]
+
+
+async def eject_first(cluster):
+    """反复调用直到第一个节点 (已设置为失败) 被摘除, 调用都由其他节点完成"""
+    while cluster._endpoints[0].ejected_until <= 0:
+        await cluster.call(b"x")
+
+
+def test_balances_across_endpoints():
+    cluster, fakes = make_cluster(3)
+
+    async def main():
+        for _ in range(300):
+            await cluster.call(b"x")
+
+    asyncio.run(main())
+    assert all(fake.calls > 50 for fake in fakes)
+
+
+def test_failover_and_ejection():
+    cluster, (bad, good) = make_cluster(failure_threshold=2, eject_base=10.0)
+    bad.error = ConnectionError
+
+    async def main():
+        return [await cluster.call(b"x") for _ in range(20)]
+
+    assert asyncio.run(main()) == [b"node1"] * 20
+    # 达到连续失败阈值后不再选中
+    assert bad.calls == 2
+    assert ejected(cluster) == [True, False]
+
+
+def test_recovery_probe():
+    cluster, (bad, good) = make_cluster(failure_threshold=1, eject_base=0.05)
+    bad.error = ConnectionError
+
+    async def main():
+        await eject_first(cluster)
+        assert ejected(cluster) == [True, False]
+        await asyncio.sleep(0.06)
+        # 到期后放行一个探测请求, 失败则以加倍的时长重新摘除
+        calls = bad.calls
+        while bad.calls == calls:
+            await cluster.call(b"x")
+        ep = cluster._endpoints[0]
+        assert not ep.probing and ep.backoff == pytest.approx(0.1)
+        assert ejected(cluster) == [True, False]
+        await asyncio.sleep(0.11)
+        bad.error = None
+        results = [await cluster.call(b"x") for _ in range(40)]
+        assert b"node0" in results
+        assert ep.backoff == 0 and ep.failures == 0
+        assert ejected(cluster) == [False, False]
+
+    asyncio.run(main())
+
+
+def test_only_one_probe_at_a_time():
+    cluster, (bad, good) = make_cluster(failure_threshold=1, eject_base=0.01)
+    bad.error = ConnectionError
+
+    async def main():
+        await eject_first(cluster)
+        await asyncio.sleep(0.02)
+        release = asyncio.Event()
+        original = bad.call
+
+        async def slow_call(data, timeout=None):
+            await release.wait()
+            return await original(data, timeout)
+
+        bad.call = slow_call
+        bad.error = None
+        tasks = [asyncio.ensure_future(cluster.call(b"x")) for _ in range(20)]
+        await asyncio.sleep(0.01)
+        probing = cluster._endpoints[0]
+        assert probing.probing and probing.outstanding == 1
+        release.set()
+        results = await asyncio.gather(*tasks)
+        assert results.count(b"node0") == 1
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("error", [RuntimeError, ServerBusyError])
+def test_probe_ends_on_server_error(error):
+    cluster, (bad, good) = make_cluster(failure_threshold=1, eject_base=0.01)
+    bad.error = ConnectionError
+
+    async def main():
+        await eject_first(cluster)
+        await asyncio.sleep(0.02)
+        bad.error = error
+        calls = bad.calls
+        while bad.calls == calls:
+            try:
+                await cluster.call(b"x")
+            except error:
+                pass
+        ep = cluster._endpoints[0]
+        # 探测没有卡在进行中状态
+        assert not ep.probing
+        return ep
+
+    ep = asyncio.run(main())
+    if error is RuntimeError:
+        # 服务端返回了错误帧, 节点可用
+        assert ep.ejected_until == 0
+    else:
+        assert ep.available(time.monotonic())
+
+
+def test_busy_fails_over():
+    cluster, (busy, good) = make_cluster()
+    busy.error = ServerBusyError
+
+    async def main():
+        return [await cluster.call(b"x") for _ in range(20)]
+
+    assert asyncio.run(main()) == [b"node1"] * 20
+    # 过载不计入失败
+    assert ejected(cluster) == [False, False]
+    good.error = ServerBusyError
+    with pytest.raises(ServerBusyError):
+        asyncio.run(cluster.call(b"x"))
+
+
+def test_all_endpoints_down():
+    cluster, fakes = make_cluster()
+    for fake in fakes:
+        fake.error = ConnectionError
+    with pytest.raises(ConnectionError, match="没有可用的节点"):
+        asyncio.run(cluster.call(b"x"))
+
+
+def test_end_to_end(serve):
+    addresses = [serve(lambda data, i=i: b"%d:" % i + data)[0] for i in range(2)]
+
+    async def main():
+        cluster = AsyncClusterClient(addresses)
+        await cluster.connect()
+        try:
+            results = [await cluster.call(b"x") for _ in range(20)]
+        finally:
+            await cluster.close()
+        return results
+
+    results = asyncio.run(main())
+    assert set(results) == {b"0:x", b"1:x"}
+
+
+def test_hedged_request():
+    cluster, (slow, fast) = make_cluster(hedge_percentile=0.5, hedge_min_samples=5)
+    cluster._latencies.extend([0.001] * 5)
+    original = slow.call
+
+    async def slow_call(data, timeout=None):
+        await asyncio.sleep(1.0)
+        return await original(data, timeout)
+
+    slow.call = slow_call
+
+    async def main():
+        start = time.monotonic()
+        results = [await cluster.call(b"x") for _ in range(10)]
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    # 慢节点上的请求在对冲延迟后由另一个节点完成
+    assert results == [b"node1"] * 10
+    assert elapsed < 1.0
+    assert cluster.stats()["hedge_wins"] == cluster.stats()["hedges"] > 0
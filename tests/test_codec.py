@@ -0,0 +1,62 @@
+import pytest
+from muxp import BinaryCodec, StructCodec
+
+
+VALUES = [
+    None, True, False, 0, 127, -1, -32, -33, 255, 65536, 2 ** 40, -2 ** 40, 1.5,
+    "", "成都", "x" * 40, "y" * 300, b"", b"\x00" * 300,
+    [1, "a", 2.5, [None]], {"id": 1, "name": "七中", "score": 9.5, "tags": ["a", "b"]},
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_roundtrip(value):
+    codec = BinaryCodec()
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_tuple_decodes_as_list():
+    codec = BinaryCodec()
+    assert codec.decode(codec.encode((1, 2))) == [1, 2]
+
+
+@pytest.mark.parametrize("value", [
+    "x" * 10, "y" * 300, b"z" * 10, ["abc", "defgh"], {"key": "value", "other": 1.5}, [[1.5, "s" * 40]],
+])
+def test_truncated_input(value):
+    codec = BinaryCodec()
+    data = codec.encode(value)
+    for n in range(len(data)):
+        with pytest.raises(ValueError, match="数据不完整"):
+            codec.decode(data[:n])
+
+
+def test_trailing_data():
+    codec = BinaryCodec()
+    with pytest.raises(ValueError, match="多余数据"):
+        codec.decode(codec.encode(1) + b"\x00")
+
+
+def test_unknown_marker():
+    with pytest.raises(ValueError, match="无法识别的类型标记"):
+        BinaryCodec().decode(b"\xc1")
+
+
+def test_struct_schema():
+    point = StructCodec([("x", "i"), ("y", "i")])
+    codec = BinaryCodec({1: point})
+    value = {"x": 1, "y": -2}
+    data = codec.encode(value)
+    assert len(data) == 3 + point.size
+    assert codec.decode(data) == value
+    # 字段类型不符时按通用格式编码
+    assert codec.decode(codec.encode({"x": "a", "y": 2})) == {"x": "a", "y": 2}
+    with pytest.raises(ValueError, match="未注册的扩展类型"):
+        BinaryCodec().decode(data)
+
+
+def test_zero_copy_bytes():
+    codec = BinaryCodec(zero_copy=True)
+    buf = bytearray(codec.encode(b"payload"))
+    result = codec.decode(buf)
+    assert isinstance(result, memoryview) and result == b"payload"
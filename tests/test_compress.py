@@ -0,0 +1,69 @@
+import os
+import pytest
+from muxp import Client, Compression, train_dictionary
+from muxp.comm import FLAG_COMPRESSED
+from muxp.comm._compress import ALGORITHMS, FrameCompressor
+
+DATA = b'{"id": 12345, "address": "chengdu", "school": "qizhong", "tags": ["a", "b", "c"]}' * 20
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_roundtrip(algorithm):
+    compressor = FrameCompressor(algorithm)
+    packed, flags = compressor.compress(DATA)
+    assert flags == FLAG_COMPRESSED and len(packed) < len(DATA)
+    assert compressor.decompress(packed) == DATA
+
+
+def test_small_and_incompressible_payloads_are_sent_as_is():
+    compressor = FrameCompressor("zlib", threshold=64)
+    assert compressor.compress(b"short") == (b"short", 0)
+    noise = os.urandom(300)
+    assert FrameCompressor("zlib", threshold=0).compress(noise) == (noise, 0)
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_decompression_limit(algorithm):
+    packed, _ = FrameCompressor(algorithm).compress(b"\x00" * 100000)
+    with pytest.raises(ValueError):
+        FrameCompressor(algorithm, max_size=1000).decompress(packed)
+
+
+def test_corrupt_data():
+    with pytest.raises(ValueError, match="解压失败"):
+        FrameCompressor("zlib").decompress(b"\xff" * 32)
+
+
+def test_negotiation():
+    server = Compression(["lzma", "zlib"])
+    client = Compression(["zlib", "lzma"])
+    answer, compressor = server.accept(client.offer())
+    # 按客户端的优先级选择
+    assert answer["compression"] == "zlib" and compressor.algorithm == "zlib"
+    assert client.select(answer).algorithm == "zlib"
+    answer, compressor = Compression(["lzma"]).accept(Compression(["zlib"]).offer())
+    assert answer == {"compression": None} and compressor is None
+    # 对端未配置压缩
+    assert server.accept({}) == ({}, None)
+    assert client.select({}) is None
+
+
+def test_dictionary_requires_same_fingerprint():
+    samples = [b'{"id": %d, "name": "user%d", "active": true}' % (i, i) for i in range(200)]
+    zdict = train_dictionary(samples, size=1024)
+    server = Compression(["zlib"], zdict=zdict)
+    answer, compressor = server.accept(Compression(["zlib"], zdict=zdict).offer())
+    assert answer["zdict"] == server.zdict_id and compressor.zdict == zdict
+    answer, compressor = server.accept(Compression(["zlib"], zdict=b"other" * 10).offer())
+    assert answer["zdict"] is None and compressor.zdict is None
+
+
+def test_end_to_end(serve):
+    seen = []
+    address, _ = serve(lambda data: seen.append(data) or data * 2, compression=Compression(["zlib"]))
+    with Client(address, multiplex=True, compression=Compression(["zlib"])) as client:
+        assert client._compressor is not None and client._compressor.algorithm == "zlib"
+        assert client.call(DATA).result(5) == DATA * 2
+        sent = client.stats()["counters"]["bytes_out"]
+    assert seen == [DATA]
+    assert sent < len(DATA)
@@ -0,0 +1,97 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from muxp import Client, Metrics
+from muxp.api._metrics import Histogram, _bucket, _bucket_bounds
+
+
+def test_counters_merge_threads():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(1000):
+            metrics.inc("requests")
+        metrics.inc("bytes", 10)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 已退出线程的分片并入归档分片, 不丢失计数
+    assert metrics.counters() == {"requests": 8000, "bytes": 80}
+
+
+def test_disabled():
+    metrics = Metrics(enabled=False)
+    metrics.inc("requests")
+    metrics.observe("call", 0.1)
+    assert metrics.counters() == {}
+
+
+@pytest.mark.parametrize("us", [0, 1, 15, 16, 17, 100, 1000, 123456, 10 ** 9])
+def test_bucket_bounds(us):
+    low, high = _bucket_bounds(_bucket(us))
+    assert low <= us < high
+    assert high - low <= max(low / 16, 1)
+
+
+def test_histogram_percentiles():
+    metrics = Metrics()
+    for ms in range(1, 101):
+        metrics.observe("call", ms / 1000)
+    hist = metrics.histogram("call")
+    assert hist.count == 100
+    assert hist.percentile(0.5) == pytest.approx(0.050, rel=0.07)
+    assert hist.percentile(0.99) == pytest.approx(0.099, rel=0.07)
+    summary = hist.summary()
+    assert summary["mean_ms"] == pytest.approx(50.5, rel=0.07)
+    assert summary["max_ms"] == pytest.approx(100, rel=0.07)
+    assert Histogram({}).summary()["p99_ms"] == 0.0
+
+
+def test_gauges_and_snapshot():
+    metrics = Metrics()
+    metrics.gauge("queue", lambda: 3)
+    metrics.gauge("broken", lambda: 1 / 0)
+    metrics.inc("b")
+    metrics.inc("a")
+    snapshot = metrics.snapshot()
+    assert list(snapshot["counters"]) == ["a", "b"]
+    # 出错的 gauge 被跳过
+    assert snapshot["gauges"] == {"queue": 3}
+
+
+def test_prometheus_format():
+    metrics = Metrics()
+    metrics.inc("requests", 2)
+    metrics.observe("call", 0.003)
+    text = metrics.prometheus()
+    assert "muxp_requests_total 2" in text
+    assert 'muxp_call_seconds_bucket{le="0.0025"} 0' in text
+    assert 'muxp_call_seconds_bucket{le="0.005"} 1' in text
+    assert 'muxp_call_seconds_bucket{le="+Inf"} 1' in text
+    assert "muxp_call_seconds_count 1" in text
+
+
+def test_server_stats_and_endpoint(serve):
+    address, srv = serve(lambda data: data)
+    http = srv.serve_metrics(("127.0.0.1", 0))
+    try:
+        with Client(address, multiplex=True) as client:
+            for _ in range(5):
+                client.call(b"x").result(5)
+            assert client.stats()["latency"]["call"]["count"] == 5
+        base = "http://%s:%d" % http.server_address
+        stats = json.load(urllib.request.urlopen(base + "/stats", timeout=5))
+        assert stats["counters"]["frames_in"] >= 5
+        assert stats["latency"]["handler"]["count"] == 5
+        text = urllib.request.urlopen(base + "/metrics", timeout=5).read().decode()
+        assert "muxp_frames_in_total" in text and "muxp_connections_active" in text
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + "/other", timeout=5)
+    finally:
+        http.shutdown()
+        http.server_close()
@@ -0,0 +1,94 @@
+import socket
+import threading
+import time
+import pytest
+from muxp import Client, ClientPool
+
+
+def test_checkout_timeout(serve):
+    address, _ = serve(lambda data: data)
+    with ClientPool(address, min_size=0, max_size=1) as pool:
+        client = pool.checkout()
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            pool.checkout(timeout=0.1)
+        assert time.monotonic() - start >= 0.1
+        assert pool.stats()["timeouts"] == 1
+        pool.checkin(client)
+        assert pool.checkout(timeout=0.1) is client
+
+
+def test_waiter_gets_returned_connection(serve):
+    address, _ = serve(lambda data: data)
+    with ClientPool(address, min_size=1, max_size=1) as pool:
+        client = pool.checkout()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.checkout(timeout=5)))
+        waiter.start()
+        time.sleep(0.1)
+        start = time.monotonic()
+        pool.checkin(client)
+        waiter.join(5)
+        assert got == [client]
+        # 归还即唤醒等待者, 而不是等到超时
+        assert time.monotonic() - start < 1
+        assert pool.stats()["created"] == 1
+
+
+def test_unhealthy_connection_is_reconnected(serve):
+    address, srv = serve(lambda data: data)
+    with ClientPool(address, min_size=1, max_size=1, reconnect_delay=0) as pool:
+        with pool.connection() as client:
+            client._min_reconnect_interval = 0
+            old = client.sock
+            client.send(b"a")
+            assert client.recv() == b"a"
+        # 服务端断开空闲连接 (与空闲淘汰相同的方式), 取出时健康检查发现并重连
+        for handler in list(srv._conns):
+            handler.abort()
+        time.sleep(0.1)
+        assert not client.healthy()
+        with pool.connection() as again:
+            assert again is client
+            assert again.sock is not old
+            again.send(b"b")
+            assert again.recv() == b"b"
+
+
+def test_failed_reconnect_discards_connection(serve):
+    address, srv = serve(lambda data: data)
+    pool = ClientPool(address, min_size=1, max_size=2, max_reconnect_attempts=1, reconnect_delay=0)
+    try:
+        client = pool.checkout()
+        client._min_reconnect_interval = 0
+        pool.checkin(client)
+        srv.shutdown()
+        srv.server_close()
+        client.sock.shutdown(socket.SHUT_RDWR)
+        with pytest.raises(ConnectionError):
+            pool.checkout(timeout=1)
+        stats = pool.stats()
+        assert stats["discarded"] == 1 and stats["size"] == 0
+    finally:
+        pool.close()
+
+
+def test_connection_errors_discard(serve):
+    address, _ = serve(lambda data: data)
+    with ClientPool(address, min_size=0, max_size=2) as pool:
+        with pytest.raises(ConnectionError):
+            with pool.connection() as client:
+                raise ConnectionError("boom")
+        assert client.sock is None
+        assert pool.stats()["size"] == 0
+
+
+def test_fresh_tls_connection_is_healthy(serve, certs):
+    server_auth, client_auth = certs
+    address, _ = serve(lambda data: data, auth=server_auth)
+    with Client(("localhost", address[1]), auth=client_auth) as client:
+        # TLS 1.3 的会话票据在握手之后到达, 不能被当作断开
+        time.sleep(0.2)
+        assert client.healthy()
+        client.send(b"tls")
+        assert client.recv() == b"tls"
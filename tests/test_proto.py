@@ -0,0 +1,86 @@
+import socket
+import pytest
+from muxp.comm import FrameDecoder, encode_frame, FRAME_CHUNK, FLAG_END, FLAG_COMPRESSED, FLAG_ROUTE
+from muxp.comm._proto import encode_data
+
+
+def collect(decoder):
+    return [(bytes(f.payload), f.stream_id, f.kind, f.flags, f.route) for f in decoder.frames()]
+
+
+FRAMES = [
+    (encode_data(b"legacy"), (b"legacy", None, 0, 0, None)),
+    (encode_frame(b"v2", 7), (b"v2", 7, 0, 0, None)),
+    (encode_frame(b"chunk", 8, FRAME_CHUNK, FLAG_END), (b"chunk", 8, FRAME_CHUNK, FLAG_END, None)),
+    (encode_frame(b"routed", 9, flags=FLAG_COMPRESSED, route=513), (b"routed", 9, 0, FLAG_COMPRESSED, 513)),
+    (encode_frame(b"", 10, route=0), (b"", 10, 0, 0, 0)),
+    (encode_data(b""), (b"", None, 0, 0, None)),
+]
+
+
+def test_coalesced_frames():
+    decoder = FrameDecoder()
+    decoder.feed(b"".join(data for data, _ in FRAMES))
+    assert collect(decoder) == [expected for _, expected in FRAMES]
+    assert len(decoder) == 0
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 5, 11])
+def test_split_frames(step):
+    stream = b"".join(data for data, _ in FRAMES)
+    decoder = FrameDecoder(initial_size=16)
+    result = []
+    for i in range(0, len(stream), step):
+        decoder.feed(stream[i:i + step])
+        result += collect(decoder)
+    assert result == [expected for _, expected in FRAMES]
+
+
+def test_large_frame_grows_buffer():
+    payload = bytes(range(256)) * 1000
+    decoder = FrameDecoder(initial_size=1024)
+    data = encode_frame(payload, 1) + encode_data(b"after")
+    decoder.feed(data[:100])
+    assert collect(decoder) == []
+    assert decoder.read_size() >= len(payload) + 12 - 100
+    decoder.feed(data[100:])
+    assert collect(decoder) == [(payload, 1, 0, 0, None), (b"after", None, 0, 0, None)]
+
+
+def test_recv_into():
+    left, right = socket.socketpair()
+    try:
+        left.sendall(encode_frame(b"a", 1) + encode_data(b"b"))
+        decoder = FrameDecoder()
+        assert decoder.recv_into(right) > 0
+        assert collect(decoder) == [(b"a", 1, 0, 0, None), (b"b", None, 0, 0, None)]
+        left.close()
+        assert decoder.recv_into(right) == 0
+    finally:
+        left.close()
+        right.close()
+
+
+def test_max_frame_size():
+    decoder = FrameDecoder(max_frame_size=8)
+    decoder.feed(encode_frame(b"12345678", 1))
+    assert collect(decoder) == [(b"12345678", 1, 0, 0, None)]
+    # 帧头到达即拒绝, 不等待负载
+    decoder.feed(encode_data(b"123456789")[:4])
+    with pytest.raises(ValueError, match="帧长度超出限制"):
+        collect(decoder)
+
+
+def test_invalid_route_frame():
+    # 带 FLAG_ROUTE 但负载不足 2 字节
+    decoder = FrameDecoder()
+    decoder.feed(encode_frame(b"x", 1, flags=FLAG_ROUTE))
+    with pytest.raises(ValueError, match="路由帧格式无效"):
+        collect(decoder)
+
+
+def test_encode_rejects_invalid_route():
+    with pytest.raises(ValueError):
+        encode_frame(b"x", None, route=1)
+    with pytest.raises(ValueError):
+        encode_frame(b"x", 1, route=0x10000)
@@ -0,0 +1,131 @@
+import asyncio
+import queue
+import time
+import pytest
+from muxp import AsyncClient, Client, Metrics, Mode, PubSub, SlowConsumer, run
+from muxp.api._pubsub import Subscriber
+
+
+class QueueSubscriber(Subscriber):
+    """只排队不写出的订阅者, 用于检查推送队列满时的处理"""
+
+    def __init__(self, pubsub: PubSub):
+        self.aborted = False
+        super().__init__(pubsub, None, None, self._on_abort, pubsub.metrics)
+
+    def _on_abort(self):
+        self.aborted = True
+
+    def offer(self, frame: bytes) -> bool:
+        return self._enqueue(frame)
+
+
+def wait_for(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_subscribe_fan_out(serve):
+    address, srv = serve(lambda data: data)
+    with Client(address, multiplex=True) as first, Client(address, multiplex=True) as second:
+        first.subscribe("news")
+        second.subscribe("news")
+        assert srv.pubsub.subscribers("news") == 2
+        assert srv.publish("news", b"hello") == 2
+        assert first.recv(5) == b"hello"
+        assert second.recv(5) == b"hello"
+        # 客户端发布同样经服务端推送给所有订阅者 (包括发布者自己)
+        assert first.publish("news", b"again") == 2
+        assert first.recv(5) == b"again"
+        assert second.recv(5) == b"again"
+        counters = srv.metrics.counters()
+        assert counters["published"] == 2
+        assert counters["pushed"] == 4
+
+
+def test_callback_and_unsubscribe(serve):
+    address, srv = serve(lambda data: data)
+    received = queue.SimpleQueue()
+    with Client(address, multiplex=True) as client:
+        client.subscribe("news", lambda topic, msg: received.put((topic, msg)))
+        srv.publish("news", b"one")
+        assert received.get(timeout=5) == ("news", b"one")
+        client.unsubscribe("news")
+        assert srv.pubsub.subscribers("news") == 0
+        assert srv.publish("news", b"two") == 0
+        assert srv.pubsub.topics() == []
+
+
+def test_disconnect_removes_subscriber(serve):
+    address, srv = serve(lambda data: data)
+    client = Client(address, multiplex=True, auto_reconnect=False)
+    client.subscribe("a")
+    client.subscribe("b")
+    assert sorted(srv.pubsub.topics()) == ["a", "b"]
+    client.close()
+    wait_for(lambda: not srv.pubsub.topics())
+
+
+def test_pubsub_requires_v2(serve):
+    address, _ = serve(lambda data: data)
+    with Client(address) as client:
+        with pytest.raises(ConnectionError, match="v2"):
+            client.subscribe("news")
+        assert "news" not in client._subscriptions
+
+
+def test_async_subscribe(serve):
+    address, srv = serve(lambda data: data)
+
+    async def main():
+        client = AsyncClient(address, multiplex=True)
+        await client.connect()
+        received = asyncio.Queue()
+        try:
+            await client.subscribe("inbox")
+            await client.subscribe("callback", lambda topic, msg: received.put_nowait(msg))
+            assert await client.publish("inbox", b"queued") == 1
+            assert await client.recv(5) == b"queued"
+            srv.publish("callback", b"pushed")
+            assert await asyncio.wait_for(received.get(), 5) == b"pushed"
+            # 回调订阅的推送不进入收件箱
+            assert await client.recv(0.05) is None
+            await client.unsubscribe("inbox")
+            assert srv.pubsub.subscribers("inbox") == 0
+        finally:
+            await client.close()
+    asyncio.run(main())
+
+
+def test_slow_consumer_drop_oldest():
+    pubsub = PubSub(queue_size=2, metrics=Metrics())
+    subscriber = QueueSubscriber(pubsub)
+    for frame in (b"1", b"2", b"3"):
+        assert subscriber.offer(frame)
+    assert list(subscriber._queue) == [b"2", b"3"]
+    assert pubsub.metrics.counters()["push_dropped"] == 1
+
+
+def test_slow_consumer_drop_newest():
+    pubsub = PubSub(queue_size=2, slow_consumer=SlowConsumer.DROP_NEWEST, metrics=Metrics())
+    subscriber = QueueSubscriber(pubsub)
+    assert subscriber.offer(b"1") and subscriber.offer(b"2")
+    assert not subscriber.offer(b"3")
+    assert list(subscriber._queue) == [b"1", b"2"]
+
+
+def test_slow_consumer_disconnect():
+    pubsub = PubSub(queue_size=1, slow_consumer=SlowConsumer.DISCONNECT, metrics=Metrics())
+    subscriber = QueueSubscriber(pubsub)
+    pubsub.subscribe(subscriber, "news")
+    assert pubsub.publish("news", b"1") == 1
+    assert pubsub.publish("news", b"2") == 0
+    assert subscriber.aborted and subscriber.closed
+    assert pubsub.metrics.counters()["slow_consumers"] == 1
+
+
+def test_selectors_rejects_pubsub():
+    with pytest.raises(ValueError, match="selectors"):
+        run(("127.0.0.1", 0), lambda data: data, mode=Mode.SELECTORS, pubsub=PubSub())
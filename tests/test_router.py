@@ -0,0 +1,74 @@
+import time
+import pytest
+from muxp import Client, Metrics, Router
+
+
+def test_add_without_name():
+    router = Router()
+    route = router.add(1, lambda data: data)
+    assert route.name == "1"
+    assert router.resolve(1) is route
+    assert route.call(b"x", Metrics()) == b"x"
+
+
+def test_route_decorator_without_name():
+    router = Router()
+
+    @router.route(7, inline=True)
+    def echo(data):
+        return data
+
+    assert router.resolve(7).handler is echo
+    assert router.resolve(7).inline
+
+
+def test_add_rejects_bad_options():
+    router = Router()
+    router.add(1, lambda data: data)
+    with pytest.raises(ValueError):
+        router.add(1, lambda data: data)
+    with pytest.raises(ValueError):
+        router.add(0x10000, lambda data: data)
+    with pytest.raises(ValueError):
+        router.add(2, lambda data: data, name="bad name")
+    with pytest.raises(ValueError):
+        router.add(3, lambda data: data, inline=True, timeout=1.0)
+
+
+def test_resolve_unknown_and_default():
+    router = Router()
+    with pytest.raises(ValueError, match="未注册的路由"):
+        router.resolve(5)
+    with pytest.raises(ValueError, match="未指定路由"):
+        router.resolve(None)
+    router = Router(default=lambda data: b"default")
+    assert router.resolve(None).name == "default"
+
+
+def test_dispatch(serve):
+    router = Router(default=lambda data: b"default:" + data)
+    router.add(1, lambda data: b"one:" + data)
+    router.add(2, lambda data: b"two:" + data, name="two")
+    address, srv = serve(router)
+    with Client(address, multiplex=True) as client:
+        assert client.call(b"a", route=1).result(5) == b"one:a"
+        assert client.call(b"b", route=2).result(5) == b"two:b"
+        assert client.call(b"c").result(5) == b"default:c"
+        with pytest.raises(RuntimeError, match="未注册的路由: 9"):
+            client.call(b"d", route=9).result(5)
+        # 未注册的路由不影响连接上的其他请求
+        assert client.call(b"e", route=1).result(5) == b"one:e"
+    counters = srv.metrics.counters()
+    assert counters["route_1_requests"] == 2
+    assert counters["route_two_requests"] == 1
+    assert counters["route_default_requests"] == 1
+
+
+def test_route_timeout(serve):
+    router = Router()
+    router.add(1, lambda data: time.sleep(0.5) or data, name="slow", timeout=0.05)
+    address, srv = serve(router)
+    with Client(address, multiplex=True) as client:
+        with pytest.raises(RuntimeError, match="处理超时"):
+            client.call(b"x", route=1).result(5)
+    assert srv.metrics.counters()["route_slow_timeouts"] == 1
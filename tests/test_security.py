@@ -0,0 +1,90 @@
+import pytest
+from muxp import Client, Signature, SignatureSession
+from muxp.comm import security
+
+
+def salt_of(token: bytes) -> bytes:
+    return token[3:3 + SignatureSession.SALT_LENGTH]
+
+
+def test_session_roundtrip():
+    session = SignatureSession("secret")
+    for data in (b"", b"x", bytes(range(256)) * 300):
+        token = session.encrypt(data)
+        assert token.startswith(SignatureSession.PREFIX)
+        assert session.decrypt(token) == data
+        assert SignatureSession("secret").decrypt(token) == data
+
+
+def test_epoch_rotates_after_max_messages():
+    session = SignatureSession("secret", max_messages=2)
+    salts = [salt_of(session.encrypt(b"m")) for _ in range(5)]
+    assert salts[0] == salts[1] != salts[2] == salts[3] != salts[4]
+
+
+def test_epoch_rotates_after_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(security.time, "monotonic", lambda: now[0])
+    session = SignatureSession("secret", max_age=10.0)
+    first = salt_of(session.encrypt(b"m"))
+    now[0] += 9.0
+    assert salt_of(session.encrypt(b"m")) == first
+    now[0] += 1.0
+    assert salt_of(session.encrypt(b"m")) != first
+
+
+def test_pbkdf2_runs_once_per_epoch(monkeypatch):
+    calls = []
+    derive = Signature.derive_key
+    monkeypatch.setattr(Signature, "derive_key", lambda salt, sig_key: calls.append(salt) or derive(salt, sig_key))
+    sender = SignatureSession("secret")
+    tokens = [sender.encrypt(b"m%d" % i) for i in range(20)]
+    # 同一进程内收发双方共用主密钥缓存, 清空后模拟接收端
+    security.key_cache.clear()
+    calls.clear()
+    receiver = SignatureSession("secret")
+    assert receiver.needs_derive(tokens[0])
+    assert [receiver.decrypt(t) for t in tokens] == [b"m%d" % i for i in range(20)]
+    assert not receiver.needs_derive(tokens[-1])
+    assert len(calls) == 1
+
+
+def test_decrypts_legacy_format():
+    token = Signature.encrypt(b"legacy", "secret")
+    assert token.startswith(b"ENC")
+    session = SignatureSession("secret")
+    assert session.needs_derive(token)
+    assert session.decrypt(token) == b"legacy"
+    assert Signature.decrypt(token, "secret") == b"legacy"
+    # Signature.decrypt 也接受会话格式
+    assert Signature.decrypt(session.encrypt(b"new"), "secret") == b"new"
+
+
+@pytest.mark.parametrize("encrypt", [
+    lambda data: SignatureSession("secret").encrypt(data),
+    lambda data: Signature.encrypt(data, "secret"),
+])
+def test_tampering_and_wrong_key(encrypt):
+    token = bytearray(encrypt(b"payload"))
+    with pytest.raises(ValueError, match="HMAC"):
+        SignatureSession("other").decrypt(bytes(token))
+    token[-40] ^= 1
+    with pytest.raises(ValueError, match="HMAC"):
+        SignatureSession("secret").decrypt(bytes(token))
+
+
+def test_invalid_format():
+    with pytest.raises(ValueError, match="格式无效"):
+        SignatureSession("secret").decrypt(b"XYZ" + b"\x00" * 80)
+    with pytest.raises(ValueError, match="格式无效"):
+        SignatureSession("secret").decrypt(b"ENS" + b"\x00" * 10)
+
+
+@pytest.mark.parametrize("multiplex", [False, True])
+def test_transport_encryption(serve, multiplex):
+    seen = []
+    address, _ = serve(lambda data: seen.append(data) or data.upper(), sig_key="secret")
+    with Client(address, multiplex=multiplex, sig_key="secret") as client:
+        assert client.call(b"plain").result(5) == b"PLAIN"
+    # 处理函数收发的是明文
+    assert seen == [b"plain"]
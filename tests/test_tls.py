@@ -0,0 +1,72 @@
+import asyncio
+import os
+import pytest
+from muxp import AsyncClient, Client
+from muxp.comm import _tls
+from muxp.comm._tls import ssl_client_context, ssl_server_context
+
+
+@pytest.fixture
+def tls_server(serve, certs):
+    server_auth, client_auth = certs
+    _tls._sessions.clear()
+    address, srv = serve(lambda data: data, auth=server_auth)
+    return ("localhost", address[1]), client_auth
+
+
+def test_contexts_are_shared(certs):
+    server_auth, client_auth = certs
+    assert ssl_client_context(client_auth) is ssl_client_context(client_auth)
+    assert ssl_server_context(server_auth) is ssl_server_context(server_auth)
+    assert ssl_client_context(client_auth) is not ssl_client_context(None)
+
+
+def test_context_reloads_rotated_certificate(certs):
+    _, client_auth = certs
+    context = ssl_client_context(client_auth)
+    stat = os.stat(client_auth.certfile)
+    os.utime(client_auth.certfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert ssl_client_context(client_auth) is not context
+
+
+def test_sync_client_resumes_session(tls_server):
+    address, client_auth = tls_server
+    with Client(address, auth=client_auth) as first:
+        first.send(b"a")
+        assert first.recv() == b"a"
+    # 关闭前已保存会话, 同一进程内的新客户端恢复它
+    with Client(address, auth=client_auth) as second:
+        second.send(b"b")
+        assert second.recv() == b"b"
+        counters = second.stats()["counters"]
+        assert counters["tls_handshakes"] == 1 and counters["tls_resumed"] == 1
+        assert second.stats()["gauges"]["tls_resumption_rate"] == 1.0
+
+
+def test_resume_disabled(tls_server):
+    address, client_auth = tls_server
+    with Client(address, auth=client_auth) as first:
+        first.send(b"a")
+        assert first.recv() == b"a"
+    with Client(address, auth=client_auth, tls_resume=False) as second:
+        assert "tls_resumed" not in second.stats()["counters"]
+
+
+def test_async_client_resumes_session(tls_server):
+    address, client_auth = tls_server
+
+    async def main():
+        counters = []
+        for _ in range(2):
+            client = AsyncClient(address, auth=client_auth, multiplex=True)
+            await client.connect()
+            try:
+                assert await client.call(b"x") == b"x"
+            finally:
+                await client.close()
+            counters.append(client.stats()["counters"])
+        return counters
+
+    first, second = asyncio.run(main())
+    assert "tls_resumed" not in first
+    assert second["tls_resumed"] == 1